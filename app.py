@@ -1,38 +1,101 @@
 import streamlit as st
 import pandas as pd
 from sqlalchemy import create_engine, text
-from io import BytesIO
 import os
+import time
 import plotly.express as px
 
 # Importa as funções de processamento de upload e as novas funções de gerenciamento de usuários
 # e GeoJSON do arquivo uploads.py
 from uploads import (
-    normalizar_especialidade,
-    process_siresp_upload,
-    process_contratos_upload,
-    process_cdr_upload,
     create_user_table, # Nova importação
     add_user,          # Nova importação
     get_users,         # Nova importação
     update_user_password, # Nova importação
     delete_user,       # Nova importação
     authenticate,      # Nova importação
-    load_geojson,      # Nova importação
+    backfill_cdr_municipios, # Código IBGE na tabela 'cdr' gravada antes da coluna existir
+    backfill_producao, producao_precisa_migracao, # Migração da tabela 'producao' de versões anteriores
+    create_ingest_log_table, # Registro dos arquivos ingeridos (hash, período, linhas e tempos)
+    historico_ingestoes,
     engine             # Importa o objeto engine que agora é criado em uploads.py
 )
+from banco import obter_engine_leitura # Engine somente leitura (WAL) das páginas de consulta
+from dados import create_versao_table, obter_versao # Controle de versão dos dados para invalidar os caches
+from consultas import consultar_producao, opcoes_filtros_producao # Filtros e somas feitos no SQLite
+from consultas import consultar_custos # Custos mensais já cruzados com a produção
+from consultas import consultar_tendencias # Séries de absenteísmo pré-calculadas (médias móveis, variação anual, base sazonal)
+from consultas import DIMENSOES_CDR, cdr_por_municipio, pacientes_cdr # Agregações de CDR por município
+from mapa import ARQUIVO_GEOJSON, create_municipios_table, geojson_municipios # GeoJSON reduzido e códigos IBGE dos municípios
+from cubo import create_cubo_tables # Tabelas de resumo lidas pelas páginas
+from catalogo import create_catalogo_tables # Catálogo das dimensões usado pelos filtros da barra lateral
+from custos import create_custos_table # Custos mensais por Centro de Custo (contratos × Realizados)
+from tarefas import enviar_tarefa, acompanhar_tarefa, tabela_tarefas # Fila de ingestão em segundo plano
+from exportacao import botao_exportacao # Exportação gerada sob demanda e em cache
+from graficos import figura_em_cache, obter_cache_graficos # Gráficos Plotly em cache por página, filtros e versão dos dados
+from metricas import adicionar_kpis, formatar_percentual, formatar_moeda # Indicadores vetorizados (absenteísmo, ocupação, realização)
+from especialidades import create_regras_table, carregar_regras, salvar_regra, excluir_regra # Regras de normalização
+from instrumentacao import (INSTRUMENTACAO_ATIVA, definir_pagina, medir, registrar_medicao, medicoes,
+                            resumo_medicoes, exportar_medicoes, limpar_medicoes) # Tempos das etapas (PRODUCAO_INSTRUMENTACAO=1)
 
 # --- Configuração do Banco de Dados SQLite ---
-# O engine agora é importado de uploads.py
-# engine = create_engine('sqlite:///producao.db') # Removido daqui
-
-# Lista de meses para ordenação correta
-meses_ordem = ['janeiro', 'fevereiro', 'março', 'abril', 'maio', 'junho',
-               'julho', 'agosto', 'setembro', 'outubro', 'novembro', 'dezembro']
+# O engine de escrita é importado de uploads.py (ver banco.py); as páginas de consulta usam
+# conexões somente leitura, que continuam respondendo enquanto um upload grava no banco.
+engine_leitura = obter_engine_leitura()
+
+# --- Séries da Página Absenteísmo ---
+# Rótulo da série no seletor -> coluna de producao_tendencias
+SERIES_ABSENTEISMO = {
+    "Mensal": 'Absenteismo',
+    "Média móvel de 3 meses": 'Absenteismo_Media_3m',
+    "Média móvel de 12 meses": 'Absenteismo_Media_12m',
+    "Variação em relação ao ano anterior": 'Absenteismo_Variacao_Anual',
+    "Base sazonal (mesmo mês, todos os anos)": 'Absenteismo_Base_Sazonal'
+}
+# Nome das colunas de indicadores na tabela e na exportação
+COLUNAS_EXIBICAO_ABSENTEISMO = {
+    'Absenteismo': 'Absenteísmo',
+    'Absenteismo_Media_3m': 'Média 3 meses',
+    'Absenteismo_Media_12m': 'Média 12 meses',
+    'Absenteismo_Variacao_Anual': 'Variação anual',
+    'Absenteismo_Base_Sazonal': 'Base sazonal'
+}
+
+@st.cache_resource(show_spinner=False)
+def preparar_producao_existente():
+    """
+    Migra uma vez por processo do servidor a tabela 'producao' gravada por versões anteriores
+    (a mesma migração de migrar_producao.py), apenas quando ela precisa. Retorna a mensagem de
+    erro se a migração falhar, ou None.
+    """
+    try:
+        if producao_precisa_migracao(engine):
+            backfill_producao(engine)
+    except Exception as e:
+        return str(e)
+    return None
+
+@st.cache_resource(show_spinner=False)
+def preparar_municipios():
+    """
+    Popula a tabela 'municipios' e preenche o código IBGE da tabela 'cdr' antiga uma vez por
+    processo do servidor (e não a cada renderização). Retorna (municípios do CDR não encontrados,
+    mensagem de erro ou None). Um erro (ex: GeoJSON ausente) não impede o app de abrir: apenas o
+    mapa do CDR fica indisponível.
+    """
+    try:
+        create_municipios_table(engine)
+        return backfill_cdr_municipios(engine), None
+    except Exception as e:
+        return [], str(e)
 
 # --- Configuração da página ---
 st.set_page_config(page_title="Produção Médica AME", layout="wide")
 
+# Início da medição da execução completa do script (ver instrumentacao.py)
+inicio_execucao = time.perf_counter()
+definir_pagina("Login")
+
 # --- Lógica da Página de Login ---
 # Inicializa o estado de autenticação se ainda não estiver definido
 if 'authenticated' not in st.session_state:
@@ -43,6 +106,14 @@ if 'username' not in st.session_state:
 # Garante que a tabela de usuários e o admin padrão existam ao iniciar o aplicativo
 # Esta chamada é feita uma vez no início do script para configurar o banco de dados
 create_user_table(engine)
+create_versao_table(engine)
+create_regras_table(engine)
+create_cubo_tables(engine)
+create_catalogo_tables(engine)
+create_custos_table(engine)
+create_ingest_log_table(engine)
+erro_migracao = preparar_producao_existente()
+municipios_nao_encontrados, erro_municipios = preparar_municipios()
 
 # Se o usuário não estiver autenticado, exibe a página de login
 if not st.session_state.authenticated:
@@ -76,7 +147,18 @@ else:
     pages = ["Performance", "Dados Gerais", "Uploads", "Absenteísmo", "Custos Médicos", "CDR"]
     if st.session_state.username == 'admin':
         pages.append("Admin")
+        pages.append("Desempenho")
     pagina = st.sidebar.radio("Escolha a opção:", pages)
+    definir_pagina(pagina)
+
+    # Avisos da preparação do banco ao iniciar o servidor (apenas para o admin)
+    if st.session_state.username == 'admin' and erro_migracao:
+        st.warning(f"A migração automática da tabela de produção falhou: {erro_migracao}. "
+                   "Execute 'python migrar_producao.py' no servidor para que as páginas exibam os dados.")
+    if st.session_state.username == 'admin' and erro_municipios:
+        st.warning(f"Municípios do CDR indisponíveis: {erro_municipios}. O mapa da página CDR não será exibido.")
+    if st.session_state.username == 'admin' and municipios_nao_encontrados:
+        st.info(f"Municípios do CDR não encontrados no GeoJSON (fora do mapa): {', '.join(municipios_nao_encontrados)}")
 
     # Botão de Sair na barra lateral
     st.sidebar.markdown("---")
@@ -88,13 +170,24 @@ else:
     # Página: UPLOADS
     if pagina == "Uploads":
         st.header("⬆️ Upload de Arquivos")
+        st.caption("Os arquivos são processados em segundo plano: é possível navegar pelas outras páginas enquanto isso.")
+
+        # Cada arquivo selecionado é enviado à fila uma única vez (o id do upload fica na sessão);
+        # as renderizações seguintes só acompanham a tarefa
+        if 'tarefas_upload' not in st.session_state:
+            st.session_state.tarefas_upload = {}
+
+        def enviar_upload(tipo, arquivo):
+            if arquivo.file_id not in st.session_state.tarefas_upload:
+                st.session_state.tarefas_upload[arquivo.file_id] = enviar_tarefa(tipo, arquivo, engine).id
+            acompanhar_tarefa(st.session_state.tarefas_upload[arquivo.file_id])
 
         st.subheader("Upload de Dados de Produção (SIRESP)")
         uploaded_file_producao = st.file_uploader("Selecione o arquivo de produção (Excel: .xlsx, .xls; CSV: .csv)", type=["xlsx", "xls", "csv"], key="upload_producao")
 
         if uploaded_file_producao:
-            # Chama a função do uploads.py para processar o arquivo
-            process_siresp_upload(uploaded_file_producao, engine)
+            # Envia o arquivo para a fila de ingestão (ver tarefas.py e uploads.py)
+            enviar_upload('siresp', uploaded_file_producao)
 
         st.markdown("---") # Separador para os uploads
 
@@ -102,8 +195,7 @@ else:
         uploaded_file_contratos = st.file_uploader("Selecione o arquivo Excel de contratos", type=["xlsx"], key="upload_contratos")
 
         if uploaded_file_contratos:
-            # Chama a função do uploads.py para processar o arquivo
-            process_contratos_upload(uploaded_file_contratos, engine)
+            enviar_upload('contratos', uploaded_file_contratos)
 
         st.markdown("---") # Separador para os uploads
 
@@ -111,8 +203,21 @@ else:
         uploaded_file_cdr = st.file_uploader("Selecione o arquivo CSV de CDR", type=["csv"], key="upload_cdr")
 
         if uploaded_file_cdr:
-            # Chama a função do uploads.py para processar o arquivo CDR
-            process_cdr_upload(uploaded_file_cdr, engine)
+            enviar_upload('cdr', uploaded_file_cdr)
+
+        historico = tabela_tarefas()
+        if not historico.empty:
+            with st.expander("📋 Ingestões recentes"):
+                st.dataframe(historico, hide_index=True)
+
+        registro = historico_ingestoes(engine_leitura)
+        if not registro.empty:
+            with st.expander("📒 Registro de ingestões (arquivos já processados e vazão)"):
+                st.dataframe(registro[['registrado_em', 'tipo', 'nome_arquivo', 'periodo', 'linhas_lidas', 'linhas_gravadas',
+                                       'segundos_leitura', 'segundos_gravacao', 'linhas_por_segundo']], hide_index=True)
+                fig_vazao = px.line(registro.sort_values('id'), x='registrado_em', y='linhas_por_segundo', color='tipo',
+                                    markers=True, title="Vazão das ingestões (linhas gravadas por segundo)")
+                st.plotly_chart(fig_vazao, use_container_width=True)
 
     # Página: INSERIR DADOS (Agora vazia, pois o upload foi movido para 'Uploads')
     elif pagina == "Inserir Dados":
@@ -125,59 +230,54 @@ else:
         st.header("📈 Performance das Agendas Médicas por Especialidade")
 
         try:
-            df = pd.read_sql_table('producao', con=engine)
-
-            # Remover códigos numéricos iniciais da especialidade
-            df['Especialidade'] = df['Especialidade'].astype(str).str.replace(r'^\d+\s*', '', regex=True).str.strip()
-
-            # Normalizar nomes com agrupamento genérico
-            df['Especialidade_Normalizada'] = df['Especialidade'].apply(normalizar_especialidade)
-            df['Mes_Producao'] = df['Mes_Producao'].astype(str).str.lower() # Garante minúsculas para comparação
-            df['Mes_Num'] = df['Mes_Producao'].apply(lambda x: meses_ordem.index(x) + 1 if x in meses_ordem else 0)
-
-            # Filtros para a página de Performance
-            anos = sorted(df['Ano_Producao'].unique())
-            meses = sorted(df['Mes_Producao'].unique(), key=lambda x: meses_ordem.index(x.lower()))
-            especialidades = sorted(df['Especialidade_Normalizada'].unique())
+            # Opções dos filtros (valores distintos lidos diretamente do banco)
+            with medir("leitura SQL (opções dos filtros)"):
+                opcoes = opcoes_filtros_producao(engine_leitura)
+            anos = opcoes['anos']
+            meses = opcoes['meses'] # {número do mês: nome do mês}
+            especialidades = opcoes['especialidades']
 
             st.sidebar.subheader("🔎 Filtros de Performance")
             ano_filtro = st.sidebar.multiselect("Ano", anos, default=anos, key="perf_ano")
-            mes_filtro = st.sidebar.multiselect("Mês", meses, default=meses, key="perf_mes")
+            mes_filtro = st.sidebar.multiselect("Mês", list(meses), default=list(meses), format_func=meses.get, key="perf_mes")
             especialidade_filtro = st.sidebar.multiselect("Especialidade", especialidades, default=especialidades, key="perf_especialidade")
 
-            # Aplicar filtros
-            df_filtro = df[
-                (df['Ano_Producao'].isin(ano_filtro)) &
-                (df['Mes_Producao'].isin(mes_filtro)) &
-                (df['Especialidade_Normalizada'].isin(especialidade_filtro))
-            ]
+            # Filtrar e somar Oferta, Agendados e Realizados por especialidade normalizada no SQLite
+            with medir("leitura SQL (consulta agregada)"):
+                df_agrupado = consultar_producao(engine_leitura, ['Especialidade_Normalizada'],
+                                                 anos=ano_filtro, meses=mes_filtro, especialidades=especialidade_filtro)
 
-            if df_filtro.empty:
+            if df_agrupado.empty:
                 st.warning("Nenhum dado encontrado para os filtros selecionados.")
             else:
-                # Agrupar por especialidade normalizada e somar Oferta, Agendados e Realizados
-                df_agrupado = df_filtro.groupby('Especialidade_Normalizada').agg({
-                    'Oferta': 'sum',
-                    'Agendados': 'sum',
-                    'Realizados': 'sum'
-                }).reset_index()
-
-                # Criar o gráfico de barras
-                fig = px.bar(
-                    df_agrupado,
-                    x='Especialidade_Normalizada',
-                    y='Realizados',
-                    title='Total de Atendimentos Realizados por Especialidade',
-                    labels={'Especialidade_Normalizada': 'Especialidade', 'Realizados': 'Atendimentos Realizados'},
-                    color='Realizados' # Opcional: colore as barras com base no valor de Realizados
-                )
-                fig.update_xaxes(tickangle=45) # Inclina os rótulos do eixo X para melhor legibilidade
-                fig.update_yaxes(rangemode="tozero") # Começa o eixo Y em zero
+                # Criar o gráfico de barras (ou reaproveitá-lo do cache para os mesmos filtros e dados)
+                def grafico_performance():
+                    fig = px.bar(
+                        df_agrupado,
+                        x='Especialidade_Normalizada',
+                        y='Realizados',
+                        title='Total de Atendimentos Realizados por Especialidade',
+                        labels={'Especialidade_Normalizada': 'Especialidade', 'Realizados': 'Atendimentos Realizados'},
+                        color='Realizados' # Opcional: colore as barras com base no valor de Realizados
+                    )
+                    fig.update_xaxes(tickangle=45) # Inclina os rótulos do eixo X para melhor legibilidade
+                    fig.update_yaxes(rangemode="tozero") # Começa o eixo Y em zero
+                    return fig
+
+                with medir("gráfico Plotly (montagem)"):
+                    fig = figura_em_cache("performance",
+                                          {"ano": ano_filtro, "mes": mes_filtro, "especialidade": especialidade_filtro},
+                                          obter_versao(engine_leitura, 'producao'), grafico_performance)
 
-                st.plotly_chart(fig, use_container_width=True)
+                with medir("gráfico Plotly (serialização)"):
+                    st.plotly_chart(fig, use_container_width=True)
 
                 st.subheader("Dados Detalhados de Performance")
-                st.dataframe(df_agrupado.rename(columns={'Especialidade_Normalizada': 'Especialidade'}), use_container_width=True)
+                with medir("indicadores"):
+                    df_display_perf = adicionar_kpis(df_agrupado.rename(columns={'Especialidade_Normalizada': 'Especialidade'}))
+                    for kpi in ['Absenteísmo', 'Ocupação', 'Taxa de Realização']:
+                        df_display_perf[kpi] = formatar_percentual(df_display_perf[kpi])
+                st.dataframe(df_display_perf, use_container_width=True)
 
         except Exception as e:
             st.error(f"Erro ao carregar dados de performance: {e}")
@@ -186,71 +286,48 @@ else:
         st.header("📋 Dados Gerais Consolidados")
 
         try:
-            df = pd.read_sql_table('producao', con=engine)
-
-            # Remover códigos numéricos iniciais da especialidade
-            df['Especialidade'] = df['Especialidade'].astype(str).str.replace(r'^\d+\s*', '', regex=True).str.strip()
-
-            # Normalizar nomes com agrupamento genérico
-            df['Especialidade_Normalizada'] = df['Especialidade'].apply(normalizar_especialidade)
-            df['Mes_Producao'] = df['Mes_Producao'].astype(str).str.lower() # Garante minúsculas para comparação
-
-            # Filtros
-            anos = sorted(df['Ano_Producao'].unique())
-            meses = sorted(df['Mes_Producao'].unique(), key=lambda x: meses_ordem.index(x.lower()))
+            # Opções dos filtros (valores distintos lidos diretamente do banco)
+            with medir("leitura SQL (opções dos filtros)"):
+                opcoes = opcoes_filtros_producao(engine_leitura)
+            anos = opcoes['anos']
+            meses = opcoes['meses'] # {número do mês: nome do mês}
 
             st.sidebar.subheader("🔎 Filtros Gerais")
             ano_filtro = st.sidebar.multiselect("Ano", anos, default=anos, key="geral_ano")
-            mes_filtro = st.sidebar.multiselect("Mês", meses, default=meses, key="geral_mes")
+            mes_filtro = st.sidebar.multiselect("Mês", list(meses), default=list(meses), format_func=meses.get, key="geral_mes")
 
-            # Aplicar filtros
-            df_filtro = df[
-                (df['Ano_Producao'].isin(ano_filtro)) &
-                (df['Mes_Producao'].isin(mes_filtro))
-            ]
+            # Filtrar e agrupar dados por Especialidade consolidada, Ano e Mês no SQLite
+            with medir("leitura SQL (consulta agregada)"):
+                df_grouped = consultar_producao(engine_leitura, ['Especialidade_Normalizada', 'Ano_Num', 'Mes_Num', 'Mes_Producao'],
+                                                anos=ano_filtro, meses=mes_filtro)
 
-            if df_filtro.empty:
+            if df_grouped.empty:
                 st.warning("Nenhum dado disponível para os filtros selecionados.")
             else:
-                # Agrupar dados por Especialidade consolidada
                 df_grouped = (
-                    df_filtro
-                    .groupby(['Especialidade_Normalizada', 'Ano_Producao', 'Mes_Producao'])
-                    .agg({
-                        'Oferta': 'sum',
-                        'Agendados': 'sum',
-                        'Realizados': 'sum'
-                    })
-                    .reset_index()
+                    df_grouped
+                    .drop(columns='Mes_Num')
                     .rename(columns={
                         'Especialidade_Normalizada': 'Especialidade',
-                        'Ano_Producao': 'Ano',
+                        'Ano_Num': 'Ano',
                         'Mes_Producao': 'Mês'
                     })
                 )
 
-                # Calcular Absenteísmo com tratamento de divisão por zero
-                df_grouped['Absenteísmo'] = df_grouped.apply(
-                    lambda row: 1 - (row['Realizados'] / row['Agendados']) if row['Agendados'] and row['Agendados'] > 0 else 0,
-                    axis=1
-                )
-
-                df_grouped['Absenteísmo (%)'] = (df_grouped['Absenteísmo'] * 100).round(2).astype(str).str.replace('.', ',', regex=False) + '%'
+                # Calcular Absenteísmo, Ocupação e Taxa de Realização (frações, com tratamento de divisão por zero)
+                kpis = ['Absenteísmo', 'Ocupação', 'Taxa de Realização']
+                with medir("indicadores"):
+                    df_grouped = adicionar_kpis(df_grouped)
 
-                st.dataframe(df_grouped, use_container_width=True)
+                    # Prepara os dados para exibição em tabela Streamlit (com formatação de vírgula)
+                    df_display_geral = df_grouped.copy()
+                    for kpi in kpis:
+                        df_display_geral[f'{kpi} (%)'] = formatar_percentual(df_display_geral.pop(kpi))
+                st.dataframe(df_display_geral, use_container_width=True)
 
-                # Exportar como Excel
-                output = BytesIO()
-                with pd.ExcelWriter(output, engine='xlsxwriter') as writer:
-                    df_grouped.to_excel(writer, index=False, sheet_name='Dados')
-                processed_data = output.getvalue()
-
-                st.download_button(
-                    label="📥 Baixar como Excel",
-                    data=processed_data,
-                    file_name="dados_consolidados.xlsx",
-                    mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-                )
+                # Exportar (Excel, CSV ou Parquet), gerado apenas no clique e mantendo os indicadores como fração
+                botao_exportacao(df_grouped, "dados_gerais", {"ano": ano_filtro, "mes": mes_filtro},
+                                 obter_versao(engine_leitura, 'producao'), "dados_consolidados", colunas_percentual=kpis)
 
         except Exception as e:
             st.error(f"❌ Erro ao carregar os dados: {e}")
@@ -260,118 +337,87 @@ else:
         st.header("📉 Taxa de Absenteísmo por Especialidade")
 
         try:
-            df = pd.read_sql_table('producao', con=engine)
-
-            # Remover códigos numéricos iniciais da especialidade
-            df['Especialidade'] = df['Especialidade'].astype(str).str.replace(r'^\d+\s*', '', regex=True).str.strip()
-
-            # Normalizar nomes com agrupamento genérico
-            df['Especialidade_Normalizada'] = df['Especialidade'].apply(normalizar_especialidade)
-            df['Mes_Producao'] = df['Mes_Producao'].astype(str).str.lower()
-            df['Mes_Num'] = df['Mes_Producao'].apply(lambda x: meses_ordem.index(x) + 1 if x in meses_ordem else 0)
-
-            # Filtros para a página de Absenteísmo
-            anos = sorted(df['Ano_Producao'].unique())
-            meses = sorted(df['Mes_Producao'].unique(), key=lambda x: meses_ordem.index(x.lower()))
-            especialidades = sorted(df['Especialidade_Normalizada'].unique())
+            # Opções dos filtros (valores distintos lidos diretamente do banco)
+            with medir("leitura SQL (opções dos filtros)"):
+                opcoes = opcoes_filtros_producao(engine_leitura)
+            anos = opcoes['anos']
+            meses = opcoes['meses'] # {número do mês: nome do mês}
+            especialidades = opcoes['especialidades']
 
             st.sidebar.subheader("🔎 Filtros de Absenteísmo")
             ano_filtro_abs = st.sidebar.multiselect("Ano", anos, default=anos, key="abs_ano")
-            mes_filtro_abs = st.sidebar.multiselect("Mês", meses, default=meses, key="abs_mes")
+            mes_filtro_abs = st.sidebar.multiselect("Mês", list(meses), default=list(meses), format_func=meses.get, key="abs_mes")
             especialidade_filtro_abs = st.sidebar.multiselect("Especialidade", especialidades, default=especialidades, key="abs_especialidade")
 
-            # Aplicar filtros
-            df_filtro = df[
-                (df['Ano_Producao'].isin(ano_filtro_abs)) &
-                (df['Mes_Producao'].isin(mes_filtro_abs)) &
-                (df['Especialidade_Normalizada'].isin(especialidade_filtro_abs))
-            ]
+            # Séries mensais já calculadas na ingestão (médias móveis, variação anual e base sazonal)
+            with medir("leitura SQL (tendências)"):
+                df_grouped_abs = consultar_tendencias(engine_leitura, anos=ano_filtro_abs, meses=mes_filtro_abs,
+                                                      especialidades=especialidade_filtro_abs)
 
-            if df_filtro.empty:
+            if df_grouped_abs.empty:
                 st.warning("Nenhum dado encontrado para os filtros selecionados.")
             else:
-                # Agrupar por período e especialidade normalizada
-                df_grouped_abs = (
-                    df_filtro
-                    .groupby(['Ano_Producao', 'Mes_Producao', 'Mes_Num', 'Especialidade_Normalizada'])
-                    .agg({
-                        'Agendados': 'sum',
-                        'Realizados': 'sum'
-                    })
-                    .reset_index()
-                )
+                serie_abs = st.selectbox("Série exibida", list(SERIES_ABSENTEISMO), key="abs_serie")
+                coluna_serie = SERIES_ABSENTEISMO[serie_abs]
+
+                # Criar o gráfico de linha (ou reaproveitá-lo do cache para os mesmos filtros, série e dados)
+                def grafico_absenteismo():
+                    # Valor percentual e eixo de datas (início de cada mês do PeriodIndex) usados apenas no gráfico
+                    df_grafico = df_grouped_abs.assign(
+                        Absenteísmo_Percentual=(df_grouped_abs[coluna_serie] * 100).round(2),
+                        Periodo=df_grouped_abs['Periodo'].dt.to_timestamp()
+                    ).dropna(subset=['Absenteísmo_Percentual'])
+
+                    rotulo = 'Variação anual (p.p.)' if coluna_serie == 'Absenteismo_Variacao_Anual' else 'Absenteísmo (%)'
+                    fig_abs = px.line(
+                        df_grafico,
+                        x='Periodo',
+                        y='Absenteísmo_Percentual',
+                        color='Especialidade_Normalizada',
+                        title=f'Taxa de Absenteísmo por Especialidade ({serie_abs})',
+                        markers=True,
+                        labels={'Absenteísmo_Percentual': rotulo, 'Periodo': 'Período (Mês/Ano)', 'Especialidade_Normalizada': 'Especialidade'},
+                        hover_data={'Absenteísmo_Percentual': ':.2f', 'Periodo': '|%m/%Y', 'Especialidade_Normalizada': True} # Formata tooltip
+                    )
 
-                # Calcular Absenteísmo
-                df_grouped_abs['Absenteísmo'] = df_grouped_abs.apply(
-                    lambda row: (1 - (row['Realizados'] / row['Agendados'])) * 100
-                    if row['Agendados'] and row['Agendados'] > 0 else 0,
-                    axis=1
-                )
-                df_grouped_abs['Absenteísmo'] = df_grouped_abs['Absenteísmo'].round(2)
-
-                # Criar coluna de período para o eixo X e ordenar
-                df_grouped_abs['Periodo'] = df_grouped_abs['Mes_Num'].astype(str).str.zfill(2) + '/' + df_grouped_abs['Ano_Producao'].astype(str)
-                df_grouped_abs = df_grouped_abs.sort_values(by=['Ano_Producao', 'Mes_Num'])
-
-                # Criar o gráfico de linha
-                fig_abs = px.line(
-                    df_grouped_abs,
-                    x='Periodo',
-                    y='Absenteísmo',
-                    color='Especialidade_Normalizada',
-                    title='Taxa de Absenteísmo por Especialidade',
-                    markers=True,
-                    labels={'Absenteísmo': 'Absenteísmo (%)', 'Periodo': 'Período (Mês/Ano)', 'Especialidade_Normalizada': 'Especialidade'},
-                    hover_data={'Absenteísmo': ':.2f%', 'Periodo': True, 'Especialidade_Normalizada': True} # Formata tooltip
-                )
+                    fig_abs.update_layout(
+                        hovermode="x unified" # Melhora a interação do hover
+                    )
+                    if coluna_serie != 'Absenteismo_Variacao_Anual': # A variação anual pode ser negativa
+                        fig_abs.update_yaxes(rangemode="tozero") # Começa o eixo Y em zero
+                    fig_abs.update_xaxes(tickformat="%m/%Y", dtick="M1", tickangle=45) # Um rótulo por mês, inclinado
+                    return fig_abs
 
-                fig_abs.update_layout(
-                    hovermode="x unified" # Melhora a interação do hover
-                )
-                fig_abs.update_yaxes(rangemode="tozero") # Começa o eixo Y em zero
-                fig_abs.update_xaxes(tickangle=45) # Inclina os rótulos do eixo X para melhor legibilidade
+                with medir("gráfico Plotly (montagem)"):
+                    fig_abs = figura_em_cache("absenteismo",
+                                              {"ano": ano_filtro_abs, "mes": mes_filtro_abs, "especialidade": especialidade_filtro_abs,
+                                               "serie": coluna_serie},
+                                              obter_versao(engine_leitura, 'producao'), grafico_absenteismo)
 
-                st.plotly_chart(fig_abs, use_container_width=True)
+                with medir("gráfico Plotly (serialização)"):
+                    st.plotly_chart(fig_abs, use_container_width=True)
 
                 st.subheader("Dados Detalhados de Absenteísmo")
-                # Prepara os dados para exibição em tabela Streamlit (com formatação de vírgula)
-                df_display_for_st = df_grouped_abs.copy()
-                df_display_for_st['Absenteísmo (%)'] = df_display_for_st['Absenteísmo'].astype(str).str.replace('.', ',', regex=False) + '%'
-                st.dataframe(df_display_for_st[['Ano_Producao', 'Mes_Producao', 'Especialidade_Normalizada', 'Agendados', 'Realizados', 'Absenteísmo (%)']], use_container_width=True)
-
-                # Exportar como Excel
-                output = BytesIO()
-                with pd.ExcelWriter(output, engine='xlsxwriter') as writer:
-                    # Seleciona as colunas desejadas para exportação, usando o valor numérico de 'Absenteísmo'
-                    df_to_export = df_grouped_abs[['Ano_Producao', 'Mes_Producao', 'Especialidade_Normalizada', 'Agendados', 'Realizados', 'Absenteísmo']].copy()
-
-                    # Garante que 'Ano_Producao' seja do tipo inteiro
-                    df_to_export['Ano_Producao'] = df_to_export['Ano_Producao'].astype(int)
-
-                    df_to_export.to_excel(writer, index=False, sheet_name='Dados')
-
-                    # Acessa o workbook e o worksheet para aplicar a formatação numérica
-                    workbook = writer.book
-                    worksheet = writer.sheets['Dados']
-
-                    # Cria um formato de porcentagem (Excel usará a localidade para ponto/vírgula)
-                    percent_format = workbook.add_format({'num_format': '0.00%', 'align': 'center'})
-
-                    # Encontra o índice da coluna 'Absenteísmo' no DataFrame que será exportado
-                    absenteismo_col_idx = df_to_export.columns.get_loc('Absenteísmo')
-
-                    # Aplica o formato à coluna de Absenteísmo no Excel
-                    worksheet.set_column(absenteismo_col_idx, absenteismo_col_idx, None, percent_format)
-
-                processed_data = output.getvalue()
-
-                st.download_button(
-                    label="📥 Baixar como Excel",
-                    data=processed_data,
-                    file_name="dados_consolidados_absenteismo.xlsx",
-                    mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-                )
+                # Ano e nome do mês para exibição e exportação; os indicadores continuam como frações
+                df_tabela_abs = df_grouped_abs.assign(Ano_Producao=df_grouped_abs['Ano_Num'],
+                                                      Mes_Producao=df_grouped_abs['Mes_Num'].map(meses))
+                df_tabela_abs = df_tabela_abs.rename(columns=COLUNAS_EXIBICAO_ABSENTEISMO)
+                colunas_tabela = ['Ano_Producao', 'Mes_Producao', 'Especialidade_Normalizada', 'Agendados', 'Realizados'] + \
+                                 list(COLUNAS_EXIBICAO_ABSENTEISMO.values())
 
+                # Prepara os dados para exibição em tabela Streamlit (com formatação de vírgula)
+                df_display_for_st = df_tabela_abs[colunas_tabela].copy()
+                for coluna in COLUNAS_EXIBICAO_ABSENTEISMO.values():
+                    df_display_for_st[coluna] = formatar_percentual(df_display_for_st[coluna]).where(df_display_for_st[coluna].notna(), "")
+                df_display_for_st = df_display_for_st.rename(columns={coluna: f"{coluna} (%)" for coluna in COLUNAS_EXIBICAO_ABSENTEISMO.values()})
+                st.dataframe(df_display_for_st, use_container_width=True)
+
+                # Exportar usando os valores numéricos (frações); o arquivo só é gerado no clique
+                df_to_export = df_tabela_abs[colunas_tabela]
+                botao_exportacao(df_to_export, "absenteismo",
+                                 {"ano": ano_filtro_abs, "mes": mes_filtro_abs, "especialidade": especialidade_filtro_abs},
+                                 obter_versao(engine_leitura, 'producao'), "dados_consolidados_absenteismo",
+                                 colunas_percentual=list(COLUNAS_EXIBICAO_ABSENTEISMO.values()))
 
         except Exception as e:
             st.error(f"❌ Erro ao carregar dados de absenteísmo: {e}")
@@ -382,7 +428,8 @@ else:
 
         try:
             # Tenta ler os dados da tabela de contratos
-            df_contratos = pd.read_sql_table('contratos', con=engine)
+            with medir("leitura SQL (contratos)"):
+                df_contratos = pd.read_sql_table('contratos', con=engine_leitura)
 
             if df_contratos.empty:
                 st.warning("Nenhum dado de contrato encontrado. Por favor, faça o upload dos dados na página 'Uploads'.")
@@ -392,9 +439,100 @@ else:
                 # Exibir um dataframe com os dados dos contratos
                 st.dataframe(df_contratos, use_container_width=True)
 
-                # Você pode adicionar filtros e gráficos para analisar os custos aqui
-                st.subheader("Análise de Custos (Em Desenvolvimento)")
-                st.info("Funcionalidades adicionais para análise de custos serão implementadas aqui.")
+                st.subheader("Análise de Custos por Centro de Custo")
+                # Contratos já cruzados com os Realizados mensais da especialidade (ver custos.py)
+                with medir("leitura SQL (custos mensais)"):
+                    df_custos = consultar_custos(engine_leitura)
+
+                if df_custos.empty:
+                    st.info("Nenhum contrato pôde ser cruzado com a produção. Verifique se as especialidades dos contratos "
+                            "correspondem às especialidades normalizadas do SIRESP e se há produção a partir da Data Contrato.")
+                else:
+                    df_custos = df_custos.assign(Centro=df_custos['Centro de Custo'].astype(str) + " - " + df_custos['Nome do Centro de Custo'].fillna(''))
+                    anos_custos = sorted(df_custos['Ano_Num'].unique().tolist())
+                    centros = sorted(df_custos['Centro'].unique().tolist())
+
+                    st.sidebar.subheader("🔎 Filtros de Custos")
+                    ano_filtro_custos = st.sidebar.multiselect("Ano", anos_custos, default=anos_custos, key="custos_ano")
+                    centro_filtro_custos = st.sidebar.multiselect("Centro de Custo", centros, default=centros, key="custos_centro")
+
+                    # Consolida as especialidades de cada Centro de Custo no mês e recalcula os indicadores sobre as somas
+                    df_filtrado_custos = df_custos[df_custos['Ano_Num'].isin(ano_filtro_custos) & df_custos['Centro'].isin(centro_filtro_custos)]
+                    df_mensal_custos = df_filtrado_custos.groupby(['Centro', 'Ano_Num', 'Mes_Num'], as_index=False)[
+                        ['Contratos', 'Meta_Mensal', 'Realizados', 'Custo_Mensal']].sum(min_count=1)
+                    realizados_custos = df_mensal_custos['Realizados'].astype(float)
+                    df_mensal_custos['Custo_Por_Procedimento'] = (df_mensal_custos['Custo_Mensal'] / realizados_custos).where(realizados_custos > 0)
+                    df_mensal_custos['Atingimento_Meta'] = (realizados_custos / df_mensal_custos['Meta_Mensal']).where(df_mensal_custos['Meta_Mensal'] > 0)
+
+                    if df_mensal_custos.empty:
+                        st.warning("Nenhum dado encontrado para os filtros selecionados.")
+                    else:
+                        filtros_custos = {"ano": ano_filtro_custos, "centro": centro_filtro_custos}
+                        versao_custos = obter_versao(engine_leitura, 'custos_mensais')
+
+                        def grafico_custos():
+                            df_grafico = df_mensal_custos.assign(
+                                Periodo=pd.PeriodIndex.from_fields(year=df_mensal_custos['Ano_Num'], month=df_mensal_custos['Mes_Num'], freq='M').to_timestamp()
+                            )
+                            fig_custos = px.bar(
+                                df_grafico,
+                                x='Periodo',
+                                y='Custo_Mensal',
+                                color='Centro',
+                                title='Custo Mensal por Centro de Custo',
+                                labels={'Custo_Mensal': 'Custo Mensal (R$)', 'Periodo': 'Período (Mês/Ano)', 'Centro': 'Centro de Custo'},
+                                hover_data={'Custo_Por_Procedimento': ':.2f', 'Realizados': True, 'Periodo': '|%m/%Y'}
+                            )
+                            fig_custos.update_xaxes(tickformat="%m/%Y", dtick="M1", tickangle=45)
+                            return fig_custos
+
+                        def grafico_atingimento():
+                            df_grafico = df_mensal_custos.assign(
+                                Atingimento_Percentual=(df_mensal_custos['Atingimento_Meta'] * 100).round(2),
+                                Periodo=pd.PeriodIndex.from_fields(year=df_mensal_custos['Ano_Num'], month=df_mensal_custos['Mes_Num'], freq='M').to_timestamp()
+                            ).dropna(subset=['Atingimento_Percentual'])
+                            if df_grafico.empty:
+                                return None # Nenhum contrato com meta numérica
+                            fig_atingimento = px.line(
+                                df_grafico,
+                                x='Periodo',
+                                y='Atingimento_Percentual',
+                                color='Centro',
+                                title='Atingimento da Meta Mensal (Realizados / Meta)',
+                                markers=True,
+                                labels={'Atingimento_Percentual': 'Atingimento (%)', 'Periodo': 'Período (Mês/Ano)', 'Centro': 'Centro de Custo'}
+                            )
+                            fig_atingimento.add_hline(y=100, line_dash="dash") # Meta
+                            fig_atingimento.update_yaxes(rangemode="tozero")
+                            fig_atingimento.update_xaxes(tickformat="%m/%Y", dtick="M1", tickangle=45)
+                            return fig_atingimento
+
+                        with medir("gráfico Plotly (montagem)"):
+                            fig_custos = figura_em_cache("custos", filtros_custos, versao_custos, grafico_custos)
+                            fig_atingimento = figura_em_cache("custos_atingimento", filtros_custos, versao_custos, grafico_atingimento)
+
+                        with medir("gráfico Plotly (serialização)"):
+                            st.plotly_chart(fig_custos, use_container_width=True)
+                            if fig_atingimento is not None:
+                                st.plotly_chart(fig_atingimento, use_container_width=True)
+
+                        # Tabela: ano, nome do mês e indicadores (custos com vírgula decimal, atingimento em %)
+                        df_tabela_custos = df_mensal_custos.assign(Mes=df_mensal_custos['Mes_Num'].map(opcoes_filtros_producao(engine_leitura)['meses']))
+                        df_tabela_custos = df_tabela_custos.rename(columns={'Centro': 'Centro de Custo', 'Ano_Num': 'Ano', 'Mes': 'Mês',
+                                                                            'Meta_Mensal': 'Meta Mensal', 'Custo_Mensal': 'Custo Mensal',
+                                                                            'Custo_Por_Procedimento': 'Custo por Procedimento',
+                                                                            'Atingimento_Meta': 'Atingimento da Meta'})
+                        colunas_tabela_custos = ['Centro de Custo', 'Ano', 'Mês', 'Contratos', 'Meta Mensal', 'Realizados',
+                                                 'Custo Mensal', 'Custo por Procedimento', 'Atingimento da Meta']
+                        df_display_custos = df_tabela_custos[colunas_tabela_custos].copy()
+                        for coluna in ['Custo Mensal', 'Custo por Procedimento']:
+                            df_display_custos[coluna] = formatar_moeda(df_display_custos[coluna])
+                        df_display_custos['Atingimento da Meta'] = formatar_percentual(df_display_custos['Atingimento da Meta']).where(
+                            df_display_custos['Atingimento da Meta'].notna(), "")
+                        st.dataframe(df_display_custos, use_container_width=True)
+
+                        botao_exportacao(df_tabela_custos[colunas_tabela_custos], "custos", filtros_custos, versao_custos,
+                                         "custos_por_centro_de_custo", colunas_percentual=['Atingimento da Meta'])
 
         except Exception as e:
             st.error(f"❌ Erro ao carregar os dados de contratos: {e}")
@@ -405,22 +543,20 @@ else:
         st.header("🗺️ Mapa de Dados de CDR por Município")
 
         try:
-            df_cdr = pd.read_sql_table('cdr', con=engine)
+            # Contagem de pacientes por município calculada no SQLite (uma linha por município)
+            with medir("leitura SQL (CDR por município)"):
+                df_municipios = cdr_por_municipio(engine_leitura)
 
-            if df_cdr.empty:
+            if df_municipios.empty:
                 st.warning("Nenhum dado de CDR encontrado. Por favor, faça o upload dos dados na página 'Uploads'.")
             else:
-                # Carregar dados GeoJSON para o mapa usando a função cacheada
-                geojson_data = load_geojson("geojs-35-mun.json")
+                # GeoJSON apenas com os municípios presentes nos dados, simplificado e em cache no disco
+                with medir("GeoJSON reduzido"):
+                    geojson_data = geojson_municipios(ARQUIVO_GEOJSON, df_municipios['Codigo_IBGE'].dropna())
 
                 if geojson_data:
-                    # Assumindo que 'Valor' no df_cdr representa a quantidade de pacientes ou uma métrica similar
-                    # Se 'Valor' não for a quantidade de pacientes, você precisará agrupar e contar aqui.
-                    # Exemplo: df_cdr_grouped = df_cdr.groupby('Município').size().reset_index(name='Quantidade_Pacientes')
-                    # E então usar 'Quantidade_Pacientes' no `color` do px.choropleth
-
                     # Obter lista de municípios para o filtro
-                    municipios_disponiveis = sorted(df_cdr['Município'].unique())
+                    municipios_disponiveis = df_municipios['Município'].tolist()
 
                     st.sidebar.subheader("🔎 Filtro de Município (CDR)")
                     # Adicionar um seletor para filtrar por município
@@ -430,33 +566,73 @@ else:
                         key="cdr_municipio_filter"
                     )
 
-                    df_cdr_filtered = df_cdr.copy()
+                    # Detalhamento das contagens por Status, Especialidade ou Prioridade
+                    dimensao_cdr = st.sidebar.selectbox("Detalhar pacientes por:", DIMENSOES_CDR, key="cdr_dimensao")
+                    with medir("leitura SQL (CDR por município)"):
+                        df_detalhe = cdr_por_municipio(engine_leitura, dimensao_cdr)
+                    valor_dimensao = st.sidebar.selectbox(
+                        f"{dimensao_cdr} exibido no mapa:",
+                        ['Todos'] + sorted(df_detalhe[dimensao_cdr].unique()),
+                        key="cdr_valor_dimensao"
+                    )
+
                     if selected_municipio != 'Todos':
-                        df_cdr_filtered = df_cdr_filtered[df_cdr_filtered['Município'] == selected_municipio]
                         st.subheader(f"Dados de CDR para: {selected_municipio}")
+                        with medir("leitura do espelho (pacientes do município)"):
+                            df_pacientes = pacientes_cdr(engine_leitura, selected_municipio)
+                        st.dataframe(df_pacientes, use_container_width=True)
                     else:
-                        st.subheader("Dados de CDR por Município")
-
-                    st.dataframe(df_cdr_filtered, use_container_width=True)
-
-                    # Criar o mapa coroplético
-                    fig_map = px.choropleth(
-                        df_cdr, # Usar o DataFrame completo para o mapa, para mostrar todos os municípios
-                        geojson=geojson_data,
-                        locations='Município', # Coluna no df_cdr que contém os nomes dos municípios
-                        featureidkey="properties.name", # Propriedade no GeoJSON que corresponde aos nomes dos municípios
-                        color='Valor', # Coluna no df_cdr para colorir o mapa (assumindo quantidade de pacientes ou métrica)
-                        color_continuous_scale="Viridis", # Escala de cores
-                        scope="south america", # Define o escopo do mapa (pode ser "brazil" se tiver um GeoJSON do Brasil)
-                        title="Distribuição de Valores por Município (CDR)",
-                        hover_name="Município",
-                        hover_data={"Valor": True}
-                    )
-
-                    fig_map.update_geos(fitbounds="locations", visible=False) # Ajusta o zoom para os municípios presentes
-                    fig_map.update_layout(margin={"r":0,"t":0,"l":0,"b":0}) # Remove margens
-
-                    st.plotly_chart(fig_map, use_container_width=True)
+                        st.subheader(f"Pacientes por Município e {dimensao_cdr}")
+                        with medir("agregação (groupby)"):
+                            df_pivot = (
+                                df_detalhe
+                                .pivot_table(index='Município', columns=dimensao_cdr, values='Pacientes', aggfunc='sum', fill_value=0)
+                                .join(df_municipios.set_index('Município')['Pacientes'])
+                                .sort_values('Pacientes', ascending=False)
+                            )
+                        st.dataframe(df_pivot, use_container_width=True)
+
+                    # Mapa coroplético em cache por dimensão, valor selecionado e versão dos dados do CDR:
+                    # trocar o município da tabela não refaz a agregação nem a figura
+                    def grafico_cdr():
+                        # Dados do mapa: total de pacientes ou apenas os do valor selecionado da dimensão
+                        if valor_dimensao == 'Todos':
+                            df_mapa = df_municipios
+                        else:
+                            df_mapa = df_detalhe[df_detalhe[dimensao_cdr] == valor_dimensao]
+
+                        # Junção com o GeoJSON pelo código IBGE (grafias diferentes do mesmo município somam juntas)
+                        df_mapa = (
+                            df_mapa.dropna(subset=['Codigo_IBGE'])
+                            .groupby('Codigo_IBGE', as_index=False)
+                            .agg(Município=('Município', 'first'), Pacientes=('Pacientes', 'sum'))
+                        )
+                        df_mapa['Codigo_IBGE'] = df_mapa['Codigo_IBGE'].astype(str)
+
+                        # Criar o mapa coroplético
+                        fig_map = px.choropleth(
+                            df_mapa, # Uma linha por município
+                            geojson=geojson_data,
+                            locations='Codigo_IBGE', # Coluna com o código IBGE gravado na ingestão do CDR
+                            featureidkey="properties.id", # Propriedade do GeoJSON com o código IBGE do município
+                            color='Pacientes', # Quantidade de pacientes no município
+                            color_continuous_scale="Viridis", # Escala de cores
+                            scope="south america", # Define o escopo do mapa (pode ser "brazil" se tiver um GeoJSON do Brasil)
+                            title="Distribuição de Pacientes por Município (CDR)",
+                            hover_name="Município",
+                            hover_data={"Pacientes": True}
+                        )
+
+                        fig_map.update_geos(fitbounds="locations", visible=False) # Ajusta o zoom para os municípios presentes
+                        fig_map.update_layout(margin={"r":0,"t":0,"l":0,"b":0}) # Remove margens
+                        return fig_map
+
+                    with medir("gráfico Plotly (agregação e montagem)"):
+                        fig_map = figura_em_cache("cdr", {"dimensao": dimensao_cdr, "valor": valor_dimensao},
+                                                  obter_versao(engine_leitura, 'cdr'), grafico_cdr)
+
+                    with medir("gráfico Plotly (serialização)"):
+                        st.plotly_chart(fig_map, use_container_width=True)
                 else:
                     st.warning("Não foi possível carregar o GeoJSON, o mapa não será exibido.")
 
@@ -530,5 +706,90 @@ else:
                             st.error("Por favor, selecione um usuário para excluir.")
             else:
                 st.info("Nenhum usuário cadastrado ainda. Cadastre o primeiro usuário acima.")
+
+            st.markdown("---") # Separador visual
+            st.header("🏷️ Regras de Normalização de Especialidades")
+            st.info("Cada regra associa o início do nome da especialidade no SIRESP a um nome consolidado. "
+                    "Vale sempre o prefixo mais longo: 'NEUROLOGIA PEDIÁTRICA' tem precedência sobre 'NEUROLOGIA'. "
+                    "Os dados de produção já gravados são reprocessados a cada alteração.")
+
+            st.subheader("Cadastrar ou Atualizar Regra")
+            with st.form("salvar_regra_form", clear_on_submit=True):
+                novo_prefixo = st.text_input("Prefixo (início do nome no SIRESP)", key="novo_prefixo_input")
+                nova_especialidade = st.text_input("Especialidade Normalizada", key="nova_especialidade_input")
+                salvar_regra_button = st.form_submit_button("Salvar Regra")
+
+                if salvar_regra_button:
+                    if novo_prefixo and nova_especialidade:
+                        # Chama a função salvar_regra do especialidades.py
+                        salvar_regra(novo_prefixo, nova_especialidade, engine)
+                    else:
+                        st.error("Por favor, preencha o prefixo e a especialidade.")
+
+            st.subheader("Regras Cadastradas")
+            regras = carregar_regras(engine_leitura)
+            if regras:
+                df_regras = pd.DataFrame(regras, columns=["Prefixo", "Especialidade"]).sort_values("Prefixo")
+                st.dataframe(df_regras, use_container_width=True, hide_index=True)
+
+                st.subheader("Excluir Regra")
+                with st.form("excluir_regra_form", clear_on_submit=True):
+                    prefixo_to_delete = st.selectbox("Selecione a Regra para Excluir", df_regras["Prefixo"].tolist(), key="prefixo_to_delete_select")
+                    excluir_regra_button = st.form_submit_button("Excluir Regra")
+
+                    if excluir_regra_button:
+                        # Chama a função excluir_regra do especialidades.py
+                        excluir_regra(prefixo_to_delete, engine)
+                        st.rerun() # Recarrega para atualizar a lista de regras
+            else:
+                st.info("Nenhuma regra cadastrada. Os nomes das especialidades serão usados sem agrupamento.")
+        else:
+            st.warning("Você não tem permissão para acessar esta página.")
+
+    # Página: DESEMPENHO (tempos das etapas medidos pela instrumentação, apenas para o admin)
+    elif pagina == "Desempenho":
+        if st.session_state.username == 'admin':
+            st.header("⏱️ Desempenho das Páginas e Ingestões")
+
+            if not INSTRUMENTACAO_ATIVA:
+                st.info("A instrumentação está desligada. Inicie o aplicativo com a variável de ambiente "
+                        "PRODUCAO_INSTRUMENTACAO=1 para medir o tempo de cada etapa (leitura SQL, normalização, "
+                        "agregação, gráficos Plotly, exportação e bcrypt).")
+            else:
+                df_medicoes = medicoes()
+                if df_medicoes.empty:
+                    st.info("Nenhuma medição registrada ainda. Navegue pelas páginas para gerar medições.")
+                else:
+                    st.caption(f"{len(df_medicoes)} medição(ões) desde {df_medicoes['data'].iloc[0]} (as mais antigas são descartadas).")
+                    paginas_medidas = sorted(df_medicoes['pagina'].unique())
+                    paginas_filtro = st.multiselect("Páginas", paginas_medidas, default=paginas_medidas, key="desempenho_paginas")
+                    resumo = resumo_medicoes(df_medicoes[df_medicoes['pagina'].isin(paginas_filtro)])
+
+                    st.subheader("Tempos por Página e Etapa (ms)")
+                    st.dataframe(resumo, use_container_width=True, hide_index=True)
+
+                    fig_desempenho = px.bar(
+                        resumo, x='p95_ms', y='etapa', color='pagina', orientation='h', barmode='group',
+                        title='p95 por etapa (ms)', labels={'p95_ms': 'p95 (ms)', 'etapa': 'Etapa', 'pagina': 'Página'}
+                    )
+                    st.plotly_chart(fig_desempenho, use_container_width=True)
+
+                    estatisticas = obter_cache_graficos().estatisticas()
+                    st.caption(f"Cache de gráficos: {estatisticas['entradas']} figura(s), "
+                               f"{estatisticas['bytes'] / 1048576:.1f} de {estatisticas['limite_bytes'] / 1048576:.0f} MB, "
+                               f"{estatisticas['acertos']} acerto(s) e {estatisticas['falhas']} falha(s).")
+
+                    # Exportação das medições brutas para análise fora do aplicativo
+                    col_json, col_csv, col_limpar = st.columns(3)
+                    col_json.download_button("📥 Baixar medições (JSON)", exportar_medicoes("JSON"),
+                                             file_name="medicoes.json", mime="application/json")
+                    col_csv.download_button("📥 Baixar medições (CSV)", exportar_medicoes("CSV"),
+                                            file_name="medicoes.csv", mime="text/csv")
+                    if col_limpar.button("Limpar medições", key="limpar_medicoes"):
+                        limpar_medicoes()
+                        st.rerun()
         else:
             st.warning("Você não tem permissão para acessar esta página.")
+
+# Fim da medição da execução completa do script
+registrar_medicao("execução completa", time.perf_counter() - inicio_execucao)
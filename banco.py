@@ -0,0 +1,55 @@
+import os
+import streamlit as st # Importado para usar st.cache_resource
+from sqlalchemy import create_engine, event
+
+# --- Configuração do Banco de Dados SQLite ---
+# Os engines são criados uma única vez por processo do servidor (st.cache_resource) e
+# compartilhados entre sessões. O banco opera em modo WAL: as páginas usam um engine somente
+# leitura e continuam lendo enquanto um upload grava e confirma a sua transação.
+
+# Caminho do banco, configurável pela variável de ambiente PRODUCAO_DB
+CAMINHO_BANCO = os.path.abspath(os.environ.get("PRODUCAO_DB", "producao.db"))
+
+# Ajustes aplicados a cada nova conexão
+PRAGMAS_CONEXAO = {
+    "cache_size": -65536,    # 64 MB de cache de páginas (valor negativo = KiB)
+    "mmap_size": 268435456,  # Até 256 MB do arquivo lidos por memory mapping
+    "busy_timeout": 5000,    # Espera até 5 s por um bloqueio antes de falhar
+    "temp_store": "MEMORY"
+}
+PRAGMAS_ESCRITA = {
+    "journal_mode": "WAL",   # Leitores não bloqueiam o escritor (e vice-versa)
+    "synchronous": "NORMAL"  # Seguro em WAL e bem mais rápido que FULL
+}
+
+def _aplicar_pragmas(pragmas):
+    """
+    Retorna o listener do evento 'connect' que aplica os PRAGMAs informados a cada conexão nova.
+    """
+    def _configurar_conexao(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for nome, valor in pragmas.items():
+            cursor.execute(f"PRAGMA {nome} = {valor}")
+        cursor.close()
+    return _configurar_conexao
+
+@st.cache_resource(show_spinner=False)
+def obter_engine(caminho=CAMINHO_BANCO):
+    """
+    Retorna o engine de leitura e escrita do banco (um por processo), com WAL e os PRAGMAs de desempenho.
+    """
+    engine = create_engine(f"sqlite:///{caminho}")
+    event.listen(engine, "connect", _aplicar_pragmas({**PRAGMAS_ESCRITA, **PRAGMAS_CONEXAO}))
+    return engine
+
+@st.cache_resource(show_spinner=False)
+def obter_engine_leitura(caminho=CAMINHO_BANCO):
+    """
+    Retorna o engine somente leitura usado pelas páginas de consulta (um por processo).
+    As conexões são abertas com 'mode=ro', de modo que nenhuma consulta das páginas segura o bloqueio de escrita.
+    """
+    with obter_engine(caminho).connect(): # Garante que o arquivo exista e já esteja em modo WAL
+        pass
+    engine = create_engine(f"sqlite:///file:{caminho}?mode=ro&uri=true")
+    event.listen(engine, "connect", _aplicar_pragmas({**PRAGMAS_CONEXAO, "query_only": 1}))
+    return engine
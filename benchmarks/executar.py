@@ -0,0 +1,244 @@
+"""
+Benchmarks dos pipelines de ingestão e das páginas, sem navegador.
+
+Para cada escala (múltiplo do volume atual), gera dados sintéticos, ingere-os num banco novo e
+mede as etapas de cada página (carregar, normalizar, filtrar, agregar, exportar) e de cada
+caminho de ingestão. Cada escala roda num subprocesso próprio, com banco, espelho e cache de
+GeoJSON isolados (PRODUCAO_DB, ESPELHO_DIR, GEOJSON_CACHE_DIR). Os tempos (mediana das
+repetições, com os caches do Streamlit limpos antes de cada uma) são acrescentados a
+benchmarks/resultados.jsonl junto com o commit, para comparar versões. O arquivo é local (fora do
+git): os tempos só são comparáveis entre medições feitas na mesma máquina.
+
+Uso: python benchmarks/executar.py --escalas 1 10 100
+"""
+import os
+import io
+import sys
+import json
+import time
+import argparse
+import statistics
+import subprocess
+import tempfile
+from datetime import datetime
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ARQUIVO_RESULTADOS = os.path.join(RAIZ, 'benchmarks', 'resultados.jsonl')
+LIMITE_REGRESSAO = 1.2 # Etapas 20% mais lentas que a última medição de outro commit são destacadas
+
+class ArquivoEnviado(io.BytesIO):
+    """
+    Imita o UploadedFile do Streamlit (objeto de arquivo em memória com o atributo 'name').
+    """
+    def __init__(self, caminho):
+        with open(caminho, 'rb') as f:
+            super().__init__(f.read())
+        self.name = os.path.basename(caminho)
+
+def copia_modificada(caminho, destino):
+    """
+    Grava em 'destino' uma cópia da planilha mensal do SIRESP com a Oferta da primeira especialidade
+    alterada. O mês é o mesmo (o upload regrava as mesmas linhas, como reenviar um mês corrigido),
+    mas o conteúdo é novo e não é ignorado pelo 'ingest_log'.
+    """
+    import openpyxl
+    workbook = openpyxl.load_workbook(caminho)
+    planilha = workbook.active
+    for linha in planilha.iter_rows(min_row=5):
+        if linha[0].value == 'Especialidade':
+            continue
+        if linha[0].value and isinstance(linha[1].value, (int, float)):
+            linha[1].value += 1
+            break
+    workbook.save(destino)
+    return destino
+
+def medir(nome, funcao, repeticoes, resultados, linhas=None):
+    """
+    Executa 'funcao' 'repeticoes' vezes com os caches do Streamlit limpos e registra a mediana.
+    Retorna o valor da última execução.
+    """
+    import streamlit as st
+    tempos = []
+    for _ in range(repeticoes):
+        st.cache_data.clear()
+        inicio = time.perf_counter()
+        valor = funcao()
+        tempos.append(time.perf_counter() - inicio)
+    if linhas is None and hasattr(valor, '__len__'):
+        linhas = len(valor)
+    resultados.append({"etapa": nome, "segundos": round(statistics.median(tempos), 6), "linhas": linhas})
+    return valor
+
+def executar_escala(escala, repeticoes, pasta):
+    """
+    Gera os dados e mede todas as etapas de uma escala. Deve rodar num processo com as
+    variáveis de ambiente do banco já apontando para 'pasta'.
+    """
+    import pandas as pd
+    from sqlalchemy import text, inspect
+    from benchmarks.gerar_dados import gerar_tudo
+    from uploads import engine, process_siresp_upload, process_contratos_upload, process_cdr_upload
+    from ingestao_lote import ingerir_lote
+    from banco import obter_engine_leitura
+    from dados import create_versao_table, carregar_producao
+    from especialidades import create_regras_table, carregar_regras, normalizar_especialidades
+    from cubo import create_cubo_tables
+    from mapa import ARQUIVO_GEOJSON, create_municipios_table, geojson_municipios
+    from consultas import consultar_producao, consultar_tendencias, consultar_custos, opcoes_filtros_producao, cdr_por_municipio, pacientes_cdr
+    from metricas import adicionar_kpis
+    from exportacao import gerar_arquivo, formatos_disponiveis
+
+    resultados = []
+    inicio = time.perf_counter()
+    arquivos = gerar_tudo(escala, os.path.join(pasta, 'entrada'))
+    resultados.append({"etapa": "gerar dados", "segundos": round(time.perf_counter() - inicio, 6), "linhas": None})
+
+    create_versao_table(engine)
+    create_regras_table(engine)
+    create_cubo_tables(engine)
+    create_municipios_table(engine, ARQUIVO_GEOJSON)
+
+    # --- Ingestão (cada caminho roda uma vez: repetir mediria o upsert sobre dados já gravados) ---
+    def contar(tabela):
+        with engine.connect() as connection:
+            return connection.execute(text(f"SELECT COUNT(*) FROM {tabela}")).scalar() if inspect(connection).has_table(tabela) else 0
+
+    def linhas_ultima_ingestao():
+        with engine.connect() as connection:
+            return connection.execute(text("SELECT linhas_gravadas FROM ingest_log ORDER BY id DESC LIMIT 1")).scalar()
+
+    medir("ingestão SIRESP: lote completo (ingestao_lote)",
+          lambda: sum(linhas for _, linhas, _ in ingerir_lote([os.path.dirname(arquivos['producao'][0])])), 1, resultados,
+          linhas=None)
+    resultados[-1]["linhas"] = contar('producao')
+    # O último mês já entrou no lote: o upload usa uma cópia alterada, senão mediria apenas o arquivo ignorado pelo 'ingest_log'
+    mes_alterado = copia_modificada(arquivos['producao'][-1], os.path.join(pasta, os.path.basename(arquivos['producao'][-1])))
+    medir("ingestão SIRESP: upload de um mês (process_siresp_upload)",
+          lambda: process_siresp_upload(ArquivoEnviado(mes_alterado), engine), 1, resultados)
+    resultados[-1]["linhas"] = linhas_ultima_ingestao()
+    medir("ingestão contratos (process_contratos_upload)",
+          lambda: process_contratos_upload(ArquivoEnviado(arquivos['contratos']), engine), 1, resultados)
+    resultados[-1]["linhas"] = contar('contratos')
+    medir("ingestão CDR (process_cdr_upload)",
+          lambda: process_cdr_upload(ArquivoEnviado(arquivos['cdr']), engine), 1, resultados)
+    resultados[-1]["linhas"] = contar('cdr')
+
+    leitura = obter_engine_leitura()
+    geojson = ARQUIVO_GEOJSON
+
+    # --- Carregamento e normalização ---
+    medir("carregar producao", lambda: carregar_producao(leitura), repeticoes, resultados)
+    nomes = carregar_producao(leitura, ['Especialidade'])['Especialidade']
+    regras = carregar_regras(leitura)
+    medir("normalizar especialidades", lambda: normalizar_especialidades(nomes, regras), repeticoes, resultados)
+
+    # --- Página Performance ---
+    opcoes = medir("Performance: opções dos filtros", lambda: opcoes_filtros_producao(leitura), repeticoes, resultados)
+    resultados[-1]["linhas"] = None
+    anos_recentes = opcoes['anos'][-1:]
+    metade_meses = list(opcoes['meses'])[:6]
+    df = medir("Performance: filtrar e agregar",
+               lambda: consultar_producao(leitura, ['Especialidade_Normalizada'], anos=anos_recentes, meses=metade_meses),
+               repeticoes, resultados)
+    medir("Performance: indicadores", lambda: adicionar_kpis(df.copy()), repeticoes, resultados)
+
+    # --- Página Dados Gerais ---
+    df = medir("Dados Gerais: filtrar e agregar",
+               lambda: consultar_producao(leitura, ['Especialidade_Normalizada', 'Ano_Num', 'Mes_Num', 'Mes_Producao'],
+                                          anos=opcoes['anos'], meses=list(opcoes['meses'])),
+               repeticoes, resultados)
+    df = adicionar_kpis(df)
+    for formato in formatos_disponiveis():
+        medir(f"Dados Gerais: exportar {formato}", lambda: gerar_arquivo(df, formato, ['Absenteísmo', 'Ocupação', 'Taxa de Realização']),
+              repeticoes, resultados, linhas=len(df))
+
+    # --- Página Absenteísmo ---
+    especialidades = opcoes['especialidades'][:len(opcoes['especialidades']) // 2 or 1]
+    df = medir("Absenteísmo: ler tendências",
+               lambda: consultar_tendencias(leitura, anos=opcoes['anos'], meses=list(opcoes['meses']), especialidades=especialidades),
+               repeticoes, resultados)
+    medir("Absenteísmo: exportar Excel", lambda: gerar_arquivo(df.drop(columns='Periodo'), "Excel", ['Absenteismo', 'Absenteismo_Media_3m', 'Absenteismo_Media_12m']),
+          repeticoes, resultados, linhas=len(df))
+
+    # --- Página Custos Médicos ---
+    medir("Custos Médicos: carregar contratos", lambda: pd.read_sql_table('contratos', con=leitura), repeticoes, resultados)
+    medir("Custos Médicos: ler custos mensais", lambda: consultar_custos(leitura), repeticoes, resultados)
+
+    # --- Página CDR ---
+    municipios = medir("CDR: agregar por município", lambda: cdr_por_municipio(leitura), repeticoes, resultados)
+    medir("CDR: agregar por município e Status", lambda: cdr_por_municipio(leitura, 'Status'), repeticoes, resultados)
+    maior = municipios.sort_values('Pacientes').iloc[-1]['Município']
+    medir("CDR: pacientes do maior município", lambda: pacientes_cdr(leitura, maior), repeticoes, resultados)
+    medir("CDR: GeoJSON reduzido", lambda: geojson_municipios(geojson, municipios['Codigo_IBGE'].dropna()),
+          repeticoes, resultados, linhas=len(municipios))
+    return resultados
+
+def _commit_atual():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=RAIZ, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def _ultimos_resultados(commit):
+    """
+    Retorna {(escala, etapa): segundos} da medição mais recente de um commit diferente do atual.
+    """
+    if not os.path.exists(ARQUIVO_RESULTADOS):
+        return {}
+    anteriores = {}
+    with open(ARQUIVO_RESULTADOS, encoding='utf-8') as f:
+        for linha in f:
+            registro = json.loads(linha)
+            if registro.get('commit') != commit:
+                anteriores[(registro['escala'], registro['etapa'])] = registro['segundos']
+    return anteriores
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmarks dos pipelines de ingestão e das páginas.")
+    parser.add_argument("--escalas", type=int, nargs="+", default=[1, 10, 100], help="Múltiplos do volume atual (1, 10, 100, 1000)")
+    parser.add_argument("--repeticoes", type=int, default=3, help="Repetições de cada etapa de página (é usada a mediana)")
+    parser.add_argument("--nao-salvar", action="store_true", help="Não grava os resultados em benchmarks/resultados.jsonl")
+    parser.add_argument("--interno", type=int, help=argparse.SUPPRESS) # Execução de uma escala no subprocesso
+    args = parser.parse_args(argv)
+
+    if args.interno is not None:
+        print(json.dumps(executar_escala(args.interno, args.repeticoes, os.environ['BENCHMARK_DIR']), ensure_ascii=False))
+        return 0
+
+    commit = _commit_atual()
+    anteriores = _ultimos_resultados(commit)
+    data = datetime.now().isoformat(timespec='seconds')
+    registros = []
+    for escala in args.escalas:
+        with tempfile.TemporaryDirectory(prefix=f"benchmark_{escala}x_") as pasta:
+            ambiente = {**os.environ, "BENCHMARK_DIR": pasta, "PRODUCAO_DB": os.path.join(pasta, 'producao.db'),
+                        "ESPELHO_DIR": os.path.join(pasta, 'espelho'), "GEOJSON_CACHE_DIR": os.path.join(pasta, 'geojson'),
+                        "PYTHONPATH": RAIZ}
+            processo = subprocess.run([sys.executable, os.path.abspath(__file__), "--interno", str(escala),
+                                       "--repeticoes", str(args.repeticoes)],
+                                      cwd=pasta, env=ambiente, capture_output=True, text=True)
+        if processo.returncode != 0:
+            print(f"Erro na escala {escala}×:\n{processo.stderr}")
+            return 1
+
+        print(f"\nEscala {escala}×")
+        for resultado in json.loads(processo.stdout.strip().splitlines()[-1]):
+            anterior = anteriores.get((escala, resultado['etapa']))
+            alerta = ""
+            if anterior and resultado['segundos'] > anterior * LIMITE_REGRESSAO and resultado['segundos'] > 0.01:
+                alerta = f"  <- regressão: {anterior:.4f}s antes"
+            linhas = "" if resultado['linhas'] is None else f" ({resultado['linhas']} linhas)"
+            print(f"  {resultado['etapa']:<60} {resultado['segundos']:>10.4f}s{linhas}{alerta}")
+            registros.append({"data": data, "commit": commit, "escala": escala, **resultado})
+
+    if not args.nao_salvar:
+        with open(ARQUIVO_RESULTADOS, 'a', encoding='utf-8') as f:
+            for registro in registros:
+                f.write(json.dumps(registro, ensure_ascii=False) + "\n")
+        print(f"\nResultados acrescentados a {ARQUIVO_RESULTADOS}.")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,199 @@
+"""
+Gerador de dados sintéticos para os benchmarks.
+
+Produz arquivos no mesmo formato dos uploads reais, em escalas múltiplas do volume atual:
+- planilhas mensais do SIRESP (AAAA_mes.xlsx, com os metadados em A3/F3 e a linha 'Total');
+- planilha de contratos (.xlsx, com as colunas obrigatórias da página Uploads);
+- exportação de CDR do SIRESP (.csv em latin-1, separado por ';', com as colunas repetidas
+  após 'Observação Status').
+
+Uso: python benchmarks/gerar_dados.py --escala 10 --destino /tmp/dados_10x
+"""
+import os
+import sys
+import math
+import argparse
+import numpy as np
+import pandas as pd
+import xlsxwriter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from dados import meses_ordem
+from especialidades import REGRAS_PADRAO
+
+# --- Volume Atual (escala 1×) ---
+# 17 planilhas mensais com ~50 especialidades, ~11 mil linhas de CDR e ~60 contratos
+MESES_BASE = 17
+ESPECIALIDADES_BASE = 50
+LINHAS_CDR_BASE = 10907
+CONTRATOS_BASE = 60
+ULTIMO_PERIODO = (2025, 6) # Junho de 2025
+
+SUFIXOS_ESPECIALIDADE = ["", " - PÓS OPERATÓRIO", " - AVALIAÇÃO CIRÚRGICA", " - TRIAGEM", " - SÍFILIS CONGÊNITA"]
+MUNICIPIOS_CDR = [ # Nome e peso aproximado na demanda atual (inclui grafias diferentes do GeoJSON)
+    ("Caraguatatuba", 4901), ("Ubatuba", 2794), ("São Sebastião", 1984), ("Ilhabela", 756),
+    ("Natividade da Serra", 150), ("Paraibuna", 125), ("Taubaté", 26), ("São Paulo", 13),
+    ("São José dos Campos", 13), ("São Luiz do Paraitinga", 11), ("Cachoeira Paulista", 10), ("Guaratinguetá", 9)
+]
+STATUS_CDR = [
+    ("Aguardando para o Agendamento", 8154), ("Agendado", 1937), ("Aguardando Exames Pré-Operatório", 755),
+    ("Qualificação Pendente", 37), ("Aguardando Exames Complementares", 15), ("Aguardando Consultas Complementares", 7)
+]
+TIPOS_CONSULTA_CDR = [("Retorno", 10206), ("Interconsulta", 559), ("1ª Consulta", 142)]
+CABECALHO_CDR = [
+    'Código', 'Nome', 'Telefone', 'Município', 'Especialidade', 'Cid', 'Tipo Consulta', 'Profissional',
+    'Idade do Paciente', 'Mês/Ano Pretendido', 'Turno', 'Data Agenda', 'Horário', 'Data Entrada', 'Status',
+    'Filipeta', 'Ret. Filipeta', 'Prioridade', 'Aceita Teleconsulta', 'Observação', 'Observação Status',
+    'Alteração Especialidade/Exame - De', 'Para', 'Observação', 'Usuário', 'Data de alteração',
+    'Alteração CID - De', 'Para', 'Observação', 'Usuário', 'Data de alteração'
+]
+MESES_SEM_ACENTO = {'março': 'marco'}
+
+def _dimensoes_producao(escala):
+    """
+    Divide o crescimento entre mais meses de histórico e mais especialidades por mês
+    (aproximadamente a raiz da escala para cada um).
+    """
+    fator_meses = math.ceil(math.sqrt(escala))
+    return MESES_BASE * fator_meses, max(1, round(ESPECIALIDADES_BASE * escala / fator_meses))
+
+def nomes_especialidades(quantidade):
+    """
+    Gera nomes de especialidades no formato do SIRESP a partir dos prefixos das regras padrão,
+    variando o sufixo e, acima disso, numerando linhas de cuidado.
+    """
+    nomes = [f"{prefixo}{sufixo}" for sufixo in SUFIXOS_ESPECIALIDADE for prefixo, _ in REGRAS_PADRAO]
+    i = 1
+    while len(nomes) < quantidade:
+        nomes.extend(f"{prefixo} - LINHA DE CUIDADO {i}" for prefixo, _ in REGRAS_PADRAO)
+        i += 1
+    return nomes[:quantidade]
+
+def periodos(quantidade):
+    """
+    Retorna os (ano, mês) dos últimos 'quantidade' meses até ULTIMO_PERIODO, do mais antigo ao mais recente.
+    """
+    ano, mes = ULTIMO_PERIODO
+    indice = ano * 12 + mes - 1
+    return [((i // 12), (i % 12) + 1) for i in range(indice - quantidade + 1, indice + 1)]
+
+def gerar_producao(escala, destino, rng):
+    """
+    Grava as planilhas mensais do SIRESP em 'destino'. Retorna a lista de arquivos gerados.
+    """
+    os.makedirs(destino, exist_ok=True)
+    quantidade_meses, quantidade_especialidades = _dimensoes_producao(escala)
+    especialidades = nomes_especialidades(quantidade_especialidades)
+    arquivos = []
+    for ano, mes in periodos(quantidade_meses):
+        nome_mes = meses_ordem[mes - 1]
+        caminho = os.path.join(destino, f"{ano}_{MESES_SEM_ACENTO.get(nome_mes, nome_mes)}.xlsx")
+        oferta = rng.integers(20, 1200, len(especialidades))
+        agendados = (oferta * rng.uniform(0.8, 1.1, len(especialidades))).astype(int)
+        realizados = (agendados * rng.uniform(0.7, 0.98, len(especialidades))).astype(int)
+
+        workbook = xlsxwriter.Workbook(caminho, {'constant_memory': True})
+        worksheet = workbook.add_worksheet()
+        worksheet.write_row(0, 0, ['Relatório de Agendamento de Consultas'])
+        worksheet.write_row(1, 0, ['Tipo', 'Tipo Marcação', 'Tipo Consulta', 'Unidade Executante', 'Especialidade', 'Período:'])
+        worksheet.write_row(2, 0, ['Consulta', 'Todos', 'Consultas médicas', 'AME CARAGUATATUBA', 'Todas especialidades',
+                                   f"{nome_mes.capitalize()} de {ano}"])
+        worksheet.write_row(4, 0, ['Especialidade', 'Oferta', 'Agendado', 'Realizado'])
+        linha = 6
+        for registro in zip(especialidades, oferta.tolist(), agendados.tolist(), realizados.tolist()):
+            worksheet.write_row(linha, 0, registro)
+            linha += 1
+        worksheet.write_row(linha, 0, ['Total', int(oferta.sum()), int(agendados.sum()), int(realizados.sum())])
+        workbook.close()
+        arquivos.append(caminho)
+    return arquivos
+
+def gerar_contratos(escala, destino, rng):
+    """
+    Grava a planilha de contratos em 'destino'. Retorna o caminho do arquivo.
+    """
+    os.makedirs(destino, exist_ok=True)
+    quantidade = CONTRATOS_BASE * escala
+    especialidades = [especialidade for _, especialidade in REGRAS_PADRAO]
+    df = pd.DataFrame({
+        'Especialidade': rng.choice(especialidades, quantidade),
+        'Serviço': rng.choice(['Consulta', 'Exame', 'Procedimento', 'Cirurgia'], quantidade),
+        'Centro de Custo': rng.integers(10000000, 99999999, quantidade),
+        'Nome do Centro de Custo': [f"CENTRO DE CUSTO {i % 200 + 1}" for i in range(quantidade)],
+        'Valor Unitário': rng.uniform(30, 900, quantidade).round(2),
+        'Data Contrato': pd.to_datetime('2023-01-01') + pd.to_timedelta(rng.integers(0, 900, quantidade), unit='D'),
+        'Contratado': [f"PRESTADOR {i % 500 + 1} LTDA" for i in range(quantidade)],
+        'Meta Mensal': rng.integers(50, 2000, quantidade).astype(str),
+        'Responsável': rng.choice(['Ana', 'Bruno', 'Carla', 'Diego'], quantidade),
+        'Detalhamento': ''
+    })
+    df['Data Contrato'] = df['Data Contrato'].dt.strftime('%d/%m/%Y')
+    caminho = os.path.join(destino, 'contratos.xlsx')
+    df.to_excel(caminho, index=False)
+    return caminho
+
+def _sortear(opcoes, quantidade, rng):
+    nomes, pesos = zip(*opcoes)
+    pesos = np.asarray(pesos, dtype=float)
+    return rng.choice(np.asarray(nomes, dtype=object), quantidade, p=pesos / pesos.sum())
+
+def gerar_cdr(escala, destino, rng, tamanho_lote=200000):
+    """
+    Grava a exportação de CDR em 'destino', em lotes (a escala 1000× passa de 10 milhões de linhas).
+    Retorna o caminho do arquivo.
+    """
+    os.makedirs(destino, exist_ok=True)
+    caminho = os.path.join(destino, 'cdr.csv')
+    total = LINHAS_CDR_BASE * escala
+    especialidades = np.asarray([especialidade for _, especialidade in REGRAS_PADRAO], dtype=object)
+    with open(caminho, 'w', encoding='latin-1', newline='') as f:
+        f.write(';'.join(f'"{coluna}"' if ' ' in coluna else coluna for coluna in CABECALHO_CDR) + '\n')
+        for inicio in range(0, total, tamanho_lote):
+            n = min(tamanho_lote, total - inicio)
+            codigos = np.arange(inicio, inicio + n) + 1000000
+            entrada = pd.Timestamp('2023-01-01') + pd.to_timedelta(rng.integers(0, 900 * 86400, n), unit='s')
+            lote = pd.DataFrame({
+                'Código': codigos,
+                'Nome': [f"PACIENTE {codigo}" for codigo in codigos],
+                'Telefone': '() (12)900000000 ()',
+                'Município': _sortear(MUNICIPIOS_CDR, n, rng),
+                'Especialidade': rng.choice(especialidades, n),
+                'Cid': 'Z000',
+                'Tipo Consulta': _sortear(TIPOS_CONSULTA_CDR, n, rng),
+                'Profissional': '',
+                'Idade do Paciente': [f"{idade} anos" for idade in rng.integers(0, 95, n)],
+                'Mês/Ano Pretendido': entrada.strftime('%m/%Y'),
+                'Turno': ' ', 'Data Agenda': '', 'Horário': '',
+                'Data Entrada': entrada.strftime('%Y-%m-%d %H:%M:%S'),
+                'Status': _sortear(STATUS_CDR, n, rng),
+                'Filipeta': '', 'Ret. Filipeta': '',
+                'Prioridade': np.where(rng.random(n) < 0.053, 'X', ''),
+                'Aceita Teleconsulta': '', 'Observação': '', 'Observação Status': ''
+            })
+            for coluna in CABECALHO_CDR[len(lote.columns):]: # Colunas repetidas após 'Observação Status'
+                lote[f"{coluna}.{len(lote.columns)}"] = ''
+            lote.to_csv(f, sep=';', header=False, index=False)
+    return caminho
+
+def gerar_tudo(escala, destino, semente=42):
+    """
+    Gera os três conjuntos de dados da escala informada. Retorna um dicionário com os caminhos.
+    """
+    rng = np.random.default_rng(semente)
+    return {
+        "producao": gerar_producao(escala, os.path.join(destino, 'producao'), rng),
+        "contratos": gerar_contratos(escala, destino, rng),
+        "cdr": gerar_cdr(escala, destino, rng)
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Gera dados sintéticos de produção, contratos e CDR para os benchmarks.")
+    parser.add_argument("--escala", type=int, default=1, help="Múltiplo do volume atual (1, 10, 100, 1000)")
+    parser.add_argument("--destino", required=True, help="Pasta onde os arquivos serão gravados")
+    parser.add_argument("--semente", type=int, default=42)
+    args = parser.parse_args(argv)
+    arquivos = gerar_tudo(args.escala, args.destino, args.semente)
+    print(f"{len(arquivos['producao'])} planilha(s) de produção, {arquivos['contratos']} e {arquivos['cdr']} gerados em {args.destino}.")
+
+if __name__ == "__main__":
+    main()
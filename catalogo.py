@@ -0,0 +1,89 @@
+import pandas as pd
+from sqlalchemy import text, inspect
+from especialidades import create_dim_especialidade_table, sincronizar_dim_especialidade
+
+# --- Catálogo das Dimensões de Produção ---
+# Os filtros da barra lateral (anos, meses, especialidades e tipos de consulta) são lidos de
+# tabelas pequenas mantidas pela própria ingestão: 'dim_periodo' (ano e mês), 'dim_tipo_consulta'
+# e 'dim_especialidade' (ver especialidades.py). Desenhar a barra lateral não lê nenhuma linha
+# dos dados de produção nem do cubo.
+# Como no cubo, linhas sem ano reconhecido entram no catálogo com ano = 0.
+
+SQL_TABELAS_CATALOGO = [
+    """
+    CREATE TABLE IF NOT EXISTS dim_periodo (
+        ano INTEGER NOT NULL,
+        mes INTEGER NOT NULL,
+        mes_nome TEXT,
+        PRIMARY KEY (ano, mes)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS dim_tipo_consulta (
+        id INTEGER PRIMARY KEY,
+        tipo_consulta TEXT NOT NULL UNIQUE
+    )
+    """
+]
+
+def create_catalogo_tables(engine):
+    """
+    Cria as tabelas do catálogo se elas não existirem e, se o catálogo estiver vazio com dados
+    de produção já gravados no esquema tipado (banco anterior ao catálogo), preenche-o a partir
+    de 'producao'. Tabelas no esquema antigo são tratadas pela migração (migrar_producao.py).
+    """
+    with engine.connect() as connection:
+        _criar_tabelas_catalogo(connection)
+        vazio = connection.execute(text("SELECT COUNT(*) FROM dim_periodo")).scalar() == 0
+        inspector = inspect(connection)
+        if vazio and inspector.has_table('producao') and \
+                'Especialidade_Id' in {coluna['name'] for coluna in inspector.get_columns('producao')}:
+            reconstruir_catalogo(connection)
+        connection.commit()
+
+def _criar_tabelas_catalogo(connection):
+    create_dim_especialidade_table(connection)
+    for sql in SQL_TABELAS_CATALOGO:
+        connection.execute(text(sql))
+
+def atualizar_catalogo(connection, df):
+    """
+    Registra no catálogo os períodos e tipos de consulta de um DataFrame de produção recém-gravado
+    (colunas Ano_Num, Mes_Num, Mes_Producao e Tipo_Consulta). As especialidades são registradas
+    pela gravação (ids_especialidade). Deve ser chamada na mesma transação que gravou os dados.
+    """
+    _criar_tabelas_catalogo(connection)
+    periodos = df[['Ano_Num', 'Mes_Num', 'Mes_Producao']].drop_duplicates(['Ano_Num', 'Mes_Num'])
+    registros = [{"ano": 0 if pd.isna(ano) else int(ano), "mes": 0 if pd.isna(mes) else int(mes), "nome": nome}
+                 for ano, mes, nome in periodos.itertuples(index=False, name=None)]
+    if registros:
+        connection.execute(text("""
+            INSERT INTO dim_periodo (ano, mes, mes_nome) VALUES (:ano, :mes, :nome)
+            ON CONFLICT(ano, mes) DO NOTHING
+        """), registros)
+    tipos = df['Tipo_Consulta'].fillna('N/A').unique()
+    if len(tipos):
+        connection.execute(text("INSERT OR IGNORE INTO dim_tipo_consulta (tipo_consulta) VALUES (:tipo)"),
+                           [{"tipo": tipo} for tipo in tipos])
+
+def reconstruir_catalogo(connection):
+    """
+    Refaz o catálogo a partir de todas as linhas de 'producao', sem manter entradas que não têm
+    mais linhas. Usada pela migração e ao criar o catálogo num banco que já tem dados.
+    """
+    _criar_tabelas_catalogo(connection)
+    connection.execute(text("DELETE FROM dim_periodo"))
+    connection.execute(text("""
+        DELETE FROM dim_tipo_consulta
+        WHERE tipo_consulta NOT IN (SELECT DISTINCT COALESCE("Tipo_Consulta", 'N/A') FROM producao)
+    """))
+    connection.execute(text("""
+        INSERT INTO dim_periodo (ano, mes, mes_nome)
+        SELECT COALESCE("Ano_Num", 0), COALESCE("Mes_Num", 0), MIN("Mes_Producao") FROM producao
+        GROUP BY COALESCE("Ano_Num", 0), COALESCE("Mes_Num", 0)
+    """))
+    connection.execute(text("""
+        INSERT OR IGNORE INTO dim_tipo_consulta (tipo_consulta)
+        SELECT DISTINCT COALESCE("Tipo_Consulta", 'N/A') FROM producao
+    """))
+    sincronizar_dim_especialidade(connection)
@@ -0,0 +1,268 @@
+import pandas as pd
+import streamlit as st # Importado para usar st.cache_data
+from sqlalchemy import text, bindparam, inspect
+from dados import obter_versao
+from espelho import carregar_espelho
+from metricas import COLUNAS_TENDENCIAS
+from custos import COLUNAS_CUSTOS
+
+# --- Camada de Consultas da Tabela de Produção ---
+# As páginas não carregam mais a tabela inteira: os filtros da barra lateral viram cláusulas
+# WHERE parametrizadas e a soma é feita pelo SQLite sobre o cubo de produção (ver cubo.py),
+# de modo que o custo depende do tamanho do resultado e não do histórico armazenado.
+
+# Colunas permitidas no agrupamento e nas somas (evita montar SQL com nomes arbitrários)
+COLUNAS_AGRUPAMENTO = ['Especialidade_Normalizada', 'Ano_Num', 'Mes_Num', 'Mes_Producao', 'Tipo_Consulta']
+COLUNAS_METRICAS = ['Oferta', 'Agendados', 'Realizados']
+
+def create_producao_indices(connection):
+    """
+    Cria os índices compostos usados pelos filtros de Ano, Mês e Especialidade, se a tabela 'producao' existir.
+    """
+    if not inspect(connection).has_table('producao'):
+        return
+    connection.execute(text("""
+        CREATE INDEX IF NOT EXISTS idx_producao_ano_mes_especialidade
+        ON producao ("Ano_Num", "Mes_Num", "Especialidade_Normalizada")
+    """))
+    connection.execute(text("""
+        CREATE INDEX IF NOT EXISTS idx_producao_especialidade_ano_mes
+        ON producao ("Especialidade_Normalizada", "Ano_Num", "Mes_Num")
+    """))
+
+def montar_consulta_producao(agrupar_por, anos=None, meses=None, especialidades=None, metricas=COLUNAS_METRICAS):
+    """
+    Monta o SELECT ... WHERE ... GROUP BY parametrizado para as seleções informadas.
+    Filtros com valor None não restringem a consulta. Retorna a instrução e o dicionário de parâmetros.
+    """
+    for coluna in agrupar_por:
+        if coluna not in COLUNAS_AGRUPAMENTO:
+            raise ValueError(f"Coluna de agrupamento não permitida: {coluna}")
+    for coluna in metricas:
+        if coluna not in COLUNAS_METRICAS:
+            raise ValueError(f"Métrica não permitida: {coluna}")
+
+    # Consolidações por ano ou por especialidade são lidas dos resumos, sem somar o cubo
+    if set(agrupar_por) <= {'Ano_Num'} and meses is None and especialidades is None:
+        tabela = 'producao_resumo_ano'
+    elif set(agrupar_por) <= {'Especialidade_Normalizada'} and anos is None and meses is None:
+        tabela = 'producao_resumo_especialidade'
+    else:
+        tabela = 'producao_cubo'
+
+    colunas_grupo = ", ".join(f'"{coluna}"' for coluna in agrupar_por)
+    colunas_soma = ", ".join(f'SUM("{coluna}") AS "{coluna}"' for coluna in metricas)
+
+    condicoes = []
+    params = {}
+    expansiveis = []
+    for nome, coluna, valores in [("anos", "Ano_Num", anos), ("meses", "Mes_Num", meses),
+                                  ("especialidades", "Especialidade_Normalizada", especialidades)]:
+        if valores is not None:
+            condicoes.append(f'"{coluna}" IN :{nome}')
+            params[nome] = list(valores)
+            expansiveis.append(bindparam(nome, expanding=True))
+
+    sql = f"SELECT {colunas_grupo}, {colunas_soma} FROM {tabela}"
+    if condicoes:
+        sql += " WHERE " + " AND ".join(condicoes)
+    sql += f" GROUP BY {colunas_grupo} ORDER BY {colunas_grupo}"
+    return text(sql).bindparams(*expansiveis), params
+
+@st.cache_data(max_entries=64, show_spinner=False)
+def _executar_consulta_producao(versao, agrupar_por, anos, meses, especialidades, metricas, _engine):
+    """
+    Executa a consulta agregada. O resultado fica em cache por versão dos dados e seleção de filtros.
+    """
+    consulta, params = montar_consulta_producao(list(agrupar_por), anos, meses, especialidades, list(metricas))
+    with _engine.connect() as connection:
+        return pd.read_sql(consulta, connection, params=params)
+
+def consultar_producao(engine, agrupar_por, anos=None, meses=None, especialidades=None, metricas=COLUNAS_METRICAS):
+    """
+    Retorna as somas das métricas agrupadas pelas colunas informadas, aplicando os filtros de
+    Ano (Ano_Num), Mês (Mes_Num) e Especialidade (Especialidade_Normalizada) no próprio SQLite.
+    """
+    # Um filtro vazio na barra lateral não seleciona nada: evita a consulta com "IN ()"
+    if any(valores is not None and len(valores) == 0 for valores in (anos, meses, especialidades)):
+        return pd.DataFrame(columns=list(agrupar_por) + list(metricas))
+
+    # Uma seleção com todas as opções equivale a não filtrar (e permite usar os resumos)
+    opcoes = opcoes_filtros_producao(engine)
+    if anos is not None and set(anos) >= set(opcoes['todos_anos']):
+        anos = None
+    if meses is not None and set(meses) >= set(opcoes['meses']):
+        meses = None
+    if especialidades is not None and set(especialidades) >= set(opcoes['especialidades']):
+        especialidades = None
+
+    def _congelar(valores):
+        return None if valores is None else tuple(sorted(valores))
+
+    return _executar_consulta_producao(obter_versao(engine, 'producao'), tuple(agrupar_por),
+                                       _congelar(anos), _congelar(meses), _congelar(especialidades),
+                                       tuple(metricas), engine)
+
+@st.cache_data(max_entries=2, show_spinner=False)
+def _ler_opcoes_filtros(versao, _engine):
+    """
+    Lê as opções dos filtros da barra lateral do catálogo das dimensões (ver catalogo.py),
+    sem tocar nos dados de produção. Fica em cache por versão dos dados.
+    """
+    with _engine.connect() as connection:
+        if not inspect(connection).has_table('dim_periodo'):
+            return {"anos": [], "todos_anos": [], "meses": {}, "especialidades": [], "tipos_consulta": []}
+        todos_anos = [row[0] for row in connection.execute(text(
+            'SELECT DISTINCT ano FROM dim_periodo ORDER BY ano'))]
+        meses = {row[0]: row[1] for row in connection.execute(text(
+            'SELECT mes, MIN(mes_nome) FROM dim_periodo GROUP BY mes ORDER BY mes'))}
+        especialidades = [row[0] for row in connection.execute(text(
+            'SELECT DISTINCT especialidade_normalizada FROM dim_especialidade '
+            'WHERE especialidade_normalizada IS NOT NULL ORDER BY 1'))]
+        tipos_consulta = [row[0] for row in connection.execute(text(
+            'SELECT tipo_consulta FROM dim_tipo_consulta ORDER BY tipo_consulta'))]
+    # O ano 0 agrupa as linhas sem ano reconhecido e não é oferecido no filtro
+    return {"anos": [ano for ano in todos_anos if ano], "todos_anos": todos_anos,
+            "meses": meses, "especialidades": especialidades, "tipos_consulta": tipos_consulta}
+
+def opcoes_filtros_producao(engine):
+    """
+    Retorna as opções dos filtros: lista de anos, dicionário {número do mês: nome do mês}
+    em ordem cronológica, lista de especialidades normalizadas e lista de tipos de consulta.
+    """
+    return _ler_opcoes_filtros(obter_versao(engine, 'producao'), engine)
+
+# --- Tendências de Absenteísmo ---
+# As médias móveis, a variação anual e a base sazonal já estão gravadas em 'producao_tendencias'
+# (ver cubo.py): a página apenas filtra as linhas, sem recalcular as séries.
+
+@st.cache_data(max_entries=16, show_spinner=False)
+def _ler_tendencias(versao, anos, meses, especialidades, _engine):
+    """
+    Lê as séries de tendência filtradas. Fica em cache por versão dos dados e seleção de filtros.
+    """
+    colunas = ", ".join(f'"{coluna}"' for coluna in COLUNAS_TENDENCIAS)
+    condicoes = []
+    params = {}
+    expansiveis = []
+    for nome, coluna, valores in [("anos", "Ano_Num", anos), ("meses", "Mes_Num", meses),
+                                  ("especialidades", "Especialidade_Normalizada", especialidades)]:
+        if valores is not None:
+            condicoes.append(f'"{coluna}" IN :{nome}')
+            params[nome] = list(valores)
+            expansiveis.append(bindparam(nome, expanding=True))
+    sql = f"SELECT {colunas} FROM producao_tendencias"
+    if condicoes:
+        sql += " WHERE " + " AND ".join(condicoes)
+    sql += ' ORDER BY "Periodo", "Especialidade_Normalizada"'
+    with _engine.connect() as connection:
+        if not inspect(connection).has_table('producao_tendencias'):
+            return pd.DataFrame(columns=COLUNAS_TENDENCIAS)
+        df = pd.read_sql(text(sql).bindparams(*expansiveis), connection, params=params)
+    df['Periodo'] = pd.PeriodIndex(df['Periodo'], freq='M') # 'AAAA-MM' gravado como texto
+    return df
+
+def consultar_tendencias(engine, anos=None, meses=None, especialidades=None):
+    """
+    Retorna, por especialidade e mês, o absenteísmo e suas tendências (médias móveis de 3 e 12
+    meses, variação anual e base sazonal, em frações) para os filtros da barra lateral.
+    'Periodo' é um período mensal (period[M]). As janelas consideram todo o histórico da
+    especialidade, mesmo quando o filtro de Ano ou Mês exibe só parte dele.
+    """
+    if any(valores is not None and len(valores) == 0 for valores in (anos, meses, especialidades)):
+        return pd.DataFrame(columns=COLUNAS_TENDENCIAS)
+
+    opcoes = opcoes_filtros_producao(engine)
+    if anos is not None and set(anos) >= set(opcoes['anos']):
+        anos = None
+    if meses is not None and set(meses) >= set(opcoes['meses']):
+        meses = None
+    if especialidades is not None and set(especialidades) >= set(opcoes['especialidades']):
+        especialidades = None
+
+    def _congelar(valores):
+        return None if valores is None else tuple(sorted(valores))
+
+    return _ler_tendencias(obter_versao(engine, 'producao'), _congelar(anos), _congelar(meses),
+                           _congelar(especialidades), engine)
+
+# --- Custos Mensais por Centro de Custo ---
+# A junção de contratos e produção já está gravada em 'custos_mensais' (ver custos.py).
+
+@st.cache_data(max_entries=4, show_spinner=False)
+def _ler_custos(versao, _engine):
+    """
+    Lê a tabela 'custos_mensais' inteira (uma linha por Centro de Custo, especialidade e mês).
+    Fica em cache por versão da tabela.
+    """
+    with _engine.connect() as connection:
+        if not inspect(connection).has_table('custos_mensais'):
+            return pd.DataFrame(columns=COLUNAS_CUSTOS)
+        colunas = ", ".join(f'"{coluna}"' for coluna in COLUNAS_CUSTOS)
+        return pd.read_sql(text(f"""
+            SELECT {colunas} FROM custos_mensais
+            ORDER BY "Ano_Num", "Mes_Num", "Centro de Custo", "Especialidade_Normalizada"
+        """), connection)
+
+def consultar_custos(engine):
+    """
+    Retorna os custos mensais por Centro de Custo, especialidade e mês (custo, custo por
+    procedimento realizado e atingimento da meta).
+    """
+    return _ler_custos(obter_versao(engine, 'custos_mensais'), engine)
+
+# --- Consultas da Tabela de CDR ---
+# O mapa e a tabela da página CDR usam contagens agregadas por município calculadas no SQLite,
+# com uma linha por município em vez de uma linha por paciente.
+
+DIMENSOES_CDR = ['Status', 'Especialidade', 'Prioridade']
+
+def create_cdr_indices(connection):
+    """
+    Cria os índices por município (nome e código IBGE) usados pelas agregações e pela consulta
+    de pacientes da página CDR.
+    """
+    connection.execute(text('CREATE INDEX IF NOT EXISTS idx_cdr_municipio ON cdr ("Município")'))
+    connection.execute(text('CREATE INDEX IF NOT EXISTS idx_cdr_codigo_ibge ON cdr ("Codigo_IBGE")'))
+
+@st.cache_data(max_entries=8, show_spinner=False)
+def _ler_cdr_por_municipio(versao, dimensao, _engine):
+    """
+    Conta os pacientes por município (e pela dimensão informada). Fica em cache por versão dos dados.
+    Numa tabela 'cdr' antiga ainda sem a coluna 'Codigo_IBGE' (GeoJSON indisponível na preparação),
+    o código vem nulo e a página exibe as contagens sem o mapa.
+    """
+    with _engine.connect() as connection:
+        colunas = {coluna['name'] for coluna in inspect(connection).get_columns('cdr')}
+        codigo = '"Codigo_IBGE"' if 'Codigo_IBGE' in colunas else 'NULL'
+        if dimensao is None:
+            sql = f"""
+                SELECT "Município", {codigo} AS "Codigo_IBGE", COUNT(*) AS "Pacientes" FROM cdr
+                WHERE "Município" IS NOT NULL
+                GROUP BY "Município", 2 ORDER BY "Município"
+            """
+        else:
+            sql = f"""
+                SELECT "Município", {codigo} AS "Codigo_IBGE", COALESCE("{dimensao}", 'Não informado') AS "{dimensao}", COUNT(*) AS "Pacientes" FROM cdr
+                WHERE "Município" IS NOT NULL
+                GROUP BY "Município", 2, 3 ORDER BY "Município", 3
+            """
+        df = pd.read_sql(text(sql), connection)
+    df['Codigo_IBGE'] = df['Codigo_IBGE'].astype('Int64')
+    return df
+
+def cdr_por_municipio(engine, dimensao=None):
+    """
+    Retorna a quantidade de pacientes por município (com o código IBGE, nulo quando o nome não foi
+    encontrado no GeoJSON); com 'dimensao' (Status, Especialidade ou Prioridade), retorna a contagem
+    por município e valor da dimensão, em formato longo.
+    """
+    if dimensao is not None and dimensao not in DIMENSOES_CDR:
+        raise ValueError(f"Dimensão não permitida: {dimensao}")
+    return _ler_cdr_por_municipio(obter_versao(engine, 'cdr'), dimensao, engine)
+
+def pacientes_cdr(engine, municipio):
+    """
+    Retorna as linhas de CDR (uma por paciente) de um único município, lidas do espelho colunar.
+    """
+    return carregar_espelho(engine, 'cdr', filtros={'Município': municipio})
@@ -0,0 +1,189 @@
+import pandas as pd
+from sqlalchemy import text, bindparam
+from metricas import calcular_tendencias
+
+# --- Cubo de Produção (tabelas de resumo materializadas) ---
+# 'producao_cubo' guarda Oferta, Agendados e Realizados somados por especialidade × ano × mês × tipo
+# de consulta; 'producao_resumo_ano' e 'producao_resumo_especialidade' são agregações mais grossas
+# do próprio cubo. As páginas leem dessas tabelas, de modo que detalhar ou consolidar os dados
+# nunca volta a varrer as linhas brutas de 'producao'.
+# 'producao_tendencias' guarda, por especialidade e mês, o absenteísmo com as médias móveis,
+# a variação anual e a base sazonal (ver metricas.calcular_tendencias), recalculadas junto com o cubo.
+# Linhas sem ano reconhecido entram no cubo com Ano_Num = 0 (e ficam fora das tendências).
+
+SQL_TABELAS_CUBO = [
+    """
+    CREATE TABLE IF NOT EXISTS producao_cubo (
+        "Especialidade_Normalizada" TEXT NOT NULL,
+        "Ano_Num" INTEGER NOT NULL,
+        "Mes_Num" INTEGER NOT NULL,
+        "Mes_Producao" TEXT,
+        "Tipo_Consulta" TEXT NOT NULL,
+        "Oferta" INTEGER,
+        "Agendados" INTEGER,
+        "Realizados" INTEGER,
+        PRIMARY KEY ("Ano_Num", "Mes_Num", "Especialidade_Normalizada", "Tipo_Consulta")
+    )
+    """,
+    """
+    CREATE INDEX IF NOT EXISTS idx_producao_cubo_especialidade
+    ON producao_cubo ("Especialidade_Normalizada", "Ano_Num", "Mes_Num")
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS producao_resumo_ano (
+        "Ano_Num" INTEGER PRIMARY KEY,
+        "Oferta" INTEGER,
+        "Agendados" INTEGER,
+        "Realizados" INTEGER
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS producao_resumo_especialidade (
+        "Especialidade_Normalizada" TEXT PRIMARY KEY,
+        "Oferta" INTEGER,
+        "Agendados" INTEGER,
+        "Realizados" INTEGER
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS producao_tendencias (
+        "Especialidade_Normalizada" TEXT NOT NULL,
+        "Periodo" TEXT NOT NULL,
+        "Ano_Num" INTEGER NOT NULL,
+        "Mes_Num" INTEGER NOT NULL,
+        "Agendados" INTEGER,
+        "Realizados" INTEGER,
+        "Absenteismo" REAL,
+        "Absenteismo_Media_3m" REAL,
+        "Absenteismo_Media_12m" REAL,
+        "Absenteismo_Variacao_Anual" REAL,
+        "Absenteismo_Base_Sazonal" REAL,
+        PRIMARY KEY ("Especialidade_Normalizada", "Periodo")
+    )
+    """
+]
+
+# Agregação das linhas brutas para o grão do cubo; o filtro WHERE é acrescentado por quem usa
+SQL_SELECT_CUBO = """
+    SELECT COALESCE("Especialidade_Normalizada", ''), COALESCE("Ano_Num", 0), COALESCE("Mes_Num", 0),
+           MIN("Mes_Producao"), COALESCE("Tipo_Consulta", 'N/A'),
+           SUM("Oferta"), SUM("Agendados"), SUM("Realizados")
+    FROM producao
+"""
+SQL_GROUP_BY_CUBO = """
+    GROUP BY COALESCE("Especialidade_Normalizada", ''), COALESCE("Ano_Num", 0), COALESCE("Mes_Num", 0),
+             COALESCE("Tipo_Consulta", 'N/A')
+"""
+
+def create_cubo_tables(engine):
+    """
+    Cria as tabelas do cubo de produção no banco de dados se elas não existirem e preenche as
+    tendências de um cubo já gravado antes da tabela existir.
+    """
+    with engine.connect() as connection:
+        _criar_tabelas_cubo(connection)
+        sem_tendencias = connection.execute(text("SELECT COUNT(*) FROM producao_tendencias")).scalar() == 0
+        if sem_tendencias and connection.execute(text("SELECT COUNT(*) FROM producao_cubo")).scalar():
+            _atualizar_tendencias(connection)
+        connection.commit()
+
+def _criar_tabelas_cubo(connection):
+    for sql in SQL_TABELAS_CUBO:
+        connection.execute(text(sql))
+
+def atualizar_cubo(connection, periodos):
+    """
+    Atualiza incrementalmente o cubo para os períodos informados, como tuplas
+    (Ano_Num, Mes_Num, Tipo_Consulta), recalculando apenas as células desses períodos
+    e as linhas dos resumos afetados. Deve ser chamada na mesma transação que gravou os dados brutos.
+    Retorna a lista das especialidades normalizadas afetadas.
+    """
+    periodos = {(0 if pd.isna(ano) else int(ano), 0 if pd.isna(mes) else int(mes), tipo) for ano, mes, tipo in periodos}
+    if not periodos:
+        return []
+    _criar_tabelas_cubo(connection)
+
+    especialidades = set()
+    sql_especialidades = text("""
+        SELECT DISTINCT "Especialidade_Normalizada" FROM producao_cubo
+        WHERE "Ano_Num" = :ano AND "Mes_Num" = :mes AND "Tipo_Consulta" = :tipo
+    """)
+    for ano, mes, tipo in periodos:
+        params = {"ano": ano, "mes": mes, "tipo": tipo, "ano_bruto": ano or None}
+        # Especialidades do período antes e depois da atualização (ambas afetam o resumo por especialidade)
+        especialidades.update(row[0] for row in connection.execute(sql_especialidades, params))
+        connection.execute(text("""
+            DELETE FROM producao_cubo WHERE "Ano_Num" = :ano AND "Mes_Num" = :mes AND "Tipo_Consulta" = :tipo
+        """), params)
+        connection.execute(text(f"""
+            INSERT INTO producao_cubo
+            {SQL_SELECT_CUBO}
+            WHERE "Ano_Num" IS :ano_bruto AND "Mes_Num" = :mes AND COALESCE("Tipo_Consulta", 'N/A') = :tipo
+            {SQL_GROUP_BY_CUBO}
+        """), params)
+        especialidades.update(row[0] for row in connection.execute(sql_especialidades, params))
+
+    _atualizar_resumos(connection, sorted({ano for ano, _, _ in periodos}), sorted(especialidades))
+    _atualizar_tendencias(connection, sorted(especialidades))
+    return sorted(especialidades)
+
+def _atualizar_resumos(connection, anos=None, especialidades=None):
+    """
+    Recalcula os resumos por ano e por especialidade a partir do cubo.
+    Com None, o resumo correspondente é refeito por inteiro.
+    """
+    for tabela, coluna, chaves in [("producao_resumo_ano", "Ano_Num", anos),
+                                   ("producao_resumo_especialidade", "Especialidade_Normalizada", especialidades)]:
+        select = f"""
+            INSERT INTO {tabela}
+            SELECT "{coluna}", SUM("Oferta"), SUM("Agendados"), SUM("Realizados") FROM producao_cubo
+        """
+        if chaves is None:
+            connection.execute(text(f"DELETE FROM {tabela}"))
+            connection.execute(text(select + f' GROUP BY "{coluna}"'))
+        else:
+            for chave in chaves:
+                connection.execute(text(f'DELETE FROM {tabela} WHERE "{coluna}" = :chave'), {"chave": chave})
+                connection.execute(text(select + f' WHERE "{coluna}" = :chave GROUP BY "{coluna}"'), {"chave": chave})
+
+def _atualizar_tendencias(connection, especialidades=None):
+    """
+    Recalcula as séries de tendência das especialidades informadas a partir do cubo (somando os
+    tipos de consulta). As janelas móveis e a base sazonal dependem de todo o histórico da
+    especialidade, por isso a série inteira de cada especialidade afetada é refeita.
+    Com None, a tabela é refeita por inteiro.
+    """
+    select = '''
+        SELECT "Especialidade_Normalizada", "Ano_Num", "Mes_Num", SUM("Agendados") AS "Agendados",
+               SUM("Realizados") AS "Realizados"
+        FROM producao_cubo WHERE "Ano_Num" > 0 AND "Mes_Num" > 0
+    '''
+    agrupamento = ' GROUP BY "Especialidade_Normalizada", "Ano_Num", "Mes_Num"'
+    if especialidades is None:
+        connection.execute(text("DELETE FROM producao_tendencias"))
+        df = pd.read_sql(text(select + agrupamento), connection)
+    else:
+        if not especialidades:
+            return
+        consulta = text(select + ' AND "Especialidade_Normalizada" IN :especialidades' + agrupamento)
+        consulta = consulta.bindparams(bindparam("especialidades", expanding=True))
+        connection.execute(text('DELETE FROM producao_tendencias WHERE "Especialidade_Normalizada" IN :especialidades')
+                           .bindparams(bindparam("especialidades", expanding=True)), {"especialidades": list(especialidades)})
+        df = pd.read_sql(consulta, connection, params={"especialidades": list(especialidades)})
+
+    tendencias = calcular_tendencias(df)
+    if tendencias.empty:
+        return
+    tendencias['Periodo'] = tendencias['Periodo'].dt.strftime('%Y-%m') # Gravado como texto 'AAAA-MM'
+    tendencias.to_sql('producao_tendencias', con=connection, if_exists='append', index=False, chunksize=5000)
+
+def reconstruir_cubo(connection):
+    """
+    Reconstrói o cubo, os resumos e as tendências a partir de todas as linhas de 'producao'.
+    Usada pela migração e quando as regras de normalização mudam.
+    """
+    _criar_tabelas_cubo(connection)
+    connection.execute(text("DELETE FROM producao_cubo"))
+    connection.execute(text(f"INSERT INTO producao_cubo {SQL_SELECT_CUBO} {SQL_GROUP_BY_CUBO}"))
+    _atualizar_resumos(connection)
+    _atualizar_tendencias(connection)
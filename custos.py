@@ -0,0 +1,188 @@
+import pandas as pd
+from sqlalchemy import text, bindparam, inspect
+from dados import incrementar_versao
+from especialidades import normalizar_especialidades
+
+# --- Custos Mensais por Centro de Custo (junção materializada) ---
+# 'custos_mensais' cruza cada contrato ('contratos') com os Realizados mensais da especialidade
+# do contrato no cubo de produção, pela especialidade normalizada (as mesmas regras usadas nos
+# dados do SIRESP). Uma linha por Centro de Custo × especialidade × mês, com:
+# - Meta_Mensal: soma das metas mensais dos contratos;
+# - Custo_Mensal: valor contratado no mês (Valor Unitário × Meta Mensal de cada contrato);
+# - Custo_Por_Procedimento: Custo_Mensal / Realizados;
+# - Atingimento_Meta: Realizados / Meta_Mensal.
+# Um contrato entra a partir do mês da 'Data Contrato' e apenas nos meses com produção registrada.
+# A tabela é atualizada por especialidade quando chegam dados de produção ou contratos, de modo
+# que a página Custos Médicos lê os números já cruzados. Num banco anterior à tabela, ela é
+# preenchida pela migração (migrar_producao.py).
+
+SQL_TABELA_CUSTOS = """
+    CREATE TABLE IF NOT EXISTS custos_mensais (
+        "Centro de Custo" INTEGER NOT NULL,
+        "Nome do Centro de Custo" TEXT,
+        "Especialidade_Normalizada" TEXT NOT NULL,
+        "Ano_Num" INTEGER NOT NULL,
+        "Mes_Num" INTEGER NOT NULL,
+        "Contratos" INTEGER,
+        "Meta_Mensal" REAL,
+        "Realizados" INTEGER,
+        "Custo_Mensal" REAL,
+        "Custo_Por_Procedimento" REAL,
+        "Atingimento_Meta" REAL,
+        PRIMARY KEY ("Centro de Custo", "Especialidade_Normalizada", "Ano_Num", "Mes_Num")
+    )
+"""
+
+COLUNAS_CUSTOS = ['Centro de Custo', 'Nome do Centro de Custo', 'Especialidade_Normalizada', 'Ano_Num', 'Mes_Num',
+                  'Contratos', 'Meta_Mensal', 'Realizados', 'Custo_Mensal', 'Custo_Por_Procedimento', 'Atingimento_Meta']
+
+def create_custos_table(engine):
+    """
+    Cria a tabela 'custos_mensais' se ela não existir. Não a preenche: vazia é um estado válido
+    (contratos sem produção nas suas especialidades), e refazê-la a cada execução do app seria
+    refazer o cruzamento inteiro. O preenchimento de um banco anterior à tabela fica com a migração.
+    """
+    with engine.connect() as connection:
+        connection.execute(text(SQL_TABELA_CUSTOS))
+        connection.commit()
+
+def numero_meta(metas):
+    """
+    Converte a coluna 'Meta Mensal' (gravada como texto) em número. Aceita o texto de um número
+    lido do Excel ('120' ou '120.0') e o formato brasileiro ('1.200' ou '1.200,5'); o que não for
+    número (vazio, 'A definir'...) fica vazio.
+    """
+    metas = pd.Series(metas, dtype=object).astype(str).str.strip()
+    valores = pd.to_numeric(metas, errors='coerce')
+    brasileiro = metas.str.replace('.', '', regex=False).str.replace(',', '.', regex=False)
+    return valores.fillna(pd.to_numeric(brasileiro, errors='coerce'))
+
+def _ler_contratos(connection, regras):
+    """
+    Lê os contratos (sem linhas repetidas por reenvio) com a especialidade normalizada,
+    a meta numérica, o valor contratado no mês e o primeiro mês de vigência (ano * 12 + mês).
+    """
+    contratos = pd.read_sql(text("""
+        SELECT DISTINCT "Especialidade", "Centro de Custo", "Nome do Centro de Custo", "Valor Unitario",
+                        "Data Contrato", "Meta Mensal", "Servico"
+        FROM contratos WHERE "Centro de Custo" IS NOT NULL
+    """), connection)
+    contratos['Especialidade_Normalizada'] = normalizar_especialidades(contratos['Especialidade'], regras)
+    contratos['Meta_Mensal'] = numero_meta(contratos['Meta Mensal'])
+    contratos['Custo_Mensal'] = contratos['Valor Unitario'] * contratos['Meta_Mensal']
+    inicio = pd.to_datetime(contratos['Data Contrato'].astype(str).str[:10], errors='coerce')
+    contratos['Inicio'] = (inicio.dt.year * 12 + inicio.dt.month).fillna(0)
+    contratos['Centro de Custo'] = contratos['Centro de Custo'].astype('int64')
+    return contratos
+
+def calcular_custos(contratos, producao):
+    """
+    Cruza os contratos (ver _ler_contratos) com os Realizados mensais por especialidade
+    (colunas Especialidade_Normalizada, Ano_Num, Mes_Num e Realizados) e calcula os indicadores
+    por Centro de Custo, especialidade e mês.
+    """
+    juncao = contratos.merge(producao, on='Especialidade_Normalizada', how='inner')
+    juncao = juncao[juncao['Ano_Num'] * 12 + juncao['Mes_Num'] >= juncao['Inicio']]
+    if juncao.empty:
+        return pd.DataFrame(columns=COLUNAS_CUSTOS)
+
+    custos = juncao.groupby(['Centro de Custo', 'Especialidade_Normalizada', 'Ano_Num', 'Mes_Num'], as_index=False).agg(
+        **{'Nome do Centro de Custo': ('Nome do Centro de Custo', 'first'),
+           'Contratos': ('Servico', 'size'),
+           'Meta_Mensal': ('Meta_Mensal', lambda metas: metas.sum(min_count=1)),
+           'Realizados': ('Realizados', 'first'), # O mesmo valor em todos os contratos da especialidade
+           'Custo_Mensal': ('Custo_Mensal', lambda custos: custos.sum(min_count=1))}
+    )
+    realizados = custos['Realizados'].astype(float)
+    custos['Custo_Por_Procedimento'] = (custos['Custo_Mensal'] / realizados).where(realizados > 0)
+    custos['Atingimento_Meta'] = (realizados / custos['Meta_Mensal']).where(custos['Meta_Mensal'] > 0)
+    return custos[COLUNAS_CUSTOS]
+
+def atualizar_custos(connection, regras, especialidades=None):
+    """
+    Recalcula as linhas de 'custos_mensais' das especialidades normalizadas informadas (todas com None).
+    As linhas só são regravadas, e a versão da tabela só é incrementada, quando o resultado muda:
+    um upload que não altera os custos não invalida o cache da página Custos Médicos.
+    Deve ser chamada na mesma transação que gravou a produção ou os contratos.
+    """
+    connection.execute(text(SQL_TABELA_CUSTOS))
+    if especialidades is not None:
+        especialidades = sorted(set(especialidades))
+        if not especialidades:
+            return
+        filtro, parametros = ' WHERE "Especialidade_Normalizada" IN :especialidades', {"especialidades": especialidades}
+    else:
+        filtro, parametros = '', {}
+
+    custos = _calcular_custos_especialidades(connection, regras, especialidades)
+    atuais = pd.read_sql(_sql_custos(f"SELECT * FROM custos_mensais{filtro}", parametros), connection, params=parametros)
+    if _mesmas_linhas(atuais, custos):
+        return
+
+    connection.execute(_sql_custos(f"DELETE FROM custos_mensais{filtro}", parametros), parametros)
+    if not custos.empty:
+        custos.to_sql('custos_mensais', con=connection, if_exists='append', index=False)
+    incrementar_versao(connection, 'custos_mensais')
+
+def _sql_custos(sql, parametros):
+    """
+    Monta a consulta sobre 'custos_mensais', expandindo a lista de especialidades quando há filtro.
+    """
+    consulta = text(sql)
+    if "especialidades" in parametros:
+        consulta = consulta.bindparams(bindparam("especialidades", expanding=True))
+    return consulta
+
+def _calcular_custos_especialidades(connection, regras, especialidades):
+    """
+    Calcula as linhas de 'custos_mensais' das especialidades informadas (todas com None) a partir
+    dos contratos e do cubo de produção. Sem contratos ou sem cubo, o resultado é vazio.
+    """
+    inspector = inspect(connection)
+    if not inspector.has_table('contratos') or not inspector.has_table('producao_cubo'):
+        return pd.DataFrame(columns=COLUNAS_CUSTOS)
+    contratos = _ler_contratos(connection, regras)
+    if especialidades is not None:
+        contratos = contratos[contratos['Especialidade_Normalizada'].isin(especialidades)]
+    if contratos.empty:
+        return pd.DataFrame(columns=COLUNAS_CUSTOS)
+
+    consulta = text("""
+        SELECT "Especialidade_Normalizada", "Ano_Num", "Mes_Num", SUM("Realizados") AS "Realizados"
+        FROM producao_cubo
+        WHERE "Ano_Num" > 0 AND "Mes_Num" > 0 AND "Especialidade_Normalizada" IN :especialidades
+        GROUP BY "Especialidade_Normalizada", "Ano_Num", "Mes_Num"
+    """).bindparams(bindparam("especialidades", expanding=True))
+    producao = pd.read_sql(consulta, connection,
+                           params={"especialidades": sorted(contratos['Especialidade_Normalizada'].unique())})
+
+    return calcular_custos(contratos, producao)
+
+def _mesmas_linhas(atuais, novas):
+    """
+    Compara as linhas gravadas em 'custos_mensais' com as recalculadas, independentemente da ordem
+    e do tipo numérico (o SQLite devolve inteiros onde o cálculo tem floats, e None onde há NaN).
+    """
+    if len(atuais) != len(novas):
+        return False
+    if atuais.empty:
+        return True
+    chave = ['Centro de Custo', 'Especialidade_Normalizada', 'Ano_Num', 'Mes_Num']
+    def linhas(df):
+        df = df[COLUNAS_CUSTOS].sort_values(chave).astype(object)
+        return df.where(df.notna(), None).values.tolist()
+    return linhas(atuais) == linhas(novas)
+
+def reconstruir_custos(connection, regras):
+    """
+    Refaz 'custos_mensais' por inteiro. Usada pela migração, pelo backfill e quando as regras
+    de normalização mudam (a especialidade de um contrato pode passar a outra especialidade).
+    """
+    atualizar_custos(connection, regras)
+
+def especialidades_contratos(df_contratos, regras):
+    """
+    Retorna as especialidades normalizadas de um DataFrame de contratos recém-gravado
+    (as linhas de 'custos_mensais' que precisam ser recalculadas).
+    """
+    return set(normalizar_especialidades(df_contratos['Especialidade'], regras))
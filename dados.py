@@ -0,0 +1,61 @@
+import pandas as pd
+import streamlit as st # Importado para usar st.cache_data
+from sqlalchemy import text
+
+# Lista de meses para ordenação correta
+meses_ordem = ['janeiro', 'fevereiro', 'março', 'abril', 'maio', 'junho',
+               'julho', 'agosto', 'setembro', 'outubro', 'novembro', 'dezembro']
+
+# --- Controle de Versão dos Dados ---
+# Cada tabela analítica possui um número de versão que é incrementado sempre que novos dados
+# são gravados. Os caches de leitura usam esse número como chave, de modo que um upload
+# invalida automaticamente os dados em cache de todas as sessões.
+
+def create_versao_table(engine):
+    """
+    Cria a tabela 'versao_dados' no banco de dados se ela não existir.
+    """
+    with engine.connect() as connection:
+        connection.execute(text("""
+            CREATE TABLE IF NOT EXISTS versao_dados (
+                tabela TEXT PRIMARY KEY,
+                versao INTEGER NOT NULL
+            )
+        """))
+        connection.commit()
+
+def obter_versao(engine, tabela='producao'):
+    """
+    Retorna a versão atual dos dados da tabela informada (0 se nunca houve gravação).
+    """
+    with engine.connect() as connection:
+        versao = connection.execute(text("SELECT versao FROM versao_dados WHERE tabela = :tabela"),
+                                    {"tabela": tabela}).scalar()
+    return versao or 0
+
+def incrementar_versao(connection, tabela='producao'):
+    """
+    Incrementa a versão dos dados da tabela informada.
+    Deve ser chamada com a mesma conexão (e transação) que gravou os novos dados.
+    """
+    connection.execute(text("""
+        INSERT INTO versao_dados (tabela, versao) VALUES (:tabela, 1)
+        ON CONFLICT(tabela) DO UPDATE SET versao = versao + 1
+    """), {"tabela": tabela})
+
+# --- Carregamento da Tabela de Produção com Cache ---
+@st.cache_data(max_entries=2, show_spinner=False)
+def _ler_producao(versao, colunas, _engine):
+    """
+    Lê a tabela 'producao' do banco (só as colunas pedidas). O resultado fica em cache por versão
+    dos dados e é compartilhado entre páginas e sessões; o parâmetro '_engine' não entra na chave.
+    """
+    colunas_sql = ", ".join(f'"{coluna}"' for coluna in colunas) if colunas else "*"
+    with _engine.connect() as connection:
+        return pd.read_sql(text(f"SELECT {colunas_sql} FROM producao"), connection)
+
+def carregar_producao(engine, colunas=None):
+    """
+    Retorna a tabela 'producao' como DataFrame, relendo o SQLite apenas quando a versão muda.
+    """
+    return _ler_producao(obter_versao(engine, 'producao'), tuple(colunas) if colunas else None, engine)
@@ -0,0 +1,200 @@
+import pandas as pd
+import streamlit as st # Importado para usar st.cache_data, st.success e st.error
+from sqlalchemy import text, bindparam
+from dados import obter_versao, incrementar_versao
+from cubo import reconstruir_cubo
+
+# --- Regras de Normalização de Especialidades ---
+# Cada regra associa um prefixo do nome da especialidade (em maiúsculas) ao nome consolidado.
+# As regras ficam na tabela 'regras_especialidade' e podem ser editadas na página Admin;
+# a lista abaixo é usada apenas para popular a tabela na primeira execução.
+REGRAS_PADRAO = [
+    ("CIRURGIA PLÁSTICA", "Cirurgia Plástica"),
+    ("CIRURGIA GERAL", "Cirurgia Geral"),
+    ("CIRURGIA VASCULAR", "Cirurgia Vascular"),
+    ("CIRURGIA PEDIÁTRICA", "Cirurgia Pediátrica"),
+    ("OFTALMOLOGIA", "Oftalmologia"),
+    ("DERMATOLOGIA", "Dermatologia"),
+    ("ANESTESIOLOGIA", "Anestesiologia"),
+    ("CARDIOLOGIA", "Cardiologia"),
+    ("COLOPROCTOLOGIA", "Coloproctologia"),
+    ("GASTROCLÍNICA", "Gastroenterologia"),
+    ("GASTROENTEROLOGIA", "Gastroenterologia"),
+    ("MASTOLOGIA", "Mastologia"),
+    ("ORTOPEDIA", "Ortopedia"),
+    ("OTORRINOLARINGOLOGIA", "Otorrinolaringologia"),
+    ("UROLOGIA", "Urologia"),
+    ("ENDOCRINOLOGIA", "Endocrinologia"),
+    ("NEUROLOGIA PEDIÁTRICA", "Neurologia Pediátrica"),
+    ("NEUROLOGIA", "Neurologia Adulto"),
+    ("PNEUMOLOGIA PEDIÁTRICA", "Pneumologia Pediátrica"),
+    ("PNEUMOLOGIA", "Pneumologia"),
+    ("NEFROLOGIA", "Nefrologia")
+]
+
+def create_regras_table(engine):
+    """
+    Cria a tabela 'regras_especialidade' se ela não existir e a popula com as regras padrão.
+    """
+    with engine.connect() as connection:
+        connection.execute(text("""
+            CREATE TABLE IF NOT EXISTS regras_especialidade (
+                prefixo TEXT PRIMARY KEY,
+                especialidade TEXT NOT NULL
+            )
+        """))
+        count = connection.execute(text("SELECT COUNT(*) FROM regras_especialidade")).scalar()
+        if count == 0:
+            connection.execute(text("INSERT INTO regras_especialidade (prefixo, especialidade) VALUES (:prefixo, :especialidade)"),
+                               [{"prefixo": prefixo, "especialidade": especialidade} for prefixo, especialidade in REGRAS_PADRAO])
+        connection.commit()
+
+@st.cache_data(max_entries=2, show_spinner=False)
+def _ler_regras(versao, _engine):
+    """
+    Lê as regras do banco, ordenadas do prefixo mais longo para o mais curto.
+    O resultado fica em cache por versão das regras.
+    """
+    with _engine.connect() as connection:
+        result = connection.execute(text("SELECT prefixo, especialidade FROM regras_especialidade")).fetchall()
+    return sorted(((row[0].upper().strip(), row[1]) for row in result), key=lambda regra: len(regra[0]), reverse=True)
+
+def carregar_regras(engine):
+    """
+    Retorna a lista de regras (prefixo, especialidade) vigente, ordenada pelo prefixo mais longo.
+    """
+    return _ler_regras(obter_versao(engine, 'regras_especialidade'), engine)
+
+def resolver_especialidade(nome, regras):
+    """
+    Resolve um único nome (já em maiúsculas) pela regra de prefixo mais longo.
+    Retorna o próprio nome se nenhuma regra corresponder.
+    """
+    for prefixo, especialidade in regras:
+        if nome.startswith(prefixo):
+            return especialidade
+    return nome
+
+def normalizar_especialidades(especialidades, regras):
+    """
+    Normaliza uma Series de nomes de especialidades para agrupamento.
+    Remove o código numérico inicial, resolve cada nome distinto uma única vez e
+    mapeia o resultado de volta para a coluna inteira.
+    """
+    nomes = especialidades.astype(str).str.replace(r'^\d+\s*', '', regex=True).str.strip().str.upper()
+    mapa = {nome: resolver_especialidade(nome, regras) for nome in nomes.unique()}
+    return nomes.map(mapa)
+
+# --- Dimensão de Especialidades ---
+# Cada nome de especialidade como vem do SIRESP recebe uma chave inteira na tabela
+# 'dim_especialidade', junto com o nome normalizado vigente; a tabela 'producao' guarda a chave
+# em 'Especialidade_Id'.
+
+def create_dim_especialidade_table(connection):
+    """
+    Cria a dimensão 'dim_especialidade' (nome original -> chave inteira e nome normalizado) se ela não existir.
+    """
+    connection.execute(text("""
+        CREATE TABLE IF NOT EXISTS dim_especialidade (
+            id INTEGER PRIMARY KEY,
+            especialidade TEXT NOT NULL UNIQUE,
+            especialidade_normalizada TEXT
+        )
+    """))
+
+def sincronizar_dim_especialidade(connection):
+    """
+    Acrescenta à 'dim_especialidade' os nomes de 'producao' que ainda não estão nela, remove os que
+    não têm mais linhas em 'producao' (ex: as linhas de total apagadas pelo backfill), atualiza o nome
+    normalizado de cada entrada e preenche 'Especialidade_Id' nas linhas de 'producao'.
+    Usada pela migração, pelo backfill e quando as regras de normalização mudam.
+    """
+    create_dim_especialidade_table(connection)
+    connection.execute(text("""
+        DELETE FROM dim_especialidade
+        WHERE especialidade NOT IN (SELECT "Especialidade" FROM producao WHERE "Especialidade" IS NOT NULL)
+    """))
+    connection.execute(text("""
+        INSERT OR IGNORE INTO dim_especialidade (especialidade)
+        SELECT DISTINCT "Especialidade" FROM producao WHERE "Especialidade" IS NOT NULL
+    """))
+    connection.execute(text("""
+        UPDATE dim_especialidade SET especialidade_normalizada = (
+            SELECT MIN(p."Especialidade_Normalizada") FROM producao p WHERE p."Especialidade" = dim_especialidade.especialidade
+        )
+    """))
+    connection.execute(text("""
+        UPDATE producao SET "Especialidade_Id" = (
+            SELECT d.id FROM dim_especialidade d WHERE d.especialidade = producao."Especialidade"
+        )
+    """))
+
+def ids_especialidade(connection, df):
+    """
+    Registra na 'dim_especialidade' os nomes (e nomes normalizados) do DataFrame e retorna a
+    Series com a chave inteira de cada linha. Cada nome distinto é tratado uma única vez.
+    """
+    create_dim_especialidade_table(connection)
+    distintos = df[['Especialidade', 'Especialidade_Normalizada']].drop_duplicates('Especialidade').dropna(subset=['Especialidade'])
+    if not distintos.empty:
+        connection.execute(text("""
+            INSERT INTO dim_especialidade (especialidade, especialidade_normalizada) VALUES (:nome, :normalizada)
+            ON CONFLICT(especialidade) DO UPDATE SET especialidade_normalizada = excluded.especialidade_normalizada
+        """), [{"nome": nome, "normalizada": normalizada} for nome, normalizada in distintos.itertuples(index=False, name=None)])
+    ids = {}
+    nomes = list(distintos['Especialidade'])
+    if nomes:
+        consulta = text("SELECT especialidade, id FROM dim_especialidade WHERE especialidade IN :nomes").bindparams(
+            bindparam("nomes", expanding=True))
+        ids = dict(connection.execute(consulta, {"nomes": nomes}).fetchall())
+    return df['Especialidade'].map(ids).astype('Int64')
+
+# --- Edição das Regras (página Admin) ---
+
+def salvar_regra(prefixo, especialidade, engine):
+    """
+    Cadastra ou atualiza a regra para o prefixo informado e reaplica as regras à tabela de produção.
+    """
+    prefixo = prefixo.upper().strip()
+    with engine.begin() as connection:
+        connection.execute(text("""
+            INSERT INTO regras_especialidade (prefixo, especialidade) VALUES (:prefixo, :especialidade)
+            ON CONFLICT(prefixo) DO UPDATE SET especialidade = excluded.especialidade
+        """), {"prefixo": prefixo, "especialidade": especialidade.strip()})
+        incrementar_versao(connection, 'regras_especialidade')
+    linhas = reaplicar_regras(engine)
+    st.success(f"✅ Regra '{prefixo}' salva com sucesso! {linhas} especialidade(s) distinta(s) reprocessada(s).")
+
+def excluir_regra(prefixo, engine):
+    """
+    Exclui a regra do prefixo informado e reaplica as regras à tabela de produção.
+    """
+    with engine.begin() as connection:
+        connection.execute(text("DELETE FROM regras_especialidade WHERE prefixo = :prefixo"), {"prefixo": prefixo})
+        incrementar_versao(connection, 'regras_especialidade')
+    linhas = reaplicar_regras(engine)
+    st.success(f"✅ Regra '{prefixo}' excluída com sucesso! {linhas} especialidade(s) distinta(s) reprocessada(s).")
+
+def reaplicar_regras(engine):
+    """
+    Recalcula a coluna 'Especialidade_Normalizada' da tabela 'producao' com as regras vigentes
+    e reconstrói o cubo de produção e os custos mensais.
+    O trabalho é feito uma vez por nome distinto, não por linha.
+    Retorna a quantidade de nomes distintos reprocessados.
+    """
+    regras = carregar_regras(engine)
+    with engine.begin() as connection:
+        nomes = pd.read_sql(text('SELECT DISTINCT "Especialidade" FROM producao'), connection)['Especialidade']
+        if nomes.empty:
+            return 0
+        normalizados = normalizar_especialidades(nomes, regras)
+        connection.execute(text("""
+            UPDATE producao SET "Especialidade_Normalizada" = :normalizada
+            WHERE "Especialidade" = :especialidade
+        """), [{"especialidade": nome, "normalizada": normalizado} for nome, normalizado in zip(nomes, normalizados)])
+        sincronizar_dim_especialidade(connection)
+        reconstruir_cubo(connection)
+        from custos import reconstruir_custos # Importação local: custos.py depende deste módulo
+        reconstruir_custos(connection, regras)
+        incrementar_versao(connection, 'producao')
+    return len(nomes)
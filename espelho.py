@@ -0,0 +1,113 @@
+import os
+import uuid
+import pandas as pd
+import streamlit as st # Importado para usar st.cache_data
+from sqlalchemy import text
+from dados import obter_versao
+
+# --- Espelho Colunar (Arrow) das Tabelas Analíticas ---
+# O SQLite continua sendo a fonte oficial dos dados. Depois de cada gravação, a tabela 'cdr'
+# (uma linha por paciente) é copiada para um arquivo Arrow IPC sem compressão, que a página CDR
+# abre com memory mapping e lendo só as colunas e linhas pedidas, sem passar cada linha por objetos
+# Python. A tabela 'producao' não é espelhada: as páginas leem somas do cubo e consultas agregadas
+# no SQLite (ver consultas.py), e regravar a tabela inteira a cada upload não teria leitor. O arquivo guarda a versão dos dados que espelha; se ela não bater com 'versao_dados'
+# (gravação desfeita, arquivo apagado, banco copiado de outro lugar), o espelho é refeito na leitura.
+# As gravações regravam o espelho depois de confirmar a transação, sem segurar o bloqueio de escrita
+# durante a leitura da tabela inteira.
+
+# O espelho depende do pyarrow; sem ele, a leitura vai direto ao SQLite
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    ESPELHO_DISPONIVEL = True
+except ImportError:
+    ESPELHO_DISPONIVEL = False
+
+DIRETORIO_ESPELHO = os.environ.get("ESPELHO_DIR", ".espelho")
+TABELAS_ESPELHADAS = ['cdr']
+TENTATIVAS_LEITURA = 3 # Releituras se uma gravação for confirmada durante a leitura da tabela
+
+def _caminho_espelho(tabela):
+    return os.path.join(DIRETORIO_ESPELHO, f"{tabela}.arrow")
+
+def _versao_espelho(tabela):
+    """
+    Retorna a versão dos dados gravada no arquivo do espelho, ou None se ele não existir ou estiver ilegível.
+    """
+    try:
+        with pa.memory_map(_caminho_espelho(tabela)) as fonte:
+            metadados = pa.ipc.open_file(fonte).schema.metadata or {}
+        return int(metadados.get(b"versao", b"-1"))
+    except (OSError, pa.ArrowInvalid, ValueError):
+        return None
+
+def _ler_versao(connection, tabela):
+    return connection.execute(text("SELECT versao FROM versao_dados WHERE tabela = :tabela"),
+                              {"tabela": tabela}).scalar() or 0
+
+def atualizar_espelho(engine, tabela):
+    """
+    Regrava o espelho Arrow da tabela com o conteúdo confirmado no banco e a versão correspondente.
+    Deve ser chamada depois do commit da gravação. Se a versão mudar durante a leitura (outra
+    gravação confirmada no meio), a tabela é lida de novo, para que dados e versão sejam do mesmo estado;
+    se continuar mudando, o arquivo fica marcado com a versão anterior e é refeito na próxima leitura.
+    Não faz nada se o pyarrow não estiver instalado.
+    """
+    if not ESPELHO_DISPONIVEL or tabela not in TABELAS_ESPELHADAS:
+        return
+    with engine.connect() as connection:
+        for _ in range(TENTATIVAS_LEITURA):
+            versao = _ler_versao(connection, tabela)
+            df = pd.read_sql(text(f"SELECT * FROM {tabela}"), connection)
+            if _ler_versao(connection, tabela) == versao:
+                break
+    dados = pa.Table.from_pandas(df, preserve_index=False)
+    dados = dados.replace_schema_metadata({**(dados.schema.metadata or {}), b"versao": str(versao).encode()})
+
+    # Grava em arquivo temporário de nome único e renomeia, para que leituras concorrentes nunca vejam
+    # um arquivo parcial (sessões e o worker de ingestão são threads do mesmo processo)
+    os.makedirs(DIRETORIO_ESPELHO, exist_ok=True)
+    caminho = _caminho_espelho(tabela)
+    temporario = f"{caminho}.{uuid.uuid4().hex}.tmp"
+    try:
+        with pa.OSFile(temporario, "wb") as destino:
+            with pa.ipc.new_file(destino, dados.schema) as writer:
+                writer.write_table(dados)
+        os.replace(temporario, caminho)
+    finally:
+        if os.path.exists(temporario):
+            os.remove(temporario)
+
+@st.cache_data(max_entries=8, show_spinner=False)
+def _ler_espelho(tabela, versao, colunas, filtros, _engine):
+    """
+    Lê o espelho com projeção de colunas e filtros de igualdade. Fica em cache por versão dos dados.
+    """
+    if not ESPELHO_DISPONIVEL:
+        colunas_sql = ", ".join(f'"{coluna}"' for coluna in colunas) if colunas else "*"
+        sql = f"SELECT {colunas_sql} FROM {tabela}"
+        if filtros:
+            sql += " WHERE " + " AND ".join(f'"{coluna}" = :f{i}' for i, (coluna, _) in enumerate(filtros))
+        with _engine.connect() as connection:
+            return pd.read_sql(text(sql), connection, params={f"f{i}": valor for i, (_, valor) in enumerate(filtros)})
+
+    if _versao_espelho(tabela) != versao:
+        atualizar_espelho(_engine, tabela)
+
+    with pa.memory_map(_caminho_espelho(tabela)) as fonte:
+        dados = pa.ipc.open_file(fonte).read_all() # Sem cópia: os buffers apontam para o arquivo mapeado
+        for coluna, valor in filtros:
+            dados = dados.filter(pc.equal(dados[coluna], valor))
+        if colunas:
+            dados = dados.select(list(colunas))
+        return dados.to_pandas()
+
+def carregar_espelho(engine, tabela, colunas=None, filtros=None):
+    """
+    Retorna a tabela espelhada ('cdr') como DataFrame a partir do espelho Arrow,
+    lendo só as 'colunas' informadas e as linhas que atendem aos 'filtros' ({coluna: valor}).
+    """
+    if tabela not in TABELAS_ESPELHADAS:
+        raise ValueError(f"Tabela sem espelho colunar: {tabela}")
+    return _ler_espelho(tabela, obter_versao(engine, tabela), tuple(colunas) if colunas else None,
+                        tuple(sorted((filtros or {}).items())), engine)
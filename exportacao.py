@@ -0,0 +1,103 @@
+import io
+import json
+import hashlib
+import xlsxwriter
+import streamlit as st # Importado para usar st.cache_data, st.selectbox e st.download_button
+from instrumentacao import medir, pagina_atual # Tempo de serialização (PRODUCAO_INSTRUMENTACAO=1)
+
+# --- Exportação dos Dados das Páginas ---
+# O arquivo só é gerado quando o usuário clica em "Baixar" (o st.download_button recebe uma função),
+# e o resultado fica em cache por (página, filtros, versão dos dados, formato). Assim, mudar um
+# filtro não gera mais uma planilha Excel a cada renderização.
+
+# O Parquet depende do pyarrow; sem ele, o formato simplesmente não é oferecido
+try:
+    import pyarrow # noqa: F401
+    PARQUET_DISPONIVEL = True
+except ImportError:
+    PARQUET_DISPONIVEL = False
+
+FORMATOS_EXPORTACAO = {
+    "Excel": ("xlsx", "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"),
+    "CSV": ("csv", "text/csv"),
+    "Parquet": ("parquet", "application/vnd.apache.parquet")
+}
+
+def formatos_disponiveis():
+    """
+    Retorna os nomes dos formatos de exportação disponíveis neste ambiente.
+    """
+    return [formato for formato in FORMATOS_EXPORTACAO if formato != "Parquet" or PARQUET_DISPONIVEL]
+
+def hash_filtros(filtros):
+    """
+    Gera um resumo curto e estável das seleções de filtros (dicionário de listas) para a chave do cache.
+    """
+    normalizado = {chave: sorted(map(str, valores)) if isinstance(valores, (list, tuple, set)) else str(valores)
+                   for chave, valores in filtros.items()}
+    return hashlib.sha256(json.dumps(normalizado, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()[:16]
+
+def gerar_excel(df, colunas_percentual=()):
+    """
+    Gera a planilha Excel com o xlsxwriter em modo 'constant_memory', gravando linha a linha
+    (o modo exige gravação em ordem de linha). As colunas de 'colunas_percentual' recebem o formato 0.00%.
+    """
+    output = io.BytesIO()
+    workbook = xlsxwriter.Workbook(output, {'constant_memory': True})
+    worksheet = workbook.add_worksheet('Dados')
+    percent_format = workbook.add_format({'num_format': '0.00%', 'align': 'center'})
+    header_format = workbook.add_format({'bold': True})
+
+    for idx, coluna in enumerate(df.columns):
+        if coluna in colunas_percentual:
+            worksheet.set_column(idx, idx, None, percent_format)
+    worksheet.write_row(0, 0, [str(coluna) for coluna in df.columns], header_format)
+
+    valores = df.astype(object).where(df.notna(), None)
+    for linha, registro in enumerate(valores.itertuples(index=False, name=None), start=1):
+        worksheet.write_row(linha, 0, registro)
+    workbook.close()
+    return output.getvalue()
+
+def gerar_arquivo(df, formato, colunas_percentual=()):
+    """
+    Serializa o DataFrame no formato pedido ('Excel', 'CSV' ou 'Parquet') e retorna os bytes.
+    """
+    if formato == "Excel":
+        return gerar_excel(df, colunas_percentual)
+    if formato == "CSV":
+        # Separador ';' e vírgula decimal, como o Excel em português espera
+        return df.to_csv(index=False, sep=';', decimal=',').encode('utf-8-sig')
+    if formato == "Parquet":
+        return df.to_parquet(index=False)
+    raise ValueError(f"Formato de exportação não suportado: {formato}")
+
+@st.cache_data(max_entries=16, show_spinner=False)
+def _gerar_exportacao(pagina, filtros, versao, formato, _df, colunas_percentual):
+    """
+    Gera o arquivo de exportação. O DataFrame não entra na chave do cache: ele é determinado
+    pela página, pelos filtros e pela versão dos dados.
+    """
+    return gerar_arquivo(_df, formato, colunas_percentual)
+
+def botao_exportacao(df, pagina, filtros, versao, nome_arquivo, colunas_percentual=()):
+    """
+    Exibe a escolha de formato e o botão de download. O arquivo só é gerado no clique.
+    'nome_arquivo' é o nome sem extensão; 'filtros' é o dicionário das seleções da página.
+    """
+    formato = st.selectbox("Formato de exportação", formatos_disponiveis(), key=f"exportacao_formato_{pagina}")
+    extensao, mime = FORMATOS_EXPORTACAO[formato]
+    chave_filtros = hash_filtros(filtros)
+    pagina_medicoes = pagina_atual() # O arquivo é gerado no clique, fora da execução da página
+
+    def _gerar():
+        with medir(f"exportação {formato}", pagina_medicoes):
+            return _gerar_exportacao(pagina, chave_filtros, versao, formato, df, tuple(colunas_percentual))
+
+    st.download_button(
+        label=f"📥 Baixar como {formato}",
+        data=_gerar,
+        file_name=f"{nome_arquivo}.{extensao}",
+        mime=mime,
+        key=f"exportacao_{pagina}"
+    )
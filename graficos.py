@@ -0,0 +1,86 @@
+import os
+import threading
+from collections import OrderedDict
+import plotly.io as pio
+import streamlit as st # Importado para usar st.cache_resource
+from exportacao import hash_filtros
+
+# --- Cache dos Gráficos Plotly ---
+# Os gráficos das páginas são guardados já serializados (JSON do Plotly) sob a chave
+# (página, filtros normalizados, versão dos dados). Uma renderização causada por outro widget,
+# ou a volta a uma seleção já vista, reconstrói a figura a partir do JSON em vez de refazer a
+# agregação e o px.*. O cache é único por processo, com descarte do menos usado (LRU) quando
+# passa do limite de bytes (GRAFICOS_CACHE_MB) ou de entradas.
+
+LIMITE_CACHE_GRAFICOS_BYTES = int(float(os.environ.get("GRAFICOS_CACHE_MB", "64")) * 1024 * 1024)
+MAXIMO_GRAFICOS = 256
+
+class CacheGraficos:
+    """
+    Dicionário LRU de JSONs de figuras, limitado em bytes e em quantidade de entradas.
+    """
+    def __init__(self, limite_bytes=LIMITE_CACHE_GRAFICOS_BYTES, maximo_entradas=MAXIMO_GRAFICOS):
+        self.limite_bytes = limite_bytes
+        self.maximo_entradas = maximo_entradas
+        self._entradas = OrderedDict()
+        self._trava = threading.Lock()
+        self.bytes = 0
+        self.acertos = 0
+        self.falhas = 0
+
+    def obter(self, chave):
+        with self._trava:
+            figura_json = self._entradas.get(chave)
+            if figura_json is None:
+                self.falhas += 1
+                return None
+            self._entradas.move_to_end(chave)
+            self.acertos += 1
+            return figura_json
+
+    def guardar(self, chave, figura_json):
+        tamanho = len(figura_json)
+        if tamanho > self.limite_bytes:
+            return # Uma figura maior que o limite inteiro não é guardada
+        with self._trava:
+            anterior = self._entradas.pop(chave, None)
+            if anterior is not None:
+                self.bytes -= len(anterior)
+            self._entradas[chave] = figura_json
+            self.bytes += tamanho
+            while self.bytes > self.limite_bytes or len(self._entradas) > self.maximo_entradas:
+                _, descartada = self._entradas.popitem(last=False)
+                self.bytes -= len(descartada)
+
+    def limpar(self):
+        with self._trava:
+            self._entradas.clear()
+            self.bytes = 0
+
+    def estatisticas(self):
+        with self._trava:
+            return {"entradas": len(self._entradas), "bytes": self.bytes, "limite_bytes": self.limite_bytes,
+                    "acertos": self.acertos, "falhas": self.falhas}
+
+@st.cache_resource(show_spinner=False)
+def obter_cache_graficos():
+    """
+    Retorna o cache de gráficos do processo (compartilhado entre as sessões).
+    """
+    return CacheGraficos()
+
+def figura_em_cache(pagina, filtros, versao, construir):
+    """
+    Retorna a figura da página para os filtros ({nome: seleção}) e a versão dos dados informados.
+    Se ela não estiver no cache, chama construir() (que deve fazer a agregação e montar a figura),
+    guarda o JSON e devolve a figura montada. construir() pode retornar None (nada a exibir).
+    """
+    cache = obter_cache_graficos()
+    chave = (pagina, hash_filtros(filtros), versao)
+    figura_json = cache.obter(chave)
+    if figura_json is not None:
+        return pio.from_json(figura_json)
+    figura = construir()
+    if figura is not None:
+        cache.guardar(chave, figura.to_json())
+    return figura
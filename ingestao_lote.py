@@ -0,0 +1,113 @@
+import argparse
+import glob
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+import pandas as pd
+
+from uploads import engine, ler_planilha_siresp, preparar_producao, gravar_producao, AVISO_PERIODO_NAO_RECONHECIDO
+from uploads import hash_arquivo, ingestao_registrada, registrar_ingestao, periodo_producao # Registro no 'ingest_log'
+from dados import create_versao_table
+from especialidades import create_regras_table, carregar_regras
+
+# Padrão dos arquivos mensais do SIRESP dentro de uma pasta (ex.: dados_xlsx/2024_abril.xlsx)
+PADRAO_ARQUIVOS_MENSAIS = "[0-9][0-9][0-9][0-9]_*.xlsx"
+
+def listar_arquivos(caminhos):
+    """
+    Expande pastas (arquivos no padrão AAAA_mes.xlsx) e padrões glob em uma lista ordenada de arquivos.
+    """
+    arquivos = set()
+    for caminho in caminhos:
+        if os.path.isdir(caminho):
+            arquivos.update(glob.glob(os.path.join(caminho, PADRAO_ARQUIVOS_MENSAIS)))
+        else:
+            arquivos.update(glob.glob(caminho))
+    return sorted(arquivos)
+
+def _ler_arquivo(caminho):
+    """
+    Lê e prepara um arquivo (executada nos processos do pool). Retorna também as linhas lidas,
+    o período detectado e o tempo de leitura, para o 'ingest_log'.
+    """
+    inicio = time.perf_counter()
+    df, tipo_consulta, mes_producao, ano_producao, avisos = ler_planilha_siresp(caminho, caminho)
+    linhas_lidas = len(df)
+    df = preparar_producao(df, tipo_consulta, mes_producao, ano_producao)
+    periodo = periodo_producao(mes_producao, ano_producao)
+    if periodo is None:
+        avisos.append(AVISO_PERIODO_NAO_RECONHECIDO)
+    return caminho, df, avisos, linhas_lidas, periodo, time.perf_counter() - inicio
+
+def ingerir_lote(caminhos, workers=None):
+    """
+    Lê as planilhas em paralelo e grava todas as linhas em uma única transação, registrando cada
+    arquivo no 'ingest_log'. Arquivos cujo conteúdo já consta no registro não são lidos de novo.
+    Se qualquer arquivo falhar, nada é gravado. Retorna a lista de (arquivo, linhas, avisos).
+    """
+    arquivos = listar_arquivos(caminhos)
+    if not arquivos:
+        return []
+
+    hashes = {caminho: hash_arquivo(caminho) for caminho in arquivos}
+    ignorados = {}
+    with engine.connect() as connection:
+        for caminho, (sha256, _) in hashes.items():
+            registro = ingestao_registrada(connection, 'siresp', sha256)
+            if registro:
+                ignorados[caminho] = registro
+    novos = [caminho for caminho in arquivos if caminho not in ignorados]
+
+    resultados = []
+    if novos:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            resultados = list(executor.map(_ler_arquivo, novos))
+
+        create_versao_table(engine)
+        create_regras_table(engine)
+        regras = carregar_regras(engine)
+        df = pd.concat([df_arquivo for _, df_arquivo, *_ in resultados], ignore_index=True)
+        inicio = time.perf_counter()
+        with engine.begin() as connection:
+            gravar_producao(connection, df, regras)
+            # O tempo de gravação do lote é dividido entre os arquivos pela quantidade de linhas
+            segundos_gravacao = time.perf_counter() - inicio
+            for caminho, df_arquivo, _, linhas_lidas, periodo, segundos_leitura in resultados:
+                sha256, tamanho = hashes[caminho]
+                registrar_ingestao(connection, 'siresp', sha256, os.path.basename(caminho), tamanho, linhas_lidas,
+                                   len(df_arquivo), segundos_leitura, segundos_gravacao * len(df_arquivo) / max(len(df), 1),
+                                   periodo)
+
+    lidos = {caminho: (len(df_arquivo), avisos) for caminho, df_arquivo, avisos, *_ in resultados}
+    return [(caminho, *lidos[caminho]) if caminho in lidos else
+            (caminho, 0, [f"Já ingerido em {ignorados[caminho]['registrado_em']}; arquivo ignorado."])
+            for caminho in arquivos]
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Ingestão em lote das planilhas mensais de produção (SIRESP).")
+    parser.add_argument("caminhos", nargs="+", help="Pastas (arquivos AAAA_mes.xlsx) ou padrões glob, ex.: 'dados_xlsx/2025_*.xlsx'")
+    parser.add_argument("--workers", type=int, default=None, help="Número de processos de leitura (padrão: número de CPUs)")
+    args = parser.parse_args(argv)
+
+    inicio = time.perf_counter()
+    try:
+        resultados = ingerir_lote(args.caminhos, args.workers)
+    except Exception as e:
+        print(f"Erro na ingestão em lote; nenhum dado foi gravado: {e}")
+        return 1
+
+    if not resultados:
+        print("Nenhum arquivo encontrado.")
+        return 1
+
+    for caminho, linhas, avisos in resultados:
+        print(f"{caminho}: {linhas} linha(s)")
+        for aviso in avisos:
+            print(f"  Aviso: {aviso}")
+    total = sum(linhas for _, linhas, _ in resultados)
+    print(f"\n{len(resultados)} arquivo(s), {total} linha(s) gravadas em {time.perf_counter() - inicio:.2f}s.")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,100 @@
+import os
+import json
+import time
+import threading
+import contextlib
+import contextvars
+from collections import deque
+from datetime import datetime
+import pandas as pd
+
+# --- Instrumentação das Etapas de Execução ---
+# Mede o tempo de cada etapa de uma renderização ou ingestão (leitura SQL, normalização,
+# agregação, montagem dos gráficos Plotly, exportação, bcrypt...) e guarda as medições num
+# buffer circular em memória, compartilhado pelo processo do servidor. A página Desempenho
+# (apenas 'admin') resume as medições por página e etapa e permite exportá-las.
+# Fica desligada por padrão: ligue com PRODUCAO_INSTRUMENTACAO=1. Desligada, cada medição
+# custa uma chamada de função.
+
+INSTRUMENTACAO_ATIVA = os.environ.get("PRODUCAO_INSTRUMENTACAO", "").strip().lower() in ("1", "true", "sim")
+MAXIMO_MEDICOES = int(os.environ.get("PRODUCAO_INSTRUMENTACAO_MAXIMO", "20000")) # Medições mais antigas são descartadas
+
+_medicoes = deque(maxlen=MAXIMO_MEDICOES)
+_trava = threading.Lock()
+_pagina_atual = contextvars.ContextVar("pagina_atual", default="Segundo plano") # Ingestões no worker não têm página
+_SEM_MEDICAO = contextlib.nullcontext()
+
+def definir_pagina(pagina):
+    """
+    Define a página à qual as medições seguintes (na execução atual do script) são atribuídas.
+    """
+    _pagina_atual.set(pagina)
+
+def pagina_atual():
+    return _pagina_atual.get()
+
+def registrar_medicao(etapa, segundos, pagina=None):
+    """
+    Acrescenta uma medição ao buffer (não faz nada com a instrumentação desligada).
+    """
+    if not INSTRUMENTACAO_ATIVA:
+        return
+    registro = {"data": datetime.now().isoformat(timespec='milliseconds'), "pagina": pagina or _pagina_atual.get(),
+                "etapa": etapa, "ms": round(segundos * 1000, 3)}
+    with _trava:
+        _medicoes.append(registro)
+
+@contextlib.contextmanager
+def _medir(etapa, pagina):
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        registrar_medicao(etapa, time.perf_counter() - inicio, pagina)
+
+def medir(etapa, pagina=None):
+    """
+    Context manager que mede o bloco como a etapa informada: with medir("leitura SQL"): ...
+    Sem 'pagina', a medição é atribuída à página da execução atual (definir_pagina).
+    """
+    return _medir(etapa, pagina) if INSTRUMENTACAO_ATIVA else _SEM_MEDICAO
+
+def medicoes():
+    """
+    Retorna as medições guardadas como DataFrame (data, página, etapa, ms).
+    """
+    with _trava:
+        registros = list(_medicoes)
+    return pd.DataFrame(registros, columns=["data", "pagina", "etapa", "ms"])
+
+def resumo_medicoes(df=None):
+    """
+    Resume as medições por página e etapa: quantidade, p50, p95, máximo e total (ms).
+    """
+    df = medicoes() if df is None else df
+    if df.empty:
+        return pd.DataFrame(columns=["pagina", "etapa", "execucoes", "p50_ms", "p95_ms", "max_ms", "total_ms"])
+    grupos = df.groupby(["pagina", "etapa"])["ms"]
+    resumo = pd.DataFrame({
+        "execucoes": grupos.size(),
+        "p50_ms": grupos.quantile(0.5),
+        "p95_ms": grupos.quantile(0.95),
+        "max_ms": grupos.max(),
+        "total_ms": grupos.sum()
+    }).round(3).reset_index()
+    return resumo.sort_values(["pagina", "p95_ms"], ascending=[True, False], ignore_index=True)
+
+def exportar_medicoes(formato):
+    """
+    Serializa as medições brutas em 'JSON' ou 'CSV' e retorna os bytes.
+    """
+    df = medicoes()
+    if formato == "JSON":
+        return json.dumps(df.to_dict(orient="records"), ensure_ascii=False, indent=1).encode("utf-8")
+    if formato == "CSV":
+        return df.to_csv(index=False, sep=';', decimal=',').encode('utf-8-sig')
+    raise ValueError(f"Formato de exportação não suportado: {formato}")
+
+def limpar_medicoes():
+    with _trava:
+        _medicoes.clear()
@@ -0,0 +1,208 @@
+import os
+import re
+import json
+import uuid
+import hashlib
+import unicodedata
+import numpy as np
+import pandas as pd
+import streamlit as st # Importado para usar st.cache_data e st.error
+from sqlalchemy import text
+
+# --- GeoJSON Reduzido para o Mapa de Municípios ---
+# O arquivo completo traz os 645 municípios de São Paulo (~1,9 MB) e seria embutido inteiro em
+# cada renderização do mapa. Aqui ficam apenas os municípios presentes nos dados (pelo código IBGE), com os
+# polígonos simplificados (Douglas-Peucker) e as coordenadas arredondadas. O resultado é
+# gravado em disco por (conjunto de códigos, tolerância, arquivo de origem), de modo que o
+# pré-processamento só roda na primeira vez que uma combinação aparece.
+
+ARQUIVO_GEOJSON = os.path.join(os.path.dirname(os.path.abspath(__file__)), "geojs-35-mun.json") # Ao lado do código, qualquer que seja o diretório atual
+DIRETORIO_CACHE_GEOJSON = os.environ.get("GEOJSON_CACHE_DIR", ".cache_geojson")
+TOLERANCIA_PADRAO = float(os.environ.get("GEOJSON_TOLERANCIA", "0.005")) # Em graus (~500 m)
+CASAS_DECIMAIS = 5 # ~1 m de precisão, suficiente para o mapa
+
+def _simplificar_linha(pontos, tolerancia):
+    """
+    Simplifica uma sequência de pontos (array N×2) pelo algoritmo de Douglas-Peucker.
+    Retorna a máscara booleana dos pontos mantidos. Implementação iterativa, vetorizada por segmento.
+    """
+    manter = np.zeros(len(pontos), dtype=bool)
+    manter[0] = manter[-1] = True
+    pilha = [(0, len(pontos) - 1)]
+    while pilha:
+        inicio, fim = pilha.pop()
+        if fim - inicio < 2:
+            continue
+        a, b = pontos[inicio], pontos[fim]
+        trecho = pontos[inicio + 1:fim]
+        segmento = b - a
+        comprimento = np.hypot(*segmento)
+        if comprimento == 0:
+            # Anel fechado (início = fim): usa a distância ao ponto inicial
+            distancias = np.hypot(*(trecho - a).T)
+        else:
+            distancias = np.abs(segmento[0] * (trecho[:, 1] - a[1]) - segmento[1] * (trecho[:, 0] - a[0])) / comprimento
+        indice = int(np.argmax(distancias))
+        if distancias[indice] > tolerancia:
+            meio = inicio + 1 + indice
+            manter[meio] = True
+            pilha.append((inicio, meio))
+            pilha.append((meio, fim))
+    return manter
+
+def simplificar_anel(coordenadas, tolerancia):
+    """
+    Simplifica um anel de polígono, mantendo-o fechado e com pelo menos 4 pontos.
+    """
+    pontos = np.asarray(coordenadas, dtype=float)[:, :2]
+    if len(pontos) <= 4 or tolerancia <= 0:
+        return np.round(pontos, CASAS_DECIMAIS).tolist()
+    simplificado = pontos[_simplificar_linha(pontos, tolerancia)]
+    if len(simplificado) < 4:
+        return np.round(pontos, CASAS_DECIMAIS).tolist()
+    return np.round(simplificado, CASAS_DECIMAIS).tolist()
+
+def simplificar_geometria(geometria, tolerancia):
+    """
+    Simplifica geometrias Polygon e MultiPolygon; outros tipos são devolvidos sem alteração.
+    """
+    if geometria["type"] == "Polygon":
+        coordenadas = [simplificar_anel(anel, tolerancia) for anel in geometria["coordinates"]]
+    elif geometria["type"] == "MultiPolygon":
+        coordenadas = [[simplificar_anel(anel, tolerancia) for anel in poligono] for poligono in geometria["coordinates"]]
+    else:
+        return geometria
+    return {"type": geometria["type"], "coordinates": coordenadas}
+
+def reduzir_geojson(geojson, codigos, tolerancia=TOLERANCIA_PADRAO):
+    """
+    Retorna um novo FeatureCollection apenas com os municípios cujos códigos IBGE (propriedade 'id'
+    do GeoJSON) foram informados, com os polígonos simplificados pela tolerância dada.
+    """
+    codigos = {str(codigo) for codigo in codigos}
+    return {
+        "type": "FeatureCollection",
+        "features": [
+            {"type": "Feature", "properties": feature["properties"],
+             "geometry": simplificar_geometria(feature["geometry"], tolerancia)}
+            for feature in geojson["features"]
+            if str(feature["properties"].get("id")) in codigos
+        ]
+    }
+
+def _caminho_cache(path, codigos, tolerancia):
+    """
+    Monta o nome do arquivo em cache a partir do conjunto de códigos IBGE, da tolerância e
+    do tamanho/data de modificação do GeoJSON de origem.
+    """
+    origem = os.stat(path)
+    chave = json.dumps([os.path.abspath(path), origem.st_size, origem.st_mtime_ns, tolerancia, sorted(codigos)],
+                       ensure_ascii=False)
+    resumo = hashlib.sha256(chave.encode("utf-8")).hexdigest()[:16]
+    return os.path.join(DIRETORIO_CACHE_GEOJSON, f"{os.path.splitext(os.path.basename(path))[0]}-{resumo}.json")
+
+@st.cache_data(max_entries=8, show_spinner=False)
+def _geojson_municipios(path, codigos, tolerancia):
+    """
+    Lê o GeoJSON reduzido do cache em disco ou o gera a partir do arquivo completo.
+    Também fica em cache na memória do processo.
+    """
+    caminho_cache = _caminho_cache(path, codigos, tolerancia)
+    if os.path.exists(caminho_cache):
+        with open(caminho_cache, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    with open(path, "r", encoding="utf-8") as f:
+        reduzido = reduzir_geojson(json.load(f), codigos, tolerancia)
+
+    # Grava em arquivo temporário de nome único e renomeia, para que leituras concorrentes nunca vejam
+    # um arquivo parcial (as sessões são threads do mesmo processo)
+    os.makedirs(DIRETORIO_CACHE_GEOJSON, exist_ok=True)
+    temporario = f"{caminho_cache}.{uuid.uuid4().hex}.tmp"
+    try:
+        with open(temporario, "w", encoding="utf-8") as f:
+            json.dump(reduzido, f, ensure_ascii=False, separators=(",", ":"))
+        os.replace(temporario, caminho_cache)
+    finally:
+        if os.path.exists(temporario):
+            os.remove(temporario)
+    return reduzido
+
+def geojson_municipios(path, codigos, tolerancia=TOLERANCIA_PADRAO):
+    """
+    Retorna o GeoJSON apenas com os municípios dos códigos IBGE informados e polígonos simplificados,
+    ou None em caso de erro (a mensagem é exibida com st.error).
+    """
+    try:
+        return _geojson_municipios(path, tuple(sorted({str(codigo) for codigo in codigos})), float(tolerancia))
+    except FileNotFoundError:
+        st.error(f"❌ Erro: O arquivo '{path}' não foi encontrado. Por favor, certifique-se de que ele está no mesmo diretório do seu aplicativo.")
+        return None
+    except json.JSONDecodeError:
+        st.error(f"❌ Erro: O arquivo '{path}' não é um JSON válido ou está corrompido.")
+        return None
+    except Exception as e:
+        st.error(f"❌ Erro inesperado ao carregar o GeoJSON: {e}")
+        return None
+
+# --- Chave Normalizada de Municípios (junção CDR × GeoJSON) ---
+# Os nomes do CDR chegam com grafias próprias (acentos, maiúsculas, hífens, apóstrofos). A tabela
+# 'municipios' guarda, para cada município do GeoJSON, a chave sem acentos nem pontuação e o
+# código IBGE; a ingestão do CDR grava o código em cada linha e o mapa junta pelo código.
+
+# Grafias que diferem do nome no GeoJSON além de acentos, maiúsculas e pontuação
+APELIDOS_MUNICIPIOS = {
+    "SAO LUIZ DO PARAITINGA": "SAO LUIS DO PARAITINGA",
+    "EMBU DAS ARTES": "EMBU"
+}
+
+def chave_municipio(nome):
+    """
+    Gera a chave de comparação de um nome de município: sem acentos, em maiúsculas e com
+    hífens, apóstrofos e espaços repetidos reduzidos a um espaço (ex.: "Estrela d'Oeste" -> "ESTRELA D OESTE").
+    """
+    if nome is None or pd.isna(nome):
+        return None
+    texto = unicodedata.normalize('NFKD', str(nome)).encode('ascii', 'ignore').decode('ascii')
+    texto = re.sub(r'[^A-Za-z0-9]+', ' ', texto).strip().upper()
+    return APELIDOS_MUNICIPIOS.get(texto, texto)
+
+def create_municipios_table(engine, path=ARQUIVO_GEOJSON):
+    """
+    Cria a tabela 'municipios' (chave normalizada -> código IBGE) se ela não existir e a popula
+    a partir do GeoJSON na primeira execução. Sem o arquivo, levanta FileNotFoundError: uma tabela
+    vazia deixaria o CDR sem código IBGE (e o mapa vazio) sem nenhum aviso.
+    """
+    with engine.connect() as connection:
+        connection.execute(text("""
+            CREATE TABLE IF NOT EXISTS municipios (
+                chave TEXT PRIMARY KEY,
+                codigo_ibge INTEGER NOT NULL,
+                nome TEXT NOT NULL
+            )
+        """))
+        count = connection.execute(text("SELECT COUNT(*) FROM municipios")).scalar()
+        if count == 0:
+            if not os.path.exists(path):
+                raise FileNotFoundError(f"Arquivo GeoJSON dos municípios não encontrado: {path}")
+            with open(path, "r", encoding="utf-8") as f:
+                features = json.load(f)["features"]
+            connection.execute(text("INSERT OR IGNORE INTO municipios (chave, codigo_ibge, nome) VALUES (:chave, :codigo, :nome)"),
+                               [{"chave": chave_municipio(feature["properties"]["name"]),
+                                 "codigo": int(feature["properties"]["id"]),
+                                 "nome": feature["properties"]["name"]} for feature in features])
+        connection.commit()
+
+def carregar_chaves_municipios(connection):
+    """
+    Retorna o dicionário {chave normalizada: código IBGE} da tabela 'municipios'.
+    """
+    return {row[0]: row[1] for row in connection.execute(text("SELECT chave, codigo_ibge FROM municipios"))}
+
+def codigos_ibge(nomes, chaves):
+    """
+    Converte uma Series de nomes de municípios em códigos IBGE (Int64, nulo quando não encontrado).
+    Cada nome distinto é resolvido uma única vez.
+    """
+    mapa = {nome: chaves.get(chave_municipio(nome)) for nome in nomes.dropna().unique()}
+    return nomes.map(mapa).astype('Int64')
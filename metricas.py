@@ -0,0 +1,118 @@
+import numpy as np
+import pandas as pd
+
+# --- Indicadores (KPIs) de Produção ---
+# Todos os indicadores são calculados como operações vetorizadas sobre colunas inteiras e
+# retornados como frações (0,25 = 25%). Quando o denominador é zero ou nulo, o indicador vale 0.
+
+def _razao(numerador, denominador):
+    """
+    Divide duas colunas elemento a elemento, retornando 0 onde o denominador é zero ou nulo.
+    """
+    numerador = pd.to_numeric(pd.Series(numerador), errors='coerce').to_numpy(dtype=float, na_value=np.nan)
+    denominador = pd.to_numeric(pd.Series(denominador), errors='coerce').to_numpy(dtype=float, na_value=np.nan)
+    valido = (denominador > 0) & ~np.isnan(numerador)
+    return np.divide(numerador, denominador, out=np.zeros_like(numerador), where=valido)
+
+def calcular_absenteismo(agendados, realizados):
+    """Absenteísmo = 1 - Realizados / Agendados."""
+    agendados = np.asarray(agendados, dtype=float)
+    return np.where(np.nan_to_num(agendados) > 0, 1 - _razao(realizados, agendados), 0.0)
+
+def calcular_ocupacao(agendados, oferta):
+    """Ocupação da agenda = Agendados / Oferta."""
+    return _razao(agendados, oferta)
+
+def calcular_taxa_realizacao(realizados, oferta):
+    """Taxa de realização = Realizados / Oferta."""
+    return _razao(realizados, oferta)
+
+def adicionar_kpis(df):
+    """
+    Adiciona ao DataFrame agregado as colunas 'Absenteísmo', 'Ocupação' e 'Taxa de Realização',
+    conforme as colunas de origem (Oferta, Agendados, Realizados) estiverem presentes.
+    """
+    if {'Agendados', 'Realizados'} <= set(df.columns):
+        df['Absenteísmo'] = calcular_absenteismo(df['Agendados'], df['Realizados'])
+    if {'Agendados', 'Oferta'} <= set(df.columns):
+        df['Ocupação'] = calcular_ocupacao(df['Agendados'], df['Oferta'])
+    if {'Realizados', 'Oferta'} <= set(df.columns):
+        df['Taxa de Realização'] = calcular_taxa_realizacao(df['Realizados'], df['Oferta'])
+    return df
+
+def formatar_percentual(fracao):
+    """
+    Formata uma coluna de frações como texto percentual com vírgula decimal (ex.: '12,34%').
+    """
+    return (pd.Series(fracao) * 100).round(2).astype(str).str.replace('.', ',', regex=False) + '%'
+
+def formatar_moeda(valores):
+    """
+    Formata uma coluna de valores como texto em reais (ex.: 'R$ 1.234,56'); valores vazios ficam em branco.
+    """
+    valores = pd.Series(valores, dtype=float)
+    texto = valores.map(lambda valor: f"{valor:,.2f}").str.translate(str.maketrans(',.', '.,'))
+    return ('R$ ' + texto).where(valores.notna(), '')
+
+# --- Séries Temporais de Absenteísmo ---
+# As séries são montadas sobre um índice mensal (pd.PeriodIndex) completo, com uma coluna por
+# especialidade: meses sem dados ficam vazios, de modo que as janelas móveis e a comparação
+# com o mesmo mês do ano anterior respeitam o calendário e não a posição das linhas.
+
+COLUNAS_TENDENCIAS = ['Especialidade_Normalizada', 'Periodo', 'Ano_Num', 'Mes_Num', 'Agendados', 'Realizados',
+                      'Absenteismo', 'Absenteismo_Media_3m', 'Absenteismo_Media_12m',
+                      'Absenteismo_Variacao_Anual', 'Absenteismo_Base_Sazonal']
+
+def _absenteismo_series(agendados, realizados):
+    """
+    Absenteísmo elemento a elemento de duas tabelas (período × especialidade); vazio onde não há agendados
+    registrados no período e 0 onde há zero agendados, como em calcular_absenteismo.
+    """
+    valores = np.where(agendados.to_numpy() > 0, 1 - realizados.to_numpy() / np.where(agendados.to_numpy() > 0, agendados.to_numpy(), 1), 0.0)
+    return pd.DataFrame(valores, index=agendados.index, columns=agendados.columns).where(agendados.notna())
+
+def calcular_tendencias(df):
+    """
+    Calcula, por especialidade e mês, o absenteísmo e suas análises de tendência a partir das somas
+    mensais (colunas Especialidade_Normalizada, Ano_Num, Mes_Num, Agendados e Realizados):
+    - médias móveis de 3 e 12 meses (razão das somas de Realizados e Agendados na janela);
+    - variação em relação ao mesmo mês do ano anterior (diferença das frações);
+    - base sazonal: absenteísmo do mesmo mês do ano somando todos os anos da especialidade.
+    Linhas sem ano ou mês reconhecido (0) ficam de fora. 'Periodo' é um período mensal (period[M]).
+    """
+    df = df[(df['Ano_Num'] > 0) & (df['Mes_Num'] > 0)]
+    if df.empty:
+        return pd.DataFrame(columns=COLUNAS_TENDENCIAS)
+
+    periodos = pd.PeriodIndex.from_fields(year=df['Ano_Num'].to_numpy(), month=df['Mes_Num'].to_numpy(), freq='M')
+    df = df.assign(Periodo=periodos)
+    calendario = pd.period_range(periodos.min(), periodos.max(), freq='M', name='Periodo')
+
+    somas = df.groupby(['Periodo', 'Especialidade_Normalizada'])[['Agendados', 'Realizados']].sum().astype(float)
+    agendados = somas['Agendados'].unstack().reindex(calendario)
+    realizados = somas['Realizados'].unstack().reindex(calendario)
+    absenteismo = _absenteismo_series(agendados, realizados)
+
+    analises = {'Agendados': agendados, 'Realizados': realizados, 'Absenteismo': absenteismo}
+    for meses, nome in [(3, 'Absenteismo_Media_3m'), (12, 'Absenteismo_Media_12m')]:
+        analises[nome] = _absenteismo_series(agendados.rolling(meses, min_periods=1).sum(),
+                                             realizados.rolling(meses, min_periods=1).sum()).where(agendados.notna())
+    analises['Absenteismo_Variacao_Anual'] = absenteismo - absenteismo.shift(12) # O índice é mensal e completo
+    mes_do_ano = calendario.month
+    analises['Absenteismo_Base_Sazonal'] = _absenteismo_series(
+        agendados.groupby(mes_do_ano).transform('sum').set_axis(calendario),
+        realizados.groupby(mes_do_ano).transform('sum').set_axis(calendario)
+    ).where(agendados.notna())
+
+    # Volta ao formato longo (uma linha por especialidade e mês com dados), achatando as tabelas
+    # na mesma ordem (especialidade, período)
+    com_dados = agendados.notna().to_numpy().T.ravel()
+    longo = pd.DataFrame({
+        'Especialidade_Normalizada': np.repeat(agendados.columns.to_numpy(), len(calendario))[com_dados],
+        'Periodo': calendario[np.tile(np.arange(len(calendario)), len(agendados.columns))[com_dados]]
+    })
+    longo['Ano_Num'] = longo['Periodo'].dt.year
+    longo['Mes_Num'] = longo['Periodo'].dt.month
+    for nome, tabela in analises.items():
+        longo[nome] = tabela.to_numpy().T.ravel()[com_dados]
+    return longo[COLUNAS_TENDENCIAS]
@@ -0,0 +1,30 @@
+from uploads import engine, backfill_producao, backfill_cdr_municipios, create_ingest_log_table
+from dados import create_versao_table
+from especialidades import create_regras_table
+from mapa import create_municipios_table
+
+def migrar_producao():
+    """
+    Migra a tabela 'producao' para o esquema tipado (contagens inteiras e chave 'Especialidade_Id')
+    e preenche as colunas derivadas (especialidade normalizada, número do mês e ano inteiro)
+    das linhas gravadas antes de essas colunas existirem. O backfill também refaz as tabelas
+    derivadas, inclusive 'custos_mensais' num banco gravado antes dela.
+    """
+    create_versao_table(engine)
+    create_regras_table(engine)
+    create_ingest_log_table(engine)
+    linhas = backfill_producao(engine)
+    if linhas:
+        print(f"{linhas} linha(s) da tabela 'producao' atualizadas com as colunas derivadas.")
+    else:
+        print("Nenhuma linha da tabela 'producao' precisava ser atualizada.")
+
+    # Código IBGE dos municípios da tabela 'cdr' gravada antes de a coluna existir
+    create_municipios_table(engine)
+    nao_encontrados = backfill_cdr_municipios(engine)
+    if nao_encontrados:
+        print(f"Municípios do CDR não encontrados no GeoJSON: {', '.join(nao_encontrados)}")
+
+if __name__ == "__main__":
+    migrar_producao()
+    print("\nProcesso de migração da tabela de produção concluído.")
@@ -1,9 +1,9 @@
 import bcrypt
-from sqlalchemy import create_engine, text, inspect
+from sqlalchemy import text, inspect
+from banco import obter_engine
 
 # --- Configuração do Banco de Dados SQLite ---
-DATABASE_URL = 'sqlite:///producao.db'
-engine = create_engine(DATABASE_URL)
+engine = obter_engine() # Mesmo banco do aplicativo (variável de ambiente PRODUCAO_DB)
 
 def setup_database_and_users():
     """
@@ -0,0 +1,163 @@
+import io
+import uuid
+import hashlib
+import threading
+import pandas as pd
+from datetime import datetime
+from dataclasses import dataclass, field
+from concurrent.futures import ThreadPoolExecutor
+import streamlit as st # Importado para usar st.cache_resource, st.fragment e st.progress
+from uploads import ResultadoIngestao, exibir_resultado_ingestao, ingerir_siresp, ingerir_contratos, ingerir_cdr
+
+# --- Fila de Ingestão em Segundo Plano ---
+# A página Uploads apenas envia o arquivo para a fila e acompanha o andamento: a leitura e a
+# gravação rodam num worker fora do ciclo de execução do Streamlit, de modo que uma nova
+# renderização (mudar de página, clicar num filtro) não interrompe nem repete a ingestão.
+# A fila é única por processo do servidor e tem um só worker, pois o SQLite aceita um escritor por vez.
+
+INGESTORES = {
+    'siresp': ingerir_siresp,
+    'contratos': ingerir_contratos,
+    'cdr': ingerir_cdr
+}
+ESTADOS_ATIVOS = ('Na fila', 'Processando')
+MAXIMO_TAREFAS_CONCLUIDAS = 20 # Tarefas concluídas mantidas no histórico da página
+
+@dataclass
+class Tarefa:
+    """
+    Estado de uma ingestão enviada à fila. O resultado é preenchido quando o worker termina.
+    """
+    id: str
+    tipo: str
+    nome_arquivo: str
+    hash_conteudo: str
+    estado: str = 'Na fila' # 'Na fila', 'Processando', 'Concluída', 'Ignorada' (já no ingest_log) ou 'Falhou'
+    progresso: float = 0.0
+    etapa: str = "Aguardando na fila"
+    resultado: ResultadoIngestao = None
+    criada_em: datetime = field(default_factory=datetime.now)
+    concluida_em: datetime = None
+
+    @property
+    def ativa(self):
+        return self.estado in ESTADOS_ATIVOS
+
+class FilaIngestao:
+    """
+    Registro das tarefas de ingestão e worker que as executa, na ordem de envio.
+    """
+    def __init__(self):
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="ingestao")
+        self._trava = threading.Lock()
+        self._tarefas = {}
+
+    def enviar(self, tipo, nome_arquivo, conteudo, engine):
+        """
+        Envia o conteúdo (bytes) de um arquivo para ingestão e retorna a Tarefa.
+        Se o mesmo arquivo já estiver na fila, em processamento ou tiver sido gravado com sucesso,
+        retorna a tarefa existente em vez de processá-lo de novo.
+        """
+        if tipo not in INGESTORES:
+            raise ValueError(f"Tipo de ingestão desconhecido: {tipo}")
+        hash_conteudo = hashlib.sha256(conteudo).hexdigest()
+        with self._trava:
+            for tarefa in self._tarefas.values():
+                if tarefa.tipo == tipo and tarefa.hash_conteudo == hash_conteudo and tarefa.estado != 'Falhou':
+                    return tarefa
+            tarefa = Tarefa(uuid.uuid4().hex[:12], tipo, nome_arquivo, hash_conteudo)
+            self._tarefas[tarefa.id] = tarefa
+            self._descartar_antigas()
+        self._executor.submit(self._executar, tarefa, conteudo, engine)
+        return tarefa
+
+    def _executar(self, tarefa, conteudo, engine):
+        def progresso(fracao, etapa):
+            tarefa.progresso = min(max(fracao, 0.0), 1.0)
+            tarefa.etapa = etapa
+
+        tarefa.estado = 'Processando'
+        try:
+            resultado = INGESTORES[tarefa.tipo](io.BytesIO(conteudo), tarefa.nome_arquivo, engine, progresso)
+        except Exception as e: # As funções de ingestão já tratam os erros; isto cobre falhas inesperadas
+            resultado = ResultadoIngestao(tarefa.tipo, tarefa.nome_arquivo)
+            resultado.registrar_excecao("Erro inesperado na ingestão", e)
+        tarefa.resultado = resultado
+        tarefa.progresso = 1.0
+        tarefa.etapa = "Concluído"
+        tarefa.concluida_em = datetime.now()
+        tarefa.estado = 'Ignorada' if resultado.ignorado else 'Concluída' if resultado.sucesso else 'Falhou'
+
+    def _descartar_antigas(self):
+        concluidas = [tarefa.id for tarefa in self._tarefas.values() if not tarefa.ativa]
+        for id_tarefa in concluidas[:max(0, len(concluidas) - MAXIMO_TAREFAS_CONCLUIDAS)]:
+            del self._tarefas[id_tarefa]
+
+    def obter(self, id_tarefa):
+        with self._trava:
+            return self._tarefas.get(id_tarefa)
+
+    def listar(self, tipo=None):
+        """
+        Retorna as tarefas (opcionalmente de um só tipo), da mais recente para a mais antiga.
+        """
+        with self._trava:
+            tarefas = [tarefa for tarefa in self._tarefas.values() if tipo is None or tarefa.tipo == tipo]
+        return tarefas[::-1]
+
+@st.cache_resource(show_spinner=False)
+def obter_fila():
+    """
+    Retorna a fila de ingestão do processo (compartilhada entre as sessões).
+    """
+    return FilaIngestao()
+
+def enviar_tarefa(tipo, arquivo, engine):
+    """
+    Envia um arquivo enviado pela página (UploadedFile) para a fila de ingestão. Retorna a Tarefa.
+    """
+    return obter_fila().enviar(tipo, arquivo.name, arquivo.getvalue(), engine)
+
+def obter_tarefa(id_tarefa):
+    return obter_fila().obter(id_tarefa)
+
+def listar_tarefas(tipo=None):
+    return obter_fila().listar(tipo)
+
+# --- Acompanhamento na Página Uploads ---
+
+def acompanhar_tarefa(id_tarefa):
+    """
+    Exibe o andamento de uma tarefa. Enquanto ela estiver ativa, o trecho é atualizado a cada
+    segundo (st.fragment) sem renderizar a página inteira; ao terminar, a página é renderizada
+    de novo uma vez, para que os filtros e páginas vejam os dados novos, e o resultado é exibido.
+    """
+    tarefa = obter_tarefa(id_tarefa)
+    if tarefa is None:
+        return
+    ativa_na_renderizacao = tarefa.ativa
+
+    @st.fragment(run_every=1 if ativa_na_renderizacao else None)
+    def _painel():
+        atual = obter_tarefa(id_tarefa)
+        if atual is None:
+            return
+        if atual.ativa:
+            st.progress(atual.progresso, text=f"⏳ {atual.nome_arquivo} ({atual.estado.lower()}): {atual.etapa}")
+        elif ativa_na_renderizacao: # Terminou desde a última renderização completa
+            st.rerun()
+        else:
+            exibir_resultado_ingestao(atual.resultado)
+    _painel()
+
+def tabela_tarefas():
+    """
+    Retorna o histórico de tarefas do processo como DataFrame (para a página Uploads).
+    """
+    return pd.DataFrame([{
+        "Tarefa": tarefa.id, "Tipo": tarefa.tipo, "Arquivo": tarefa.nome_arquivo, "Estado": tarefa.estado,
+        "Progresso": f"{tarefa.progresso:.0%}",
+        "Linhas": tarefa.resultado.linhas if tarefa.resultado else None,
+        "Enviada em": tarefa.criada_em.strftime('%d/%m/%Y %H:%M:%S'),
+        "Concluída em": tarefa.concluida_em.strftime('%d/%m/%Y %H:%M:%S') if tarefa.concluida_em else ""
+    } for tarefa in listar_tarefas()])
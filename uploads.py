@@ -1,62 +1,203 @@
 import pandas as pd
 import openpyxl
-from io import BytesIO
 import os
+import re
+import csv
+import unicodedata
+import hashlib
+import time
+import traceback
+from dataclasses import dataclass, field
 import streamlit as st # Importado para usar st.warning, st.error, st.success
-from sqlalchemy import create_engine, text, inspect # Importado para usar text e inspect
+from sqlalchemy import text, inspect # Importado para usar text e inspect
 import json # Importar para carregar dados geojson
 import bcrypt # Importar bcrypt para criptografia de senha
+from dados import incrementar_versao, meses_ordem # Invalida os caches de leitura após novos uploads
+from especialidades import carregar_regras, normalizar_especialidades # Regras de normalização da tabela 'regras_especialidade'
+from especialidades import create_dim_especialidade_table, sincronizar_dim_especialidade, ids_especialidade # Chave inteira das especialidades
+from consultas import create_producao_indices, create_cdr_indices # Índices usados pelos filtros das páginas
+from cubo import atualizar_cubo, reconstruir_cubo # Cubo de produção mantido junto com os dados brutos
+from catalogo import atualizar_catalogo, reconstruir_catalogo # Opções dos filtros da barra lateral
+from custos import atualizar_custos, reconstruir_custos, especialidades_contratos # Contratos × Realizados por Centro de Custo
+from mapa import carregar_chaves_municipios, codigos_ibge # Código IBGE gravado em cada linha de CDR
+from banco import obter_engine
+from espelho import atualizar_espelho # Cópia colunar (Arrow) de 'cdr' lida pela página CDR
+from instrumentacao import medir, registrar_medicao # Tempos das etapas (PRODUCAO_INSTRUMENTACAO=1)
 
-# --- Configuração do Banco de Dados SQLite (movido para uploads.py) ---
-DATABASE_URL = 'sqlite:///producao.db'
-engine = create_engine(DATABASE_URL)
-
-# --- Funções Auxiliares para Normalização de Especialidades ---
-def normalizar_especialidade(nome):
-    """Normaliza nomes de especialidades para agrupamento."""
-    nome = str(nome).upper().strip()
-    if nome.startswith("CIRURGIA PLÁSTICA"):
-        return "Cirurgia Plástica"
-    elif nome.startswith("CIRURGIA GERAL"):
-        return "Cirurgia Geral"
-    elif nome.startswith("CIRURGIA VASCULAR"):
-        return "Cirurgia Vascular"
-    elif nome.startswith("CIRURGIA PEDIÁTRICA"):
-        return "Cirurgia Pediátrica"
-    elif nome.startswith("OFTALMOLOGIA"):
-        return "Oftalmologia"
-    elif nome.startswith("DERMATOLOGIA"):
-        return "Dermatologia"
-    elif nome.startswith("ANESTESIOLOGIA"):
-        return "Anestesiologia"
-    elif nome.startswith("CARDIOLOGIA"):
-        return "Cardiologia"
-    elif nome.startswith("COLOPROCTOLOGIA"):
-        return "Coloproctologia"
-    elif nome.startswith("GASTROCLÍNICA") or nome.startswith("GASTROENTEROLOGIA"):
-        return "Gastroenterologia"
-    elif nome.startswith("MASTOLOGIA"):
-        return "Mastologia"
-    elif nome.startswith("ORTOPEDIA"):
-        return "Ortopedia"
-    elif nome.startswith("OTORRINOLARINGOLOGIA"):
-        return "Otorrinolaringologia"
-    elif nome.startswith("UROLOGIA"):
-        return "Urologia"
-    elif nome.startswith("ENDOCRINOLOGIA"):
-        return "Endocrinologia"
-    elif nome.startswith("NEUROLOGIA PEDIÁTRICA"):
-        return "Neurologia Pediátrica"
-    elif nome.startswith("NEUROLOGIA"):
-        return "Neurologia Adulto"
-    elif nome.startswith("PNEUMOLOGIA PEDIÁTRICA"):
-        return "Pneumologia Pediátrica"
-    elif nome.startswith("PNEUMOLOGIA"):
-        return "Pneumologia"
-    elif nome.startswith("NEFROLOGIA"):
-        return "Nefrologia"
-    # Adicione outras regras conforme necessário ou retorne o próprio nome se não houver correspondência
-    return nome
+# --- Configuração do Banco de Dados SQLite ---
+# Engine único por processo, com WAL e PRAGMAs de desempenho; o caminho vem de PRODUCAO_DB (ver banco.py)
+engine = obter_engine()
+
+# --- Colunas Derivadas da Tabela de Produção ---
+# Calculadas no momento da ingestão (e pelo backfill das linhas antigas), para que as
+# páginas não precisem repetir o tratamento de texto a cada renderização.
+COLUNAS_DERIVADAS_PRODUCAO = {
+    'Especialidade_Normalizada': 'TEXT',
+    'Mes_Num': 'INTEGER',
+    'Ano_Num': 'INTEGER',
+    'Especialidade_Id': 'INTEGER'
+}
+
+def adicionar_colunas_derivadas(df, regras):
+    """
+    Adiciona ao DataFrame de produção a especialidade normalizada pelas regras informadas,
+    o número do mês (0 se não reconhecido) e o ano como inteiro (nulo se não reconhecido).
+    """
+    df['Especialidade_Normalizada'] = normalizar_especialidades(df['Especialidade'], regras)
+    numero_mes = {mes: i for i, mes in enumerate(meses_ordem, start=1)}
+    df['Mes_Num'] = df['Mes_Producao'].astype(str).str.lower().map(numero_mes).fillna(0).astype(int)
+    df['Ano_Num'] = pd.to_numeric(df['Ano_Producao'], errors='coerce').astype('Int64')
+    return df
+
+# Chave natural de uma linha de produção: o mesmo arquivo reenviado atualiza as linhas em vez de duplicá-las
+CHAVE_NATURAL_PRODUCAO = ['Tipo_Consulta', 'Ano_Producao', 'Mes_Producao', 'Especialidade']
+COLUNAS_PRODUCAO = ['Especialidade', 'Oferta', 'Agendados', 'Realizados', 'Tipo_Consulta', 'Mes_Producao', 'Ano_Producao',
+                    *COLUNAS_DERIVADAS_PRODUCAO]
+
+# --- Esquema Tipado da Tabela de Produção ---
+# Contagens inteiras, ano e mês como inteiros (Ano_Num/Mes_Num) e a especialidade como chave
+# inteira da dimensão 'dim_especialidade'. Bancos criados antes deste esquema (com 'Agendados'
+# FLOAT e sem 'Especialidade_Id') são migrados por reconstrução da tabela, preservando as linhas.
+TIPOS_PRODUCAO = {
+    'Especialidade': 'TEXT',
+    'Oferta': 'INTEGER',
+    'Agendados': 'INTEGER',
+    'Realizados': 'INTEGER',
+    'Tipo_Consulta': 'TEXT',
+    'Mes_Producao': 'TEXT',
+    'Ano_Producao': 'TEXT',
+    **COLUNAS_DERIVADAS_PRODUCAO
+}
+COLUNAS_CONTAGEM_PRODUCAO = ['Oferta', 'Agendados', 'Realizados']
+
+def _sql_tabela_producao(nome='producao'):
+    colunas = ",\n".join(f'            "{coluna}" {tipo}' for coluna, tipo in TIPOS_PRODUCAO.items())
+    return f"CREATE TABLE IF NOT EXISTS {nome} (\n{colunas}\n        )"
+
+def migrar_esquema_producao(connection):
+    """
+    Reconstrói a tabela 'producao' no esquema tipado se ela ainda estiver no formato antigo
+    (contagens FLOAT ou colunas derivadas ausentes). As contagens são arredondadas para inteiro
+    e as colunas ausentes ficam nulas até o backfill. Retorna True se houve migração.
+    """
+    colunas_existentes = {col['name']: str(col['type']).upper() for col in inspect(connection).get_columns('producao')}
+    if all(colunas_existentes.get(coluna) == tipo for coluna, tipo in TIPOS_PRODUCAO.items()):
+        return False
+
+    connection.execute(text("ALTER TABLE producao RENAME TO producao_antiga"))
+    connection.execute(text(_sql_tabela_producao()))
+    selecao = []
+    for coluna in TIPOS_PRODUCAO:
+        if coluna not in colunas_existentes:
+            selecao.append("NULL")
+        elif coluna in COLUNAS_CONTAGEM_PRODUCAO:
+            selecao.append(f'CAST(ROUND("{coluna}") AS INTEGER)')
+        else:
+            selecao.append(f'"{coluna}"')
+    colunas = ", ".join(f'"{coluna}"' for coluna in TIPOS_PRODUCAO)
+    connection.execute(text(f"INSERT INTO producao ({colunas}) SELECT {', '.join(selecao)} FROM producao_antiga"))
+    connection.execute(text("DROP TABLE producao_antiga"))
+    sincronizar_dim_especialidade(connection)
+    return True
+
+# Versões anteriores gravavam 'N/A' no Mês e no Ano de Produção não reconhecidos
+SQL_PERIODO_NAO_RECONHECIDO_NULO = """
+    UPDATE producao SET "Mes_Producao" = NULL, "Ano_Producao" = NULL
+    WHERE "Mes_Producao" = 'N/A' OR "Ano_Producao" = 'N/A'
+"""
+
+def garantir_tabela_producao(connection):
+    """
+    Cria a tabela 'producao' no esquema tipado se ela não existir (ou migra a tabela antiga),
+    cria o índice único da chave natural (removendo duplicatas antigas, mantendo a linha mais
+    recente) e os índices compostos usados pelos filtros.
+    """
+    create_dim_especialidade_table(connection)
+    connection.execute(text(_sql_tabela_producao()))
+    migrar_esquema_producao(connection)
+
+    inspector = inspect(connection)
+    if 'uq_producao_chave_natural' not in {indice['name'] for indice in inspector.get_indexes('producao')}:
+        colunas_chave = ", ".join(f'"{coluna}"' for coluna in CHAVE_NATURAL_PRODUCAO)
+        # Linhas sem período reconhecido ('N/A' nas versões antigas) ficam nulas e fora da deduplicação:
+        # vieram de arquivos diferentes e não são duplicatas umas das outras
+        connection.execute(text(SQL_PERIODO_NAO_RECONHECIDO_NULO))
+        connection.execute(text(f"""
+            DELETE FROM producao
+            WHERE "Mes_Producao" IS NOT NULL AND "Ano_Producao" IS NOT NULL
+              AND rowid NOT IN (SELECT MAX(rowid) FROM producao GROUP BY {colunas_chave})
+        """))
+        connection.execute(text(f"CREATE UNIQUE INDEX uq_producao_chave_natural ON producao ({colunas_chave})"))
+
+    create_producao_indices(connection)
+
+def producao_precisa_migracao(engine):
+    """
+    Indica se a tabela 'producao' foi gravada por uma versão anterior e precisa do backfill:
+    esquema antigo, índice da chave natural ausente, colunas derivadas vazias, linhas de total,
+    período 'N/A' ou cubo de produção vazio com dados gravados. Consulta apenas o esquema e
+    a existência de linhas, sem ler os dados.
+    """
+    with engine.connect() as connection:
+        inspector = inspect(connection)
+        if not inspector.has_table('producao'):
+            return False
+        colunas_existentes = {col['name']: str(col['type']).upper() for col in inspector.get_columns('producao')}
+        if any(colunas_existentes.get(coluna) != tipo for coluna, tipo in TIPOS_PRODUCAO.items()):
+            return True
+        if 'uq_producao_chave_natural' not in {indice['name'] for indice in inspector.get_indexes('producao')}:
+            return True
+        if connection.execute(text("""
+            SELECT EXISTS (
+                SELECT 1 FROM producao
+                WHERE "Especialidade_Normalizada" IS NULL OR "Mes_Num" IS NULL OR "Especialidade_Id" IS NULL
+                   OR UPPER(TRIM("Especialidade")) = 'TOTAL' OR "Mes_Producao" = 'N/A' OR "Ano_Producao" = 'N/A'
+            )
+        """)).scalar():
+            return True
+        if not inspector.has_table('producao_cubo'):
+            return True
+        return bool(connection.execute(text(
+            "SELECT EXISTS (SELECT 1 FROM producao) AND NOT EXISTS (SELECT 1 FROM producao_cubo)"
+        )).scalar())
+
+def backfill_producao(engine):
+    """
+    Migra a tabela 'producao' para o esquema tipado, se necessário, e preenche as colunas derivadas
+    das linhas já existentes (inclusive a chave 'Especialidade_Id'), removendo as linhas de total
+    gravadas pelo leitor antigo. Também cria os índices (chave natural e filtros das páginas) e reconstrói o catálogo das dimensões, o cubo de produção e os custos mensais.
+    Retorna a quantidade de linhas atualizadas.
+    """
+    regras = carregar_regras(engine)
+    with engine.begin() as connection:
+        garantir_tabela_producao(connection)
+        # Linhas de total gravadas pelo leitor antigo (skiprows=6) não são uma especialidade: removidas
+        # antes de refazer as tabelas derivadas, para não somarem em dobro nos resumos
+        connection.execute(text("""DELETE FROM producao WHERE UPPER(TRIM("Especialidade")) = 'TOTAL'"""))
+        # Período 'N/A' gravado antes de os períodos não reconhecidos ficarem nulos (fora da chave natural)
+        connection.execute(text(SQL_PERIODO_NAO_RECONHECIDO_NULO))
+        df = pd.read_sql(text("""
+            SELECT rowid AS id, "Especialidade", "Mes_Producao", "Ano_Producao"
+            FROM producao
+            WHERE "Especialidade_Normalizada" IS NULL OR "Mes_Num" IS NULL
+        """), connection)
+        if not df.empty:
+            df = adicionar_colunas_derivadas(df, regras)
+            registros = [
+                {"id": int(row.id), "especialidade": row.Especialidade_Normalizada,
+                 "mes": int(row.Mes_Num), "ano": None if pd.isna(row.Ano_Num) else int(row.Ano_Num)}
+                for row in df.itertuples(index=False)
+            ]
+            connection.execute(text("""
+                UPDATE producao
+                SET "Especialidade_Normalizada" = :especialidade, "Mes_Num" = :mes, "Ano_Num" = :ano
+                WHERE rowid = :id
+            """), registros)
+        reconstruir_catalogo(connection) # Inclui a sincronização da 'dim_especialidade'
+        reconstruir_cubo(connection)
+        reconstruir_custos(connection, regras)
+        incrementar_versao(connection, 'producao')
+    return len(df)
 
 # --- Funções de Gerenciamento de Usuários (com criptografia bcrypt) ---
 
@@ -108,7 +249,8 @@ def add_user(username, password, engine, is_initial_setup=False):
             return False
 
     # Gera o hash da senha
-    hashed_password = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+    with medir("bcrypt (hash da senha)"):
+        hashed_password = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
 
     # Insere o novo usuário no banco de dados
     with engine.connect() as connection:
@@ -131,7 +273,8 @@ def update_user_password(username, new_password, engine):
     """
     Atualiza a senha de um usuário existente no banco de dados.
     """
-    hashed_password = bcrypt.hashpw(new_password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+    with medir("bcrypt (hash da senha)"):
+        hashed_password = bcrypt.hashpw(new_password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
     with engine.connect() as connection:
         connection.execute(text("UPDATE usuarios SET password_hash = :password_hash WHERE username = :username"),
                            {"password_hash": hashed_password, "username": username})
@@ -151,11 +294,13 @@ def authenticate(username, password, engine):
     """
     Função para autenticar o usuário verificando o hash da senha no banco de dados.
     """
-    with engine.connect() as connection:
+    with medir("leitura SQL (usuário)"), engine.connect() as connection:
         result = connection.execute(text("SELECT password_hash FROM usuarios WHERE username = :username"), {"username": username}).fetchone()
     if result:
         stored_password_hash = result[0].encode('utf-8')
-        if bcrypt.checkpw(password.encode('utf-8'), stored_password_hash):
+        with medir("bcrypt (verificação da senha)"):
+            senha_correta = bcrypt.checkpw(password.encode('utf-8'), stored_password_hash)
+        if senha_correta:
             return True
     return False
 
@@ -180,95 +325,462 @@ def load_geojson(path):
         return None
 
 
-def process_siresp_upload(uploaded_file_producao, engine):
+# --- Registro de Ingestões (ingest_log) ---
+# Cada arquivo gravado com sucesso fica registrado com o SHA-256 do conteúdo, o tipo, o período
+# detectado, as linhas lidas e gravadas e os tempos de leitura e de gravação. O registro é feito
+# na mesma transação dos dados, então um arquivo só consta no registro se os dados foram gravados.
+# Um arquivo cujo hash já está registrado é reconhecido antes da leitura e não é processado de novo.
+# Para o CDR, que substitui a tabela inteira, só conta a ingestão mais recente: reenviar um arquivo
+# antigo depois de outro mais novo é uma troca legítima dos dados. Para o SIRESP vale o mesmo por
+# período: reenviar a versão original de um mês depois de uma corrigida volta o mês aos valores originais.
+
+TIPOS_SUBSTITUICAO = ('cdr',) # Tipos cuja ingestão substitui todos os dados anteriores
+TIPOS_SUBSTITUICAO_PERIODO = ('siresp',) # Tipos cuja ingestão substitui os dados do mesmo período
+
+SQL_TABELA_INGEST_LOG = """
+    CREATE TABLE IF NOT EXISTS ingest_log (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        sha256 TEXT NOT NULL,
+        tipo TEXT NOT NULL,
+        nome_arquivo TEXT,
+        periodo TEXT,
+        tamanho_bytes INTEGER,
+        linhas_lidas INTEGER,
+        linhas_gravadas INTEGER,
+        segundos_leitura REAL,
+        segundos_gravacao REAL,
+        registrado_em TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+"""
+
+def create_ingest_log_table(engine):
     """
-    Processa o arquivo de upload de dados de produção (SIRESP) e salva no banco de dados.
-    Suporta arquivos .xlsx, .xls e .csv.
+    Cria a tabela 'ingest_log' no banco de dados se ela não existir.
+    """
+    with engine.connect() as connection:
+        _criar_tabela_ingest_log(connection)
+        connection.commit()
+
+def _criar_tabela_ingest_log(connection):
+    connection.execute(text(SQL_TABELA_INGEST_LOG))
+    connection.execute(text("CREATE INDEX IF NOT EXISTS idx_ingest_log_hash ON ingest_log (tipo, sha256)"))
+
+def hash_arquivo(arquivo, tamanho_bloco=1 << 20):
+    """
+    Calcula o SHA-256 de um caminho ou objeto de arquivo, em blocos. O objeto volta ao início.
+    Retorna (hash, tamanho em bytes).
     """
+    sha256 = hashlib.sha256()
+    tamanho = 0
+    fonte = open(arquivo, 'rb') if isinstance(arquivo, (str, os.PathLike)) else arquivo
     try:
-        file_extension = os.path.splitext(uploaded_file_producao.name)[1].lower()
+        fonte.seek(0)
+        for bloco in iter(lambda: fonte.read(tamanho_bloco), b''):
+            sha256.update(bloco)
+            tamanho += len(bloco)
+    finally:
+        if fonte is not arquivo:
+            fonte.close()
+        else:
+            arquivo.seek(0)
+    return sha256.hexdigest(), tamanho
+
+def ingestao_registrada(connection, tipo, sha256):
+    """
+    Retorna o registro (dicionário) de uma ingestão anterior do mesmo conteúdo, ou None.
+    Para os tipos de TIPOS_SUBSTITUICAO, considera apenas a ingestão mais recente do tipo; para os de
+    TIPOS_SUBSTITUICAO_PERIODO, apenas a mais recente do mesmo período (o período registrado para o
+    conteúdo). Ingestões sem período reconhecido acrescentam linhas e continuam reconhecidas pelo hash.
+    """
+    if not inspect(connection).has_table('ingest_log'):
+        return None
+    if tipo in TIPOS_SUBSTITUICAO:
+        registro = connection.execute(text(
+            "SELECT * FROM ingest_log WHERE tipo = :tipo ORDER BY id DESC LIMIT 1"
+        ), {"tipo": tipo}).mappings().first()
+        return dict(registro) if registro and registro['sha256'] == sha256 else None
+    registro = connection.execute(text(
+        "SELECT * FROM ingest_log WHERE tipo = :tipo AND sha256 = :sha256 ORDER BY id DESC LIMIT 1"
+    ), {"tipo": tipo, "sha256": sha256}).mappings().first()
+    if registro and tipo in TIPOS_SUBSTITUICAO_PERIODO and registro['periodo'] is not None:
+        mais_recente = connection.execute(text(
+            "SELECT MAX(id) FROM ingest_log WHERE tipo = :tipo AND periodo = :periodo"
+        ), {"tipo": tipo, "periodo": registro['periodo']}).scalar()
+        if mais_recente != registro['id']:
+            return None
+    return dict(registro) if registro else None
+
+def registrar_ingestao(connection, tipo, sha256, nome_arquivo, tamanho_bytes, linhas_lidas, linhas_gravadas,
+                       segundos_leitura, segundos_gravacao, periodo=None):
+    """
+    Grava a ingestão de um arquivo no 'ingest_log', na transação da conexão informada.
+    """
+    _criar_tabela_ingest_log(connection)
+    connection.execute(text("""
+        INSERT INTO ingest_log (sha256, tipo, nome_arquivo, periodo, tamanho_bytes, linhas_lidas,
+                                linhas_gravadas, segundos_leitura, segundos_gravacao)
+        VALUES (:sha256, :tipo, :nome_arquivo, :periodo, :tamanho_bytes, :linhas_lidas,
+                :linhas_gravadas, :segundos_leitura, :segundos_gravacao)
+    """), {"sha256": sha256, "tipo": tipo, "nome_arquivo": nome_arquivo, "periodo": periodo,
+           "tamanho_bytes": tamanho_bytes, "linhas_lidas": linhas_lidas, "linhas_gravadas": linhas_gravadas,
+           "segundos_leitura": round(segundos_leitura, 6), "segundos_gravacao": round(segundos_gravacao, 6)})
+
+def periodo_producao(mes_producao, ano_producao):
+    """
+    Converte o mês por extenso e o ano de uma planilha do SIRESP em 'AAAA-MM' (None se não reconhecidos).
+    """
+    mes = str(mes_producao).lower()
+    if mes not in meses_ordem or not str(ano_producao).isdigit():
+        return None
+    return f"{ano_producao}-{meses_ordem.index(mes) + 1:02d}"
+
+def historico_ingestoes(engine, tipo=None):
+    """
+    Retorna o 'ingest_log' como DataFrame, do mais recente ao mais antigo, com a vazão
+    (linhas gravadas por segundo de leitura + gravação) de cada arquivo.
+    """
+    with engine.connect() as connection:
+        if not inspect(connection).has_table('ingest_log'):
+            return pd.DataFrame()
+        sql = "SELECT * FROM ingest_log" + (" WHERE tipo = :tipo" if tipo else "") + " ORDER BY id DESC"
+        df = pd.read_sql(text(sql), connection, params={"tipo": tipo} if tipo else None)
+    segundos = (df['segundos_leitura'] + df['segundos_gravacao']).where(lambda s: s > 0)
+    df['linhas_por_segundo'] = (df['linhas_gravadas'] / segundos).round(1)
+    return df
+
+# --- Resultado das Ingestões ---
+# As funções ingerir_* não chamam o Streamlit: devolvem um ResultadoIngestao, que a página exibe
+# com exibir_resultado_ingestao. Assim elas podem rodar no worker em segundo plano (tarefas.py).
+
+@dataclass
+class ResultadoIngestao:
+    """
+    Resultado de uma ingestão: mensagem principal, avisos, erros de validação e prévia dos dados.
+    """
+    tipo: str # 'siresp', 'contratos' ou 'cdr'
+    nome_arquivo: str
+    sucesso: bool = False
+    ignorado: bool = False # Conteúdo já registrado no 'ingest_log'; nada foi gravado
+    mensagem: str = ""
+    linhas: int = 0
+    informacoes: list = field(default_factory=list)
+    avisos: list = field(default_factory=list)
+    erros: list = field(default_factory=list)
+    titulo_previa: str = ""
+    previa: pd.DataFrame = None
+    detalhes_erro: str = None # Traceback completo, para depuração
+
+    def registrar_excecao(self, contexto, excecao):
+        self.sucesso = False
+        self.mensagem = f"{contexto}: {excecao}"
+        self.detalhes_erro = traceback.format_exc()
+
+    def registrar_ignorado(self, registro):
+        self.sucesso = True
+        self.ignorado = True
+        self.linhas = registro['linhas_gravadas'] or 0
+        self.mensagem = (f"Este arquivo já foi ingerido em {registro['registrado_em']} "
+                         f"({self.linhas} linhas, registrado como '{registro['nome_arquivo']}'). Nada foi gravado.")
+
+def _verificar_registro(engine, tipo, sha256, resultado):
+    """
+    Marca o resultado como ignorado se o conteúdo já consta no 'ingest_log'. Retorna True nesse caso.
+    """
+    with engine.connect() as connection:
+        registro = ingestao_registrada(connection, tipo, sha256)
+    if registro:
+        resultado.registrar_ignorado(registro)
+    return registro is not None
+
+def _sem_progresso(fracao, etapa):
+    pass
+
+def exibir_resultado_ingestao(resultado):
+    """
+    Exibe na página um ResultadoIngestao (mensagens, erros, prévia dos dados e traceback).
+    """
+    for informacao in resultado.informacoes:
+        st.info(informacao)
+    for aviso in resultado.avisos:
+        st.warning(aviso)
+    if resultado.ignorado:
+        st.info(f"ℹ️ {resultado.mensagem}")
+    elif resultado.sucesso:
+        st.success(f"✅ {resultado.mensagem}")
+    else:
+        st.error(f"❌ {resultado.mensagem}")
+        for erro in resultado.erros:
+            st.write(f"- {erro}")
+    if resultado.titulo_previa:
+        st.subheader(resultado.titulo_previa)
+    if resultado.previa is not None:
+        st.dataframe(resultado.previa)
+    if resultado.detalhes_erro:
+        st.code(resultado.detalhes_erro) # Exibe o traceback completo para depuração
+
+# --- Leitura e Gravação dos Dados de Produção (SIRESP) ---
+# Funções sem chamadas ao Streamlit, compartilhadas entre a página de Uploads e a ingestão em lote
+# (ingestao_lote.py). Os avisos são devolvidos como texto para quem chamou decidir como exibi-los.
+
+def extrair_periodo_do_nome(nome_arquivo):
+    """
+    Extrai mês e ano de nomes no padrão 'AAAA_mes' (ex.: '2024_marco.xlsx' -> ('Março', '2024')).
+    Retorna (None, None) se o nome não seguir o padrão.
+    """
+    base = os.path.splitext(os.path.basename(nome_arquivo))[0]
+    match = re.match(r'^(\d{4})_([^\W\d_]+)$', base)
+    if not match:
+        return None, None
+    meses_sem_acento = {_remover_acentos(mes): mes for mes in meses_ordem}
+    mes = meses_sem_acento.get(_remover_acentos(match.group(2).lower()))
+    if mes is None:
+        return None, None
+    return mes.capitalize(), match.group(1)
 
-        df = None
+def _remover_acentos(texto):
+    return unicodedata.normalize('NFKD', texto).encode('ascii', 'ignore').decode('ascii')
+
+def _ler_linhas_siresp(linhas):
+    """
+    Percorre as linhas (tuplas de valores) de uma planilha do SIRESP: extrai as células A3 e F3 e
+    as colunas abaixo do cabeçalho 'Especialidade', até a linha 'Total'.
+    Retorna (tipo_consulta_cell, data_producao_cell, especialidades, ofertas, agendados, realizados).
+    """
+    tipo_consulta_cell = None
+    data_producao_cell = None
+    especialidades, ofertas, agendados, realizados = [], [], [], []
+    cabecalho_encontrado = False
+
+    for numero_linha, row in enumerate(linhas, start=1):
+        if numero_linha == 3: # Linha dos metadados (células A3 e F3)
+            tipo_consulta_cell = row[0] if len(row) > 0 else None
+            data_producao_cell = row[5] if len(row) > 5 else None
+            continue
+
+        primeira_celula = str(row[0]).strip() if row and row[0] is not None else ''
+        if not cabecalho_encontrado:
+            cabecalho_encontrado = primeira_celula.lower() == 'especialidade'
+            continue
+        if primeira_celula.lower() == 'total':
+            break
+        if len(row) < 4 or not primeira_celula or row[1] is None:
+            continue # Linhas em branco ou sem Oferta
+        especialidades.append(primeira_celula)
+        ofertas.append(row[1])
+        agendados.append(row[2])
+        realizados.append(row[3])
+
+    if not cabecalho_encontrado:
+        raise ValueError("Cabeçalho 'Especialidade' não encontrado na planilha.")
+    return tipo_consulta_cell, data_producao_cell, especialidades, ofertas, agendados, realizados
+
+def ler_planilha_siresp(arquivo, nome_arquivo):
+    """
+    Lê uma planilha de produção do SIRESP (.xlsx ou .xls) a partir de um caminho ou objeto de arquivo.
+    Os arquivos .xlsx são lidos em uma única passagem no modo somente leitura do openpyxl; os .xls são
+    lidos sem cabeçalho pelo pandas. Nos dois casos o Tipo de Consulta (A3) e o período (F3) são
+    extraídos no caminho, e as linhas abaixo do cabeçalho 'Especialidade' vão direto para colunas
+    tipadas até a linha 'Total'. Se F3 estiver vazia, usa o nome do arquivo no padrão 'AAAA_mes'.
+    Retorna (df, tipo_consulta, mes_producao, ano_producao, avisos).
+    """
+    file_extension = os.path.splitext(nome_arquivo)[1].lower()
+    tipo_consulta = "N/A"
+    mes_producao = None # Período não reconhecido (ver preparar_producao)
+    ano_producao = None
+    avisos = []
+
+    if file_extension == ".xlsx":
+        wb = openpyxl.load_workbook(arquivo, read_only=True, data_only=True)
+        try:
+            celulas = _ler_linhas_siresp(wb.active.iter_rows(values_only=True))
+        finally:
+            wb.close()
+    elif file_extension == ".xls":
+        bruto = pd.read_excel(arquivo, header=None, dtype=object)
+        bruto = bruto.where(bruto.notna(), None) # Células vazias como None, igual ao openpyxl
+        celulas = _ler_linhas_siresp(bruto.itertuples(index=False, name=None))
+    else:
+        raise ValueError(f"Formato de arquivo não suportado para planilha SIRESP: {file_extension}")
+    tipo_consulta_cell, data_producao_cell, especialidades, ofertas, agendados, realizados = celulas
+
+    if tipo_consulta_cell:
+        tipo_consulta = str(tipo_consulta_cell)
+    else:
+        avisos.append("Célula A3 (Tipo de Consulta) vazia. Definindo como 'N/A'.")
+
+    if data_producao_cell and "de" in str(data_producao_cell):
+        mes_producao_str, ano_producao_str = map(str.strip, str(data_producao_cell).split('de'))
+        mes_producao = mes_producao_str.capitalize()
+        ano_producao = ano_producao_str
+    else:
+        mes_nome, ano_nome = extrair_periodo_do_nome(nome_arquivo)
+        if mes_nome:
+            mes_producao, ano_producao = mes_nome, ano_nome
+            avisos.append(f"Célula F3 vazia ou não reconhecida. Período obtido do nome do arquivo: {mes_producao} de {ano_producao}.")
+        else:
+            avisos.append(f"Formato de data em F3 '{data_producao_cell}' não reconhecido ou vazio. Mês e Ano de Produção ficarão em branco.")
+
+    df = pd.DataFrame({
+        'Especialidade': especialidades,
+        'Oferta': pd.to_numeric(pd.Series(ofertas, dtype=object), errors='coerce').astype('Int64'),
+        'Agendados': pd.to_numeric(pd.Series(agendados, dtype=object), errors='coerce').astype('Int64'),
+        'Realizados': pd.to_numeric(pd.Series(realizados, dtype=object), errors='coerce').astype('Int64')
+    })
+    return df, tipo_consulta, mes_producao, ano_producao, avisos
+
+# Aviso das planilhas sem período reconhecido (gravadas com Mês e Ano em branco)
+AVISO_PERIODO_NAO_RECONHECIDO = ("Mês e Ano de Produção não reconhecidos: as linhas foram acrescentadas com o período em branco "
+                                 "e não substituem dados de outros envios. Reenviar o mesmo conteúdo com outro nome as duplicará.")
+
+def preparar_producao(df, tipo_consulta, mes_producao, ano_producao):
+    """
+    Remove as linhas inválidas (ex: somas 'Total') e adiciona as colunas de metadados do arquivo.
+    Um período não reconhecido é gravado como nulo (Mês e Ano em branco): como o SQLite não
+    considera nulos iguais no índice único, essas linhas ficam fora da chave natural e são
+    acrescentadas, em vez de substituírem as de outro arquivo também sem período.
+    """
+    if periodo_producao(mes_producao, ano_producao) is None:
+        mes_producao, ano_producao = None, None
+    df = df[df['Oferta'].notna()]
+    df = df[df['Especialidade'].astype(str).str.strip().str.lower() != 'total'].copy()
+    df['Tipo_Consulta'] = tipo_consulta
+    df['Mes_Producao'] = mes_producao
+    df['Ano_Producao'] = ano_producao
+    return df
+
+def gravar_producao(connection, df, regras):
+    """
+    Calcula as colunas derivadas, grava as linhas em 'producao', atualiza o cubo de produção, o
+    catálogo das dimensões e os custos mensais das especialidades afetadas e incrementa a versão dos dados, tudo na transação da conexão informada.
+    A gravação é um upsert pela chave natural (Tipo_Consulta, Ano, Mês, Especialidade): reenviar
+    um mês substitui os valores já gravados em vez de duplicá-los. Linhas sem período reconhecido
+    (Mês e Ano nulos) são sempre acrescentadas.
+    Retorna o DataFrame gravado.
+    """
+    with medir("SIRESP: normalização das especialidades"):
+        df = adicionar_colunas_derivadas(df, regras)
+    garantir_tabela_producao(connection)
+    df['Especialidade_Id'] = ids_especialidade(connection, df)
+
+    colunas = ", ".join(f'"{coluna}"' for coluna in COLUNAS_PRODUCAO)
+    parametros = ", ".join(f":p{i}" for i in range(len(COLUNAS_PRODUCAO)))
+    atualizacoes = ", ".join(f'"{coluna}" = excluded."{coluna}"' for coluna in COLUNAS_PRODUCAO if coluna not in CHAVE_NATURAL_PRODUCAO)
+    chave = ", ".join(f'"{coluna}"' for coluna in CHAVE_NATURAL_PRODUCAO)
+    valores = df[COLUNAS_PRODUCAO].astype(object).where(df[COLUNAS_PRODUCAO].notna(), None)
+    registros = [{f"p{i}": valor for i, valor in enumerate(linha)} for linha in valores.itertuples(index=False, name=None)]
+    if registros:
+        with medir("SIRESP: gravação SQL"):
+            connection.execute(text(f"""
+                INSERT INTO producao ({colunas}) VALUES ({parametros})
+                ON CONFLICT({chave}) DO UPDATE SET {atualizacoes}
+            """), registros)
+
+    with medir("SIRESP: atualização do cubo e do catálogo"):
+        especialidades = atualizar_cubo(connection, df[['Ano_Num', 'Mes_Num', 'Tipo_Consulta']].drop_duplicates().itertuples(index=False, name=None))
+        atualizar_catalogo(connection, df)
+    with medir("SIRESP: atualização dos custos mensais"):
+        atualizar_custos(connection, regras, especialidades)
+    incrementar_versao(connection, 'producao')
+    return df
+
+def ingerir_siresp(arquivo, nome_arquivo, engine, progresso=None):
+    """
+    Lê e grava um arquivo de produção (SIRESP) .xlsx, .xls ou .csv, sem chamadas ao Streamlit.
+    'progresso', se informado, recebe (fração concluída, etapa). Retorna um ResultadoIngestao.
+    """
+    progresso = progresso or _sem_progresso
+    resultado = ResultadoIngestao('siresp', nome_arquivo)
+    try:
+        sha256, tamanho = hash_arquivo(arquivo)
+        if _verificar_registro(engine, 'siresp', sha256, resultado):
+            return resultado
+
+        file_extension = os.path.splitext(nome_arquivo)[1].lower()
         tipo_consulta = "N/A"
-        mes_producao = "N/A"
-        ano_producao = "N/A"
+        mes_producao = None
+        ano_producao = None
 
+        progresso(0.1, "Lendo o arquivo")
+        inicio = time.perf_counter()
         if file_extension in [".xlsx", ".xls"]:
-            # Tenta extrair metadados para arquivos .xlsx usando openpyxl
-            if file_extension == ".xlsx":
-                wb = openpyxl.load_workbook(BytesIO(uploaded_file_producao.read()), data_only=True)
-                ws = wb.active
-                tipo_consulta_cell = ws['A3'].value
-                data_producao_cell = ws['F3'].value
-
-                if tipo_consulta_cell:
-                    tipo_consulta = str(tipo_consulta_cell)
-                else:
-                    st.warning("Célula A3 (Tipo de Consulta) vazia. Definindo como 'N/A'.")
-
-                if data_producao_cell and "de" in str(data_producao_cell):
-                    mes_producao_str, ano_producao_str = map(str.strip, str(data_producao_cell).split('de'))
-                    mes_producao = mes_producao_str.capitalize()
-                    ano_producao = ano_producao_str
-                else:
-                    st.warning(f"Formato de data em F3 '{data_producao_cell}' não reconhecido ou vazio. Mês e Ano de Produção serão 'N/A'.")
-
-                uploaded_file_producao.seek(0) # Reseta o ponteiro após a leitura com openpyxl
-            else: # Arquivo .xls
-                st.info("Para arquivos .xls, a extração automática de 'Tipo de Consulta', 'Mês' e 'Ano' das células A3 e F3 não é suportada diretamente pelo método atual. Eles serão definidos como 'N/A'.")
-
-            # Lê o dataframe para .xlsx e .xls
-            df = pd.read_excel(uploaded_file_producao, skiprows=6)
-            df = df.iloc[:, :4]
-            df.columns = ['Especialidade', 'Oferta', 'Agendados', 'Realizados']
+            df, tipo_consulta, mes_producao, ano_producao, avisos = ler_planilha_siresp(arquivo, nome_arquivo)
+            resultado.avisos.extend(avisos)
 
         elif file_extension == ".csv":
-            st.info("Para arquivos .csv, a extração automática de 'Tipo de Consulta', 'Mês' e 'Ano' das células A3 e F3 não é aplicável. Eles serão definidos como 'N/A'. Certifique-se de que o CSV contém as colunas 'Especialidade', 'Oferta', 'Agendados' e 'Realizados' no cabeçalho.")
-            df = pd.read_csv(uploaded_file_producao)
+            resultado.informacoes.append("Para arquivos .csv, a extração automática de 'Tipo de Consulta', 'Mês' e 'Ano' das células A3 e F3 não é aplicável. O Tipo de Consulta será 'N/A' e o Mês e o Ano ficarão em branco. Certifique-se de que o CSV contém as colunas 'Especialidade', 'Oferta', 'Agendados' e 'Realizados' no cabeçalho.")
+            df = pd.read_csv(arquivo)
             # Para CSV, precisamos garantir que as colunas esperadas existam.
             expected_csv_cols = ['Especialidade', 'Oferta', 'Agendados', 'Realizados']
             if not all(col in df.columns for col in expected_csv_cols):
-                st.error(f"❌ Erro: O arquivo CSV não contém as colunas esperadas: {', '.join(expected_csv_cols)}. Por favor, verifique o cabeçalho.")
-                return # Retorna para parar a execução da função
+                resultado.mensagem = f"Erro: O arquivo CSV não contém as colunas esperadas: {', '.join(expected_csv_cols)}. Por favor, verifique o cabeçalho."
+                return resultado
             df = df[expected_csv_cols].copy() # Seleciona e reordena as colunas
 
         else:
-            st.error("❌ Formato de arquivo não suportado. Por favor, faça o upload de um arquivo .xlsx, .xls ou .csv.")
-            return # Retorna para parar a execução da função
+            resultado.mensagem = "Formato de arquivo não suportado. Por favor, faça o upload de um arquivo .xlsx, .xls ou .csv."
+            return resultado
 
         # Processamento comum para todos os tipos de arquivo
-        if df is not None:
-            # Remove linhas inválidas (ex: somas 'Total')
-            df = df[df['Oferta'].notna()]
-            df = df[df['Oferta'].astype(str).str.lower() != 'total']
+        linhas_lidas = len(df)
+        df = preparar_producao(df, tipo_consulta, mes_producao, ano_producao)
+        if periodo_producao(mes_producao, ano_producao) is None:
+            resultado.avisos.append(AVISO_PERIODO_NAO_RECONHECIDO)
+        regras = carregar_regras(engine)
+        segundos_leitura = time.perf_counter() - inicio
+        registrar_medicao("SIRESP: leitura do arquivo", segundos_leitura)
 
-            # Adiciona colunas auxiliares com metadados extraídos/padrão
-            df['Tipo_Consulta'] = tipo_consulta
-            df['Mes_Producao'] = mes_producao
-            df['Ano_Producao'] = ano_producao
+        # Salva no banco de dados, atualiza o cubo de produção, incrementa a versão e registra o
+        # arquivo no 'ingest_log' na mesma transação, invalidando os dados de produção em cache nas páginas
+        progresso(0.5, "Gravando no banco de dados")
+        inicio = time.perf_counter()
+        with engine.begin() as connection:
+            df = gravar_producao(connection, df, regras)
+            registrar_ingestao(connection, 'siresp', sha256, nome_arquivo, tamanho, linhas_lidas, len(df),
+                               segundos_leitura, time.perf_counter() - inicio,
+                               periodo_producao(mes_producao, ano_producao))
 
-            # Salva no banco de dados
-            df.to_sql('producao', con=engine, if_exists='append', index=False)
-
-            st.success("✅ Dados de produção inseridos com sucesso!")
-            st.subheader("📄 Visualização dos Dados de Produção Inseridos")
-            st.dataframe(df)
+        resultado.sucesso = True
+        resultado.linhas = len(df)
+        resultado.mensagem = "Dados de produção inseridos com sucesso!"
+        resultado.titulo_previa = "📄 Visualização dos Dados de Produção Inseridos"
+        resultado.previa = df
 
     except Exception as e:
-        st.error(f"❌ Erro ao processar o arquivo de produção: {e}")
-        st.exception(e) # Exibe o traceback completo para depuração
+        resultado.registrar_excecao("Erro ao processar o arquivo de produção", e)
+    progresso(1.0, "Concluído")
+    return resultado
 
-def process_contratos_upload(uploaded_file_contratos, engine):
+def process_siresp_upload(uploaded_file_producao, engine):
+    """
+    Processa o arquivo de upload de dados de produção (SIRESP) e exibe o resultado na página.
+    Suporta arquivos .xlsx, .xls e .csv.
     """
-    Processa o arquivo de upload de dados de custos médicos (contratos) e salva no banco de dados.
+    exibir_resultado_ingestao(ingerir_siresp(uploaded_file_producao, uploaded_file_producao.name, engine))
+
+# Colunas da planilha de contratos gravadas com outro nome na tabela 'contratos'
+COLUNAS_TABELA_CONTRATOS = {'Serviço': 'Servico', 'Valor Unitário': 'Valor Unitario', 'Responsável': 'Responsavel'}
+
+def ingerir_contratos(arquivo, nome_arquivo, engine, progresso=None):
     """
+    Valida e grava a planilha de custos médicos (contratos), sem chamadas ao Streamlit.
+    Retorna um ResultadoIngestao.
+    """
+    progresso = progresso or _sem_progresso
+    resultado = ResultadoIngestao('contratos', nome_arquivo)
     try:
-        df_contratos = pd.read_excel(uploaded_file_contratos)
+        sha256, tamanho = hash_arquivo(arquivo)
+        if _verificar_registro(engine, 'contratos', sha256, resultado):
+            return resultado
+
+        progresso(0.1, "Lendo a planilha")
+        inicio = time.perf_counter()
+        df_contratos = pd.read_excel(arquivo)
+        linhas_lidas = len(df_contratos)
 
         # Renomeia a primeira coluna se for 'Área' para 'Especialidade'
         if df_contratos.columns[0] == 'Área':
             df_contratos.rename(columns={'Área': 'Especialidade'}, inplace=True)
-            st.info("A coluna 'Área' foi automaticamente renomeada para 'Especialidade'.")
+            resultado.informacoes.append("A coluna 'Área' foi automaticamente renomeada para 'Especialidade'.")
 
         required_columns = [
             'Especialidade', 'Serviço', 'Centro de Custo', 'Nome do Centro de Custo',
@@ -279,13 +791,13 @@ def process_contratos_upload(uploaded_file_contratos, engine):
         # 1. Valida nomes das colunas
         if not all(col in df_contratos.columns for col in required_columns):
             missing_cols = [col for col in required_columns if col not in df_contratos.columns]
-            st.error(f"❌ Erro: As seguintes colunas obrigatórias não foram encontradas na planilha: {', '.join(missing_cols)}. Certifique-se de que a primeira coluna seja 'Especialidade' ou 'Área'.")
-            return # Retorna para parar a execução da função
-
+            resultado.mensagem = f"Erro: As seguintes colunas obrigatórias não foram encontradas na planilha: {', '.join(missing_cols)}. Certifique-se de que a primeira coluna seja 'Especialidade' ou 'Área'."
+            return resultado
 
         df_contratos = df_contratos[required_columns].copy() # Mantém apenas as colunas necessárias e na ordem
 
         # 2. Validação e Conversão de Tipos
+        progresso(0.4, "Validando os dados")
         errors = []
 
         # 'Centro de Custo': numérico inteiro de 8 dígitos
@@ -311,14 +823,17 @@ def process_contratos_upload(uploaded_file_contratos, engine):
 
 
         if errors:
-            st.error("❌ Foram encontrados erros de validação na planilha:")
-            for err in errors:
-                st.write(f"- {err}")
-            st.write("Por favor, corrija a planilha e tente novamente.")
-            st.dataframe(df_contratos.head()) # Mostra as primeiras linhas para depuração
+            resultado.mensagem = "Foram encontrados erros de validação na planilha:"
+            resultado.erros = errors + ["Por favor, corrija a planilha e tente novamente."]
+            resultado.previa = df_contratos.head() # Mostra as primeiras linhas para depuração
         else:
             # Tenta criar a tabela se não existir
-            with engine.connect() as connection:
+            progresso(0.7, "Gravando no banco de dados")
+            segundos_leitura = time.perf_counter() - inicio
+            registrar_medicao("contratos: leitura e validação", segundos_leitura)
+            inicio = time.perf_counter()
+            regras = carregar_regras(engine)
+            with engine.begin() as connection:
                 connection.execute(text("""
                     CREATE TABLE IF NOT EXISTS contratos (
                         Especialidade TEXT,
@@ -333,95 +848,225 @@ def process_contratos_upload(uploaded_file_contratos, engine):
                         Detalhamento TEXT
                     )
                 """))
-                connection.commit()
 
-            # Salva no banco de dados
-            df_contratos.to_sql('contratos', con=engine, if_exists='append', index=False)
-            st.success("✅ Dados dos contratos inseridos com sucesso!")
-            st.subheader("📄 Visualização dos Dados dos Contratos Inseridos")
-            st.dataframe(df_contratos)
+                # Salva no banco de dados e registra o arquivo no 'ingest_log' na mesma transação
+                # (a tabela usa nomes sem acento em algumas colunas e guarda só a data, sem horário, em 'Data Contrato')
+                df_tabela = df_contratos.rename(columns=COLUNAS_TABELA_CONTRATOS)
+                df_tabela['Data Contrato'] = df_tabela['Data Contrato'].dt.date
+                with medir("contratos: gravação SQL"):
+                    df_tabela.to_sql('contratos', con=connection, if_exists='append', index=False)
+                # Recalcula os custos mensais das especialidades dos contratos enviados
+                with medir("contratos: atualização dos custos mensais"):
+                    atualizar_custos(connection, regras, especialidades_contratos(df_contratos, regras))
+                registrar_ingestao(connection, 'contratos', sha256, nome_arquivo, tamanho, linhas_lidas,
+                                   len(df_contratos), segundos_leitura, time.perf_counter() - inicio)
+            resultado.sucesso = True
+            resultado.linhas = len(df_contratos)
+            resultado.mensagem = "Dados dos contratos inseridos com sucesso!"
+            resultado.titulo_previa = "📄 Visualização dos Dados dos Contratos Inseridos"
+            resultado.previa = df_contratos
 
     except Exception as e:
-        st.error(f"❌ Erro ao processar o arquivo de contratos: {e}")
-        st.exception(e) # Exibe o traceback completo para depuração
+        resultado.registrar_excecao("Erro ao processar o arquivo de contratos", e)
+    progresso(1.0, "Concluído")
+    return resultado
 
-def process_cdr_upload(uploaded_file_cdr, engine):
+def process_contratos_upload(uploaded_file_contratos, engine):
+    """
+    Processa o arquivo de upload de dados de custos médicos (contratos) e exibe o resultado na página.
+    """
+    exibir_resultado_ingestao(ingerir_contratos(uploaded_file_contratos, uploaded_file_contratos.name, engine))
+
+# --- Leitura e Gravação dos Dados de CDR (CSV) ---
+# O formato (codificação e delimitador) é detectado a partir dos primeiros KB do arquivo e
+# somente as colunas desejadas são lidas, em lotes, com inserção em massa numa única transação.
+
+# Colunas descartadas explicitamente (além de todas a partir de 'Observação Status')
+COLUNAS_CDR_DESCARTADAS = [
+    'Profissional', 'Turno', 'Data Agenda', 'Horário',
+    'Filipeta', 'Ret. Filipeta', 'Aceita Teleconsulta'
+]
+TAMANHO_AMOSTRA_CSV = 64 * 1024
+TAMANHO_LOTE_CDR = 20000
+
+def detectar_formato_csv(amostra):
+    """
+    Detecta a codificação (utf-8 ou latin-1) e o delimitador de um CSV a partir de uma amostra em bytes.
+    Retorna (encoding, delimitador, texto_da_amostra).
+    """
+    try:
+        encoding = 'utf-8-sig' if amostra.startswith(b'\xef\xbb\xbf') else 'utf-8'
+        texto = amostra.decode(encoding)
+    except UnicodeDecodeError as e:
+        if e.start >= len(amostra) - 3: # A amostra cortou um caractere multibyte no final
+            texto = amostra[:e.start].decode(encoding)
+        else:
+            encoding = 'latin-1'
+            texto = amostra.decode(encoding)
+
+    # Considera apenas linhas completas da amostra
+    linhas_completas = texto[:texto.rfind('\n')] if '\n' in texto else texto
+    try:
+        delimitador = csv.Sniffer().sniff(linhas_completas, delimiters=';,\t|').delimiter
+    except csv.Error:
+        cabecalho = linhas_completas.split('\n', 1)[0]
+        delimitador = ';' if cabecalho.count(';') > cabecalho.count(',') else ','
+    return encoding, delimitador, texto
+
+def ler_cdr_em_lotes(arquivo, tamanho_lote=TAMANHO_LOTE_CDR):
+    """
+    Prepara a leitura em lotes de um CSV de CDR, já restrita às colunas mantidas no banco.
+    Retorna (lotes, avisos), onde 'lotes' é um iterador de DataFrames.
+    Levanta ValueError se o arquivo não contiver a coluna 'Município'.
+    """
+    amostra = arquivo.read(TAMANHO_AMOSTRA_CSV)
+    arquivo.seek(0)
+    encoding, delimitador, texto = detectar_formato_csv(amostra)
+    cabecalho = next(csv.reader([texto.splitlines()[0]], delimiter=delimitador))
+    avisos = []
+
+    if 'Município' not in cabecalho:
+        raise ValueError("O arquivo CSV de CDR deve conter uma coluna chamada 'Município'.")
+
+    # Mantém as colunas anteriores a 'Observação Status', exceto as descartadas explicitamente.
+    # A seleção é feita por posição, pois o cabeçalho do SIRESP repete nomes após 'Observação Status'.
+    if 'Observação Status' in cabecalho:
+        fim = cabecalho.index('Observação Status')
+    else:
+        fim = len(cabecalho)
+        avisos.append("A coluna 'Observação Status' não foi encontrada no arquivo CSV. Nenhuma coluna será removida a partir dela.")
+    for col in COLUNAS_CDR_DESCARTADAS:
+        if col not in cabecalho:
+            avisos.append(f"A coluna '{col}' não foi encontrada no arquivo CSV e será ignorada.")
+    posicoes = [i for i, col in enumerate(cabecalho[:fim]) if col not in COLUNAS_CDR_DESCARTADAS]
+
+    lotes = pd.read_csv(arquivo, encoding=encoding, sep=delimitador, usecols=posicoes,
+                        dtype=str, chunksize=tamanho_lote)
+    return (_tipar_lote_cdr(lote) for lote in lotes), avisos
+
+def _tipar_lote_cdr(lote):
+    if 'Código' in lote.columns:
+        lote['Código'] = pd.to_numeric(lote['Código'], errors='coerce').astype('Int64')
+    return lote
+
+def gravar_cdr(connection, lotes, linhas_previa=1000):
+    """
+    Substitui o conteúdo da tabela 'cdr' pelos lotes informados, na transação da conexão,
+    e incrementa a versão dos dados. Cada linha recebe o código IBGE do município ('Codigo_IBGE'),
+    resolvido pela tabela 'municipios'. O espelho colunar é regravado por quem chama, depois do commit.
+    Retorna (total de linhas, prévia com as primeiras linhas, nomes de municípios não encontrados).
+    """
+    chaves = carregar_chaves_municipios(connection)
+    connection.execute(text("DROP TABLE IF EXISTS cdr"))
+    total = 0
+    previa = None
+    nao_encontrados = set()
+    for lote in lotes:
+        lote['Codigo_IBGE'] = codigos_ibge(lote['Município'], chaves)
+        nao_encontrados.update(lote.loc[lote['Codigo_IBGE'].isna() & lote['Município'].notna(), 'Município'])
+        lote.to_sql('cdr', con=connection, if_exists='append', index=False)
+        if previa is None:
+            previa = lote.head(linhas_previa)
+        total += len(lote)
+    if previa is not None:
+        create_cdr_indices(connection)
+    incrementar_versao(connection, 'cdr')
+    return total, previa, sorted(nao_encontrados)
+
+def backfill_cdr_municipios(engine):
     """
-    Processa o arquivo de upload de dados de CDR (CSV) e salva no banco de dados.
-    Tenta ler com utf-8 e, em caso de erro, tenta com latin-1.
-    Também tenta diferentes delimitadores (vírgula e ponto e vírgula).
-    Remove colunas específicas e todas as colunas a partir de 'Observação Status'.
+    Acrescenta a coluna 'Codigo_IBGE' à tabela 'cdr' gravada antes de ela existir e a preenche
+    a partir dos nomes dos municípios. Não faz nada se a tabela não existir ou já tiver a coluna.
+    Retorna os nomes de municípios não encontrados.
     """
+    inspector = inspect(engine)
+    if not inspector.has_table('cdr') or 'Codigo_IBGE' in [col['name'] for col in inspector.get_columns('cdr')]:
+        return []
+    with engine.begin() as connection:
+        chaves = carregar_chaves_municipios(connection)
+        if not chaves: # Sem a tabela 'municipios', a coluna ficaria vazia e o backfill não rodaria de novo
+            raise RuntimeError("A tabela 'municipios' está vazia: execute create_municipios_table antes do backfill do CDR.")
+        nomes = pd.read_sql(text('SELECT DISTINCT "Município" FROM cdr WHERE "Município" IS NOT NULL'), connection)['Município']
+        codigos = codigos_ibge(nomes, chaves)
+        connection.execute(text('ALTER TABLE cdr ADD COLUMN "Codigo_IBGE" INTEGER'))
+        registros = [{"municipio": nome, "codigo": int(codigo)} for nome, codigo in zip(nomes, codigos) if not pd.isna(codigo)]
+        if registros:
+            connection.execute(text('UPDATE cdr SET "Codigo_IBGE" = :codigo WHERE "Município" = :municipio'), registros)
+        create_cdr_indices(connection)
+        incrementar_versao(connection, 'cdr')
+    atualizar_espelho(engine, 'cdr')
+    return sorted(nome for nome, codigo in zip(nomes, codigos) if pd.isna(codigo))
+
+def ingerir_cdr(arquivo, nome_arquivo, engine, progresso=None):
+    """
+    Lê e grava um arquivo de CDR (CSV), sem chamadas ao Streamlit.
+    Detecta a codificação e o delimitador pela amostra inicial do arquivo e lê apenas as colunas
+    mantidas (sem as colunas descartadas e sem as colunas a partir de 'Observação Status'), em lotes.
+    O progresso é estimado pela posição de leitura no arquivo. Retorna um ResultadoIngestao.
+    """
+    progresso = progresso or _sem_progresso
+    resultado = ResultadoIngestao('cdr', nome_arquivo)
     try:
-        file_extension = os.path.splitext(uploaded_file_cdr.name)[1].lower()
-
-        if file_extension == ".csv":
-            df_cdr = None
-
-            # Tenta ler com utf-8 e delimitador padrão (vírgula)
-            try:
-                uploaded_file_cdr.seek(0) # Garante que o ponteiro está no início
-                df_cdr = pd.read_csv(uploaded_file_cdr, encoding='utf-8')
-            except (UnicodeDecodeError, pd.errors.ParserError) as e_utf8:
-                st.warning(f"Erro ao ler CSV com UTF-8 e vírgula: {e_utf8}. Tentando com latin-1 e ponto e vírgula...")
-                uploaded_file_cdr.seek(0) # Resetar o ponteiro do arquivo
-
-                # Tenta ler com latin-1 e ponto e vírgula
-                try:
-                    df_cdr = pd.read_csv(uploaded_file_cdr, encoding='latin-1', sep=';')
-                except (UnicodeDecodeError, pd.errors.ParserError) as e_latin1:
-                    st.error(f"❌ Erro ao ler CSV com latin-1 e ponto e vírgula: {e_latin1}. "
-                             "Por favor, verifique a codificação e o delimitador do seu arquivo CSV.")
-                    return # Retorna para parar a execução da função
-
-            if df_cdr is not None:
-                # Validação: Verifica se a coluna 'Município' existe
-                if 'Município' not in df_cdr.columns:
-                    st.error("❌ Erro: O arquivo CSV de CDR deve conter uma coluna chamada 'Município'.")
+        if os.path.splitext(nome_arquivo)[1].lower() != ".csv":
+            resultado.mensagem = "Formato de arquivo não suportado. Por favor, faça o upload de um arquivo .csv para CDR."
+            return resultado
+
+        sha256, tamanho = hash_arquivo(arquivo) # Também devolve o ponteiro ao início
+        if _verificar_registro(engine, 'cdr', sha256, resultado):
+            return resultado
+
+        inicio = time.perf_counter()
+        try:
+            lotes, avisos = ler_cdr_em_lotes(arquivo)
+        except ValueError as e:
+            resultado.mensagem = f"Erro: {e}"
+            return resultado
+        resultado.avisos.extend(avisos)
+
+        segundos_leitura = time.perf_counter() - inicio
+        segundos_lotes = 0.0
+
+        def _lotes_com_progresso():
+            # Leitura e gravação se alternam lote a lote: o tempo gasto obtendo cada lote conta como leitura
+            nonlocal segundos_lotes
+            iterador = iter(lotes)
+            while True:
+                inicio_lote = time.perf_counter()
+                lote = next(iterador, None)
+                segundos_lotes += time.perf_counter() - inicio_lote
+                if lote is None:
                     return
+                yield lote
+                progresso(0.05 + 0.9 * min(arquivo.tell() / (tamanho or 1), 1.0), "Gravando os lotes no banco de dados")
 
-                # Colunas a serem removidas explicitamente
-                columns_to_drop_explicit = [
-                    'Profissional', 'Turno', 'Data Agenda', 'Horário',
-                    'Filipeta', 'Ret. Filipeta', 'Aceita Teleconsulta'
-                ]
-
-                # Remove as colunas explícitas se existirem
-                for col in columns_to_drop_explicit:
-                    if col in df_cdr.columns:
-                        df_cdr = df_cdr.drop(columns=[col])
-                    else:
-                        st.warning(f"A coluna '{col}' não foi encontrada no arquivo CSV e será ignorada.")
-
-                # Remove colunas a partir de 'Observação Status' até o fim
-                if 'Observação Status' in df_cdr.columns:
-                    obs_status_idx = df_cdr.columns.get_loc('Observação Status')
-                    columns_to_drop_from_obs = df_cdr.columns[obs_status_idx:].tolist()
-                    df_cdr = df_cdr.drop(columns=columns_to_drop_from_obs)
-                else:
-                    st.warning("A coluna 'Observação Status' não foi encontrada no arquivo CSV. Nenhuma coluna será removida a partir dela.")
-
-
-                # Tenta criar a tabela 'cdr' se não existir
-                with engine.connect() as connection:
-                    connection.execute(text("""
-                        CREATE TABLE IF NOT EXISTS cdr (
-                            Municipio TEXT,
-                            Valor REAL
-                            -- Adicione outras colunas conforme necessário do seu CSV de CDR
-                            -- As colunas devem ser definidas aqui se forem persistidas no DB
-                        )
-                    """))
-                    connection.commit()
-
-                # Salva no banco de dados
-                df_cdr.to_sql('cdr', con=engine, if_exists='replace', index=False) # 'replace' para substituir dados existentes
-                st.success("✅ Dados de CDR inseridos com sucesso!")
-                st.subheader("📄 Visualização dos Dados de CDR Inseridos (Após Tratamento)")
-                st.dataframe(df_cdr)
-        else:
-            st.error("❌ Formato de arquivo não suportado. Por favor, faça o upload de um arquivo .csv para CDR.")
+        # Substitui os dados existentes e registra o arquivo no 'ingest_log' em uma única transação
+        progresso(0.05, "Lendo o arquivo")
+        inicio = time.perf_counter()
+        with engine.begin() as connection:
+            total, previa, nao_encontrados = gravar_cdr(connection, _lotes_com_progresso())
+            registrar_ingestao(connection, 'cdr', sha256, nome_arquivo, tamanho, total, total,
+                               segundos_leitura + segundos_lotes, time.perf_counter() - inicio - segundos_lotes)
+        registrar_medicao("CDR: leitura do arquivo", segundos_leitura + segundos_lotes)
+        registrar_medicao("CDR: gravação SQL", time.perf_counter() - inicio - segundos_lotes)
+        with medir("espelho Arrow (cdr)"):
+            atualizar_espelho(engine, 'cdr')
+
+        if nao_encontrados:
+            resultado.avisos.append(f"⚠️ {len(nao_encontrados)} município(s) não encontrado(s) no GeoJSON e fora do mapa: "
+                                    + ", ".join(nao_encontrados))
+        resultado.sucesso = True
+        resultado.linhas = total
+        resultado.mensagem = f"Dados de CDR inseridos com sucesso! ({total} linhas)"
+        resultado.titulo_previa = "📄 Visualização dos Dados de CDR Inseridos (Após Tratamento)"
+        resultado.previa = previa
 
     except Exception as e:
-        st.error(f"❌ Erro ao processar o arquivo de CDR: {e}")
-        st.exception(e) # Exibe o traceback completo para depuração
+        resultado.registrar_excecao("Erro ao processar o arquivo de CDR", e)
+    progresso(1.0, "Concluído")
+    return resultado
+
+def process_cdr_upload(uploaded_file_cdr, engine):
+    """
+    Processa o arquivo de upload de dados de CDR (CSV) e exibe o resultado na página.
+    """
+    exibir_resultado_ingestao(ingerir_cdr(uploaded_file_cdr, uploaded_file_cdr.name, engine))